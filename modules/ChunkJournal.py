@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+from typing import TextIO
+
+
+class ChunkJournal:
+    """
+    A sidecar file that records which chunks of a partial download are already written.
+    The first line is a JSON header identifying the media, each following line is the index of a completed chunk.
+    """
+    _path: str
+    _fp: TextIO | None
+
+    def __init__(self, partial_file_path: str):
+        self._path = f'{partial_file_path}.journal'
+        self._fp = None
+
+    def load(self, identity: dict) -> set[int] | None:
+        """
+        This function reads the completed chunks of a previous attempt
+        :param identity: The header fields that must match to consider the journal valid for the current media
+        :return: The set of completed chunk indexes if the journal belongs to the same media, None otherwise
+        """
+        if not os.path.isfile(self._path):
+            return None
+        try:
+            with open(self._path, mode="r") as journal_fp:
+                header: dict = json.loads(journal_fp.readline())
+                if any(header.get(key) != value for key, value in identity.items()):
+                    logging.warning(f'{self._path} - Journal belongs to a different media, ignoring it')
+                    return None
+                completed: set[int] = set()
+                for line in journal_fp:
+                    # A crash can leave the last line half written
+                    if line.endswith("\n"):
+                        completed.add(int(line))
+                return completed
+        except (ValueError, OSError) as error:
+            logging.error(f'{self._path} - Unable to read journal, error:\n {error}')
+            return None
+
+    def open(self, header: dict, resume: bool) -> None:
+        """
+        This function opens the journal for writing
+        :param header: The header describing the media
+        :param resume: A control flag to append to the existing journal instead of starting a new one
+        """
+        if resume:
+            self._fp = open(self._path, mode="a")
+        else:
+            self._fp = open(self._path, mode="w")
+            self._fp.write(json.dumps(header) + "\n")
+            self._fp.flush()
+
+    def mark(self, index: int) -> None:
+        """
+        This function records a chunk as completed, it must be called after the chunk has been flushed to the file
+        :param index: The index of the chunk
+        """
+        self._fp.write(f'{index}\n')
+        self._fp.flush()
+
+    def close(self) -> None:
+        """
+        This function closes the journal keeping it on the disk
+        """
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+    def remove(self) -> None:
+        """
+        This function closes and deletes the journal
+        """
+        self.close()
+        if os.path.isfile(self._path):
+            os.remove(self._path)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from pyrogram import Client
+from pyrogram.enums import ChatType
+from pyrogram.errors import RPCError, FloodWait, ChannelPrivate, ChannelInvalid, ChannelBanned, ChatAdminRequired, \
+    ChatForbidden, ChatIdInvalid, PeerIdInvalid, UsernameNotOccupied, UsernameInvalid, UserBannedInChannel
+from pyrogram.types import Message, Chat
+
+from modules.DownloadEngine import DownloadEngine
+
+# The errors telling that an account can't read a chat at all, unlike the transient ones they are remembered.
+# KeyError and ValueError are raised by Pyrogram for the chat ids an account has never met.
+NO_ACCESS_ERRORS: tuple[type[Exception], ...] = (ChannelPrivate, ChannelInvalid, ChannelBanned, ChatAdminRequired,
+                                                 ChatForbidden, ChatIdInvalid, PeerIdInvalid, UsernameNotOccupied,
+                                                 UsernameInvalid, UserBannedInChannel, KeyError, ValueError)
+
+
+class PooledClient:
+    """
+    A Telegram account of the pool with its own download engine, so each one uses its own connections and limits
+    """
+    client: Client
+    engine: DownloadEngine
+    active: int
+    flood_until: float
+    # Chats this account can't read, they are not tried again
+    no_access: set[int]
+
+    def __init__(self, client: Client, engine: DownloadEngine):
+        self.client = client
+        self.engine = engine
+        self.active = 0
+        self.flood_until = 0
+        self.no_access = set()
+
+    def get_name(self) -> str:
+        """
+        This function returns the session name of the account
+        :return: The session name
+        """
+        return self.client.name
+
+    def is_available(self) -> bool:
+        """
+        This function checks if the account is not waiting for a FloodWait
+        :return: True if the account can download, False otherwise
+        """
+        return time.monotonic() >= self.flood_until
+
+
+class ClientPool:
+    """
+    Spreads the downloads over several accounts (bot tokens or user sessions), each one with its own rate limits.
+    A job goes to the least loaded account that can read its message, the accounts hit by a FloodWait are skipped
+    until it expires. The first client is the bot receiving the commands, it's started and stopped by the caller.
+    The message ids of private chats and groups differ between accounts, so the other accounts can only download
+    the media of channels and supergroups, including the ones forwarded to the bot.
+    """
+    _clients: list[PooledClient]
+
+    def __init__(self, clients: list[Client], engine_factory: Callable[[Client], DownloadEngine]):
+        self._clients = [PooledClient(client, engine_factory(client)) for client in clients]
+
+    async def start(self) -> None:
+        """
+        This function starts the additional accounts, the ones failing to start are left out of the pool
+        """
+        for pooled in list(self._clients[1:]):
+            try:
+                await pooled.client.start()
+                logging.info(f'Pool client {pooled.get_name()} started')
+            except Exception as e:
+                logging.error(f'Unable to start the pool client {pooled.get_name()}, error:\n {e}')
+                self._clients.remove(pooled)
+
+    async def stop(self) -> None:
+        """
+        This function closes the download engines and stops the additional accounts
+        """
+        for pooled in self._clients:
+            await pooled.engine.close()
+        for pooled in self._clients[1:]:
+            try:
+                await pooled.client.stop()
+            except Exception as e:
+                logging.warning(f'Unable to stop the pool client {pooled.get_name()}, error:\n {e}')
+
+    def get_size(self) -> int:
+        """
+        This function returns the number of accounts in the pool
+        :return: The pool size
+        """
+        return len(self._clients)
+
+    def set_max_transmissions(self, max_transmissions: int) -> None:
+        """
+        This function changes the number of Pyrogram's single stream downloads each account runs at once
+        :param max_transmissions: The maximum number of downloads
+        """
+        for pooled in self._clients:
+            pooled.client.get_file_semaphore = asyncio.Semaphore(max_transmissions)
+
+    def get_available_count(self) -> int:
+        """
+        This function returns the number of accounts not waiting for a FloodWait
+        :return: The number of available accounts
+        """
+        return sum(pooled.is_available() for pooled in self._clients)
+
+    async def acquire(self, message: Message) -> tuple[PooledClient, Message]:
+        """
+        This function picks the least loaded available account able to read a message and counts a download on it.
+        When all the accounts are waiting for a FloodWait, the one whose wait ends first is picked.
+        :param message: The media message, as seen by the bot
+        :return: A tuple with the account and the message as seen by it
+        """
+        candidates: list[PooledClient] = sorted(
+            self._clients, key=lambda p: (0, p.active) if p.is_available() else (1, p.flood_until))
+        for pooled in candidates:
+            resolved: Message | None = message if pooled is self._clients[0] else await self._resolve(pooled, message)
+            if resolved:
+                pooled.active += 1
+                return pooled, resolved
+        # Unreachable as long as the bot itself is in the pool
+        raise RuntimeError("No client of the pool can access the message")
+
+    def release(self, pooled: PooledClient) -> None:
+        """
+        This function ends a download on an account
+        :param pooled: The account returned by acquire
+        """
+        pooled.active -= 1
+
+    async def report_flood_wait(self, pooled: PooledClient, seconds: float, message: Message) -> bool:
+        """
+        This function excludes an account from the pool until its FloodWait expires
+        :param pooled: The account hit by the FloodWait
+        :param seconds: The duration of the FloodWait
+        :param message: The media message of the interrupted download, as seen by the bot
+        :return: True if another available account can download the message, False otherwise
+        """
+        pooled.flood_until = max(pooled.flood_until, time.monotonic() + seconds)
+        logging.warning(f'Pool client {pooled.get_name()} paused for {seconds} seconds by a FloodWait')
+        for other in self._clients:
+            if other is pooled or not other.is_available():
+                continue
+            if other is self._clients[0] or await self._resolve(other, message):
+                return True
+        return False
+
+    @staticmethod
+    async def _resolve(pooled: PooledClient, message: Message) -> Message | None:
+        """
+        This function fetches a message through another account, from the channel it was posted or forwarded from
+        :param pooled: The account fetching the message
+        :param message: The media message, as seen by the bot
+        :return: The message with the same media as seen by the account, None if the account can't read it
+        """
+        sources: list[tuple[Chat, int]] = []
+        if message.forward_from_chat and message.forward_from_message_id:
+            sources.append((message.forward_from_chat, message.forward_from_message_id))
+        if message.chat.type in (ChatType.CHANNEL, ChatType.SUPERGROUP):
+            sources.append((message.chat, message.id))
+        media = getattr(message, message.media.value)
+        for chat, message_id in sources:
+            if chat.id in pooled.no_access:
+                continue
+            try:
+                # The username can be resolved by any account, the id only by the ones that already met the chat
+                resolved: Message = await pooled.client.get_messages(chat.username or chat.id, message_id)
+            except NO_ACCESS_ERRORS as e:
+                logging.debug(f'Pool client {pooled.get_name()} can\'t read chat {chat.id}: {e}')
+                pooled.no_access.add(chat.id)
+                continue
+            except FloodWait as e:
+                # The account is skipped until the wait expires, the chat is tried again afterwards
+                pooled.flood_until = max(pooled.flood_until, time.monotonic() + e.value)
+                logging.warning(f'Pool client {pooled.get_name()} paused for {e.value} seconds by a FloodWait')
+                return None
+            except RPCError as e:
+                # A transient error, only this download is moved to another account
+                logging.warning(f'Pool client {pooled.get_name()} failed to read chat {chat.id}, error:\n {e}')
+                return None
+            # An empty or edited message doesn't carry the same media anymore
+            resolved_media = getattr(resolved, resolved.media.value) if resolved and resolved.media else None
+            if resolved_media and resolved_media.file_unique_id == media.file_unique_id:
+                return resolved
+        return None
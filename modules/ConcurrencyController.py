@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from asyncio import Task
+from typing import Callable
+
+from modules.WorkerPool import WorkerPool
+from modules.helpers import format_size
+
+# How often the throughput is sampled and the pool resized
+CONTROL_INTERVAL: float = 10
+# A probe is kept only if the throughput grows at least this much
+MIN_GAIN: float = 0.05
+# The pool shrinks to this fraction of its size on a FloodWait
+DECREASE_FACTOR: float = 0.5
+# Transient errors in an interval that count as congestion
+ERROR_THRESHOLD: int = 3
+# Intervals waited after a decrease or a failed probe before probing again
+HOLD_INTERVALS: int = 6
+
+
+class ConcurrencyController:
+    """
+    Tunes the size of the worker pool from the observed throughput, AIMD style: while all the workers are busy and
+    jobs are waiting, the pool grows by one worker per interval as long as the throughput grows with it. A probe that
+    doesn't pay off is rolled back, a FloodWait or a burst of transient errors halves the pool. The size always stays
+    within the configured bounds.
+    """
+    _pool: WorkerPool
+    _get_bytes: Callable[[], int]
+    _get_demand: Callable[[], int]
+    _min: int
+    _max: int
+    _limit: int
+    _last_bytes: int
+    _last_time: float
+    _last_throughput: float | None
+    _probing: bool
+    _hold: int
+    _flood_waits: int
+    _errors: int
+    _task: Task | None
+
+    def __init__(self, pool: WorkerPool, get_bytes: Callable[[], int], get_demand: Callable[[], int], minimum: int,
+                 maximum: int):
+        """
+        :param pool: The worker pool to resize
+        :param get_bytes: A function returning the total bytes downloaded so far
+        :param get_demand: A function returning the number of jobs waiting in queue
+        :param minimum: The minimum number of workers
+        :param maximum: The maximum number of workers
+        """
+        self._pool = pool
+        self._get_bytes = get_bytes
+        self._get_demand = get_demand
+        self._min = minimum
+        self._max = maximum
+        self._limit = minimum
+        self._last_bytes = 0
+        self._last_time = 0
+        self._last_throughput = None
+        self._probing = False
+        self._hold = 0
+        self._flood_waits = 0
+        self._errors = 0
+        self._task = None
+
+    def get_limit(self) -> int:
+        """
+        This function returns the current number of workers chosen by the controller
+        :return: The number of workers
+        """
+        return self._limit
+
+    def get_bounds(self) -> tuple[int, int]:
+        """
+        This function returns the bounds of the pool size
+        :return: A tuple with the minimum and maximum number of workers
+        """
+        return self._min, self._max
+
+    def set_maximum(self, maximum: int) -> None:
+        """
+        This function changes the upper bound of the pool size, shrinking the pool if needed
+        :param maximum: The maximum number of workers
+        """
+        self._max = max(self._min, maximum)
+        if self._limit > self._max:
+            self._apply(self._max, "the maximum has been lowered")
+
+    def record_flood_wait(self) -> None:
+        """
+        This function reports a FloodWait hit by a download
+        """
+        self._flood_waits += 1
+
+    def record_error(self) -> None:
+        """
+        This function reports a transient download error
+        """
+        self._errors += 1
+
+    def start(self) -> None:
+        """
+        This function starts the control loop from the minimum pool size
+        """
+        self._last_bytes = self._get_bytes()
+        self._last_time = time.monotonic()
+        self._pool.resize(self._limit)
+        self._task = asyncio.get_event_loop_policy().get_event_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        """
+        This function stops the control loop, the pool keeps its current size
+        """
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        """
+        The control loop
+        """
+        while True:
+            await asyncio.sleep(CONTROL_INTERVAL)
+            try:
+                self._step()
+            except Exception as e:
+                logging.error(f'Adaptive parallelism step failed, error:\n {e}')
+
+    def _step(self) -> None:
+        """
+        This function samples the last interval and resizes the pool
+        """
+        now: float = time.monotonic()
+        total_bytes: int = self._get_bytes()
+        throughput: float = (total_bytes - self._last_bytes) / max(now - self._last_time, 1e-6)
+        self._last_bytes, self._last_time = total_bytes, now
+        busy: int = self._pool.get_busy_count()
+        flood_waits, errors = self._flood_waits, self._errors
+        self._flood_waits = self._errors = 0
+        logging.debug(f'Adaptive parallelism: {busy}/{self._limit} busy, {format_size(throughput)}/s, '
+                      f'{format_size(throughput / max(busy, 1))}/s per download, {flood_waits} FloodWaits, '
+                      f'{errors} errors')
+        if flood_waits or errors >= ERROR_THRESHOLD:
+            self._hold = HOLD_INTERVALS
+            self._last_throughput = None
+            self._apply(max(self._min, int(self._limit * DECREASE_FACTOR)),
+                        f'{flood_waits} FloodWaits and {errors} errors')
+            return
+        if self._probing:
+            self._probing = False
+            if self._last_throughput is not None and throughput < self._last_throughput * (1 + MIN_GAIN):
+                # The last worker added didn't bring more bandwidth
+                self._hold = HOLD_INTERVALS
+                self._apply(max(self._min, self._limit - 1), f'no gain at {format_size(throughput)}/s')
+                self._last_throughput = None
+                return
+        self._last_throughput = throughput
+        if self._hold:
+            self._hold -= 1
+            return
+        # Only a saturated pool can tell if more workers help
+        if busy >= self._limit and self._get_demand() and self._limit < self._max:
+            self._probing = True
+            self._apply(self._limit + 1, f'probing at {format_size(throughput)}/s')
+
+    def _apply(self, limit: int, reason: str) -> None:
+        """
+        This function resizes the pool
+        :param limit: The new number of workers
+        :param reason: The reason logged with the change
+        """
+        if limit == self._limit:
+            return
+        logging.info(f'Adaptive parallelism: {self._limit} -> {limit} workers ({reason})')
+        self._limit = limit
+        self._pool.resize(limit)
@@ -1,18 +1,33 @@
+import asyncio
 import json
 import logging
+import os
+import tempfile
+from datetime import datetime
 from json import JSONDecodeError
 from pathlib import Path
 
-from modules.helpers import is_json
+from pyrogram.types import Message
+
+from modules.FileFinalizer import COLLISION_POLICIES
+from modules.LogManager import LOG_LEVELS, ROTATION_INTERVALS
+from modules.NodeProtocol import parse_address
+from modules.StreamSink import StreamSink
+from modules.helpers import is_json, parse_rate_schedule
 from modules.models.ConfigFile import ConfigFile
+from modules.models.RoutingRule import RoutingRule
 
 
 class ConfigManager:
     _config: ConfigFile
     _config_path: Path
+    _routing_rules: list[RoutingRule]
+    _save_lock: asyncio.Lock
 
     def __init__(self, config_path: Path):
         self._config_path = config_path
+        self._routing_rules = []
+        self._save_lock = asyncio.Lock()
 
     def load_config_from_file(self) -> ConfigFile | None:
         """
@@ -22,8 +37,10 @@ class ConfigManager:
         if self._config_path.exists() and self._config_path.is_file() and is_json(self._config_path):
             with open(self._config_path, mode="r") as config_fp:
                 try:
-                    self._config = json.load(config_fp, object_hook=ConfigFile)
+                    # The routing rules are nested objects, only the top level is a ConfigFile
+                    self._config = ConfigFile(json.load(config_fp))
                     if self.validate_config(self._config):
+                        self._routing_rules = [RoutingRule(rule) for rule in self._config.TG_ROUTING_RULES]
                         logging.info("Config file loaded successfully!")
                         return self._config
                     else:
@@ -41,6 +58,7 @@ class ConfigManager:
         """
         logging.info("Config updated successfully!")
         self._config = config
+        self._routing_rules = [RoutingRule(rule) for rule in config.TG_ROUTING_RULES]
 
     def get_config(self) -> ConfigFile:
         """
@@ -54,14 +72,41 @@ class ConfigManager:
         This function saves to the hard drive the current runtime config
         :return: True if the file is saved successfully, False otherwise
         """
-        with open(self._config_path, mode="w") as config_fp:
+        return self._write_config(json.dumps(self._config.__dict__))
+
+    async def save_config(self) -> bool:
+        """
+        This function saves the current runtime config without blocking the event loop
+        :return: True if the file is saved successfully, False otherwise
+        """
+        # The snapshot is taken now, the lock keeps an older snapshot from overwriting a newer one
+        data: str = json.dumps(self._config.__dict__)
+        async with self._save_lock:
+            return await asyncio.get_event_loop().run_in_executor(None, self._write_config, data)
+
+    def _write_config(self, data: str) -> bool:
+        """
+        This function atomically replaces the config file, a crash never leaves it truncated
+        :param data: The serialized config
+        :return: True if the file is saved successfully, False otherwise
+        """
+        directory: str = os.path.dirname(os.path.abspath(self._config_path))
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{self._config_path.name}.')
             try:
-                json.dump(self._config.__dict__, config_fp)
-                logging.info("Config file saved successfully!")
-                return True
-            except JSONDecodeError as error:
-                logging.error(f"Unable to save config file, error:\n {error.msg}")
-        return False
+                with os.fdopen(fd, mode="w") as config_fp:
+                    config_fp.write(data)
+                    config_fp.flush()
+                    os.fsync(config_fp.fileno())
+                os.replace(temp_path, self._config_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError as error:
+            logging.error(f"Unable to save config file, error:\n {error}")
+            return False
+        logging.info("Config file saved successfully!")
+        return True
 
     def validate_config(self, config: ConfigFile) -> bool:
         """
@@ -74,8 +119,116 @@ class ConfigManager:
             return False
         if not self._validate_download_path(Path(config.TG_DOWNLOAD_PATH)):
             return False
+        if config.TG_DL_CONNECTIONS < 1:
+            logging.error("The download connections must be at least 1!")
+            return False
+        if config.TG_DEDUP_MODE not in ["skip", "hardlink", "redownload"]:
+            logging.error("The dedup mode must be one of: skip, hardlink, redownload!")
+            return False
+        if config.TG_RATE_LIMIT < 0 or config.TG_RATE_LIMIT_PER_JOB < 0:
+            logging.error("The bandwidth limits can't be negative!")
+            return False
+        try:
+            parse_rate_schedule(config.TG_RATE_SCHEDULE)
+        except ValueError as error:
+            logging.error(f"The bandwidth schedule is not valid, error:\n {error}")
+            return False
+        if config.TG_PROGRESS_RATE <= 0:
+            logging.error("The progress updates rate must be greater than 0!")
+            return False
+        if not 0 <= config.TG_METRICS_PORT <= 65535:
+            logging.error("The metrics port must be between 0 and 65535!")
+            return False
+        if not config.TG_METRICS_HOST:
+            logging.error("The metrics address can't be empty!")
+            return False
+        if not 0 <= config.TG_API_PORT <= 65535:
+            logging.error("The control API port must be between 0 and 65535!")
+            return False
+        if not 1 <= config.TG_MIN_PARALLEL <= config.TG_MAX_PARALLEL:
+            logging.error("The min parallel downloads must be between 1 and the max parallel downloads!")
+            return False
+        if config.TG_POST_WORKERS < 1:
+            logging.error("The post-processing workers must be at least 1!")
+            return False
+        if config.TG_DISK_MARGIN < 0:
+            logging.error("The disk margin can't be negative!")
+            return False
+        if config.TG_COLLISION_POLICY not in COLLISION_POLICIES:
+            logging.error(f"The collision policy must be one of: {', '.join(COLLISION_POLICIES)}!")
+            return False
+        for key in ["TG_POOL_BOT_TOKENS", "TG_POOL_SESSIONS"]:
+            values = getattr(config, key)
+            if not isinstance(values, list) or not all(value and isinstance(value, str) for value in values):
+                logging.error(f"{key} must be a list of non-empty strings!")
+                return False
+        if config.TG_COORDINATOR_ADDRESS:
+            try:
+                transport, _, _ = parse_address(config.TG_COORDINATOR_ADDRESS)
+            except ValueError as error:
+                logging.error(f"The coordinator address is not valid, error:\n {error}")
+                return False
+            if transport == "tcp" and not config.TG_COORDINATOR_TOKEN:
+                logging.error("A coordinator listening on TCP needs a token!")
+                return False
+        if config.TG_STREAM_SINK:
+            try:
+                StreamSink.create(config.TG_STREAM_SINK, config.TG_S3_ENDPOINT, config.TG_S3_ACCESS_KEY,
+                                  config.TG_S3_SECRET_KEY, config.TG_S3_REGION)
+            except ValueError as error:
+                logging.error(f"The stream sink is not valid, error:\n {error}")
+                return False
+        if config.TG_LOG_LEVEL.upper() not in LOG_LEVELS:
+            logging.error(f"The log level must be one of: {', '.join(LOG_LEVELS)}!")
+            return False
+        if config.TG_LOG_MAX_SIZE < 1 or config.TG_LOG_BACKUPS < 0:
+            logging.error("The log file size must be at least 1 MB and the backups can't be negative!")
+            return False
+        if config.TG_LOG_ROTATE_WHEN and config.TG_LOG_ROTATE_WHEN.upper() not in ROTATION_INTERVALS:
+            logging.error(f"The log rotation interval must be one of: {', '.join(ROTATION_INTERVALS)}!")
+            return False
+        if not isinstance(config.TG_ROUTING_RULES, list):
+            logging.error("The routing rules must be a list!")
+            return False
+        for index, rule in enumerate(config.TG_ROUTING_RULES, start=1):
+            try:
+                if not isinstance(rule, dict):
+                    raise ValueError("A rule must be an object")
+                if not self._validate_download_path(Path(RoutingRule(rule).path)):
+                    return False
+            except (ValueError, TypeError, KeyError) as error:
+                logging.error(f"The routing rule {index} is not valid, error:\n {error}")
+                return False
         return True
 
+    def route(self, message: Message, file_name: str, user_id: int) -> str:
+        """
+        This function picks the destination of a job using the first matching routing rule
+        :param message: The media message
+        :param file_name: The file name of the job, relative to the download dir
+        :param user_id: The id of the user that requested the download
+        :return: The absolute path chosen by a rule, or the unchanged file name if no rule matches
+        """
+        for rule in self._routing_rules:
+            if not rule.match(message, file_name, user_id):
+                continue
+            media = getattr(message, message.media.value)
+            chat = message.forward_from_chat or message.chat
+            stem, ext = os.path.splitext(os.path.basename(file_name))
+            relative_path: str = rule.render({
+                "file_name": file_name, "stem": stem, "ext": ext, "media": message.media.value,
+                "mime": getattr(media, "mime_type", None) or "", "chat": chat.username or chat.id, "chat_id": chat.id,
+                "user_id": user_id, "message_id": message.id, "date": message.date or datetime.now()
+            })
+            root: str = os.path.abspath(rule.path)
+            file_path: str = os.path.abspath(os.path.join(root, relative_path))
+            # The join keeps a single separator when the rule saves in the filesystem root
+            if file_path == root or not file_path.startswith(os.path.join(root, "")):
+                logging.warning(f'{file_name} - The routed path {relative_path} leaves {rule.path}, using the name')
+                file_path = os.path.join(root, os.path.basename(file_name))
+            return file_path
+        return file_name
+
     def _validate_download_path(self, download_path: Path) -> bool:
         """
         This function checks if the provided download path exists, and it is a directory
@@ -87,27 +240,47 @@ class ConfigManager:
             return False
         return True
 
-    def change_download_path(self, download_path: str) -> bool:
+    async def change_download_path(self, download_path: str) -> bool:
         if self._validate_download_path(Path(download_path)):
             logging.info(f"Changing download path to {download_path}")
             prev: str = self._config.TG_DOWNLOAD_PATH
             self._config.TG_DOWNLOAD_PATH = download_path
-            if self.save_config_to_file():
+            if await self.save_config():
                 logging.info(f"Change success!")
                 return True
             else:
                 self._config.TG_DOWNLOAD_PATH = prev
         return False
 
-    def change_max_parallel_downloads(self, max_dl: str) -> bool:
+    async def change_max_parallel_downloads(self, max_dl: str) -> bool:
         try:
             max_int: int = int(max_dl)
+            if max_int < max(1, self._config.TG_MIN_PARALLEL):
+                logging.error("The max parallel downloads must be at least 1 and the min parallel downloads!")
+                return False
             if max_int != self._config.TG_MAX_PARALLEL:
                 logging.info(f"Changing max parallels downloads to {max_int}")
                 self._config.TG_MAX_PARALLEL = max_int
-            if self.save_config_to_file():
+            if await self.save_config():
                 logging.info(f"Change success!")
                 return True
         except Exception:
             return False
 
+    async def change_rate_limit(self, limit: str) -> bool:
+        try:
+            limit_int: int = int(limit)
+            if limit_int < 0:
+                logging.error("The bandwidth limit can't be negative!")
+                return False
+            logging.info(f"Changing bandwidth limit to {limit_int} KB/s")
+            prev: int = self._config.TG_RATE_LIMIT
+            self._config.TG_RATE_LIMIT = limit_int
+            if await self.save_config():
+                logging.info(f"Change success!")
+                return True
+            self._config.TG_RATE_LIMIT = prev
+        except ValueError:
+            pass
+        return False
+
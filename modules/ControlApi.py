@@ -0,0 +1,135 @@
+import asyncio
+import hmac
+import json
+import logging
+from asyncio import AbstractServer, StreamReader, StreamWriter
+from typing import Callable, Awaitable
+
+# Largest request body accepted, a list of some thousand job ids fits easily
+MAX_BODY_SIZE: int = 1024 * 1024
+REQUEST_TIMEOUT: float = 10
+STATUS_TEXTS: dict[int, str] = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+                                405: "Method Not Allowed"}
+
+
+class ControlApi:
+    """
+    A local HTTP/JSON API to inspect and manage the queue from scripts:
+
+    - GET /queue returns the queue state and its jobs
+    - POST /queue/pause and /queue/resume stop and restart serving the queued jobs
+    - POST /jobs/<action> applies an action (cancel, pause, resume, priority) to the jobs listed as {"ids": [...]}
+
+    When a token is set, the requests must send it as a bearer token.
+    """
+    _token: str
+    _get_queue: Callable[[], dict]
+    _job_actions: dict[str, Callable[[int], Awaitable[bool]]]
+    _queue_actions: dict[str, Callable[[], None]]
+    _server: AbstractServer | None
+
+    def __init__(self, token: str, get_queue: Callable[[], dict],
+                 job_actions: dict[str, Callable[[int], Awaitable[bool]]],
+                 queue_actions: dict[str, Callable[[], None]]):
+        """
+        :param token: The secret the requests must present, empty to accept any local request
+        :param get_queue: A function describing the queue and its jobs
+        :param job_actions: The coroutines applying each action to a job id, returning False if the job can't be found
+        or the action doesn't apply to it
+        :param queue_actions: The functions applying each action to the whole queue
+        """
+        self._token = token
+        self._get_queue = get_queue
+        self._job_actions = job_actions
+        self._queue_actions = queue_actions
+        self._server = None
+
+    async def start_server(self, port: int) -> None:
+        """
+        This function starts serving the API on http://127.0.0.1:<port>
+        :param port: The TCP port
+        """
+        self._server = await asyncio.start_server(self._handle_request, "127.0.0.1", port)
+        logging.info(f"Control API available on http://127.0.0.1:{port}")
+
+    async def stop_server(self) -> None:
+        """
+        This function stops the API server
+        """
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_request(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """
+        This function answers a single HTTP request
+        :param reader: The connection's reader
+        :param writer: The connection's writer
+        """
+        try:
+            request: tuple[str, str, dict[str, str], bytes] | None = await asyncio.wait_for(
+                self._read_request(reader), timeout=REQUEST_TIMEOUT)
+            status, body = await self._route(*request) if request else (400, {"error": "Malformed request"})
+            payload: bytes = json.dumps(body).encode()
+            writer.write(f'HTTP/1.1 {status} {STATUS_TEXTS[status]}\r\nContent-Type: application/json\r\n'
+                         f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode() + payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: StreamReader) -> tuple[str, str, dict[str, str], bytes] | None:
+        """
+        This function reads a request
+        :param reader: The connection's reader
+        :return: A tuple with the method, the path, the headers and the body, None if the request is malformed
+        """
+        request_line: list[str] = (await reader.readline()).decode(errors="replace").split()
+        headers: dict[str, str] = {}
+        while (line := (await reader.readline()).decode(errors="replace").strip()) != "":
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length: str = headers.get("content-length", "0")
+        if len(request_line) < 2 or not length.isdigit() or int(length) > MAX_BODY_SIZE:
+            return None
+        data: bytes = await reader.readexactly(int(length)) if int(length) else b""
+        return request_line[0], request_line[1].split("?")[0].rstrip("/"), headers, data
+
+    async def _route(self, method: str, path: str, headers: dict[str, str], data: bytes) -> tuple[int, dict]:
+        """
+        This function runs a request
+        :param method: The HTTP method
+        :param path: The path, without query string
+        :param headers: The headers, with lowercase names
+        :param data: The body
+        :return: A tuple with the status code and the JSON body of the response
+        """
+        if self._token and not hmac.compare_digest(headers.get("authorization", ""), f'Bearer {self._token}'):
+            return 401, {"error": "Wrong or missing token"}
+        if path == "/queue":
+            return (200, self._get_queue()) if method == "GET" else (405, {"error": "Use GET"})
+        resource, _, action = path.rpartition("/")
+        if resource == "/queue" and action in self._queue_actions:
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            self._queue_actions[action]()
+            return 200, self._get_queue()
+        if resource == "/jobs" and action in self._job_actions:
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            try:
+                ids = json.loads(data or b"{}").get("ids")
+                if not isinstance(ids, list) or not all(isinstance(job_id, int) for job_id in ids):
+                    raise ValueError()
+            except (ValueError, AttributeError):
+                return 400, {"error": 'The body must be {"ids": [job ids]}'}
+            done: list[int] = []
+            failed: list[int] = []
+            for job_id in ids:
+                (done if await self._job_actions[action](job_id) else failed).append(job_id)
+            logging.info(f'Control API: {action} applied to {len(done)}/{len(ids)} jobs')
+            return 200, {"done": done, "failed": failed}
+        return 404, {"error": "Not found"}
@@ -0,0 +1,211 @@
+import asyncio
+import hmac
+import logging
+from asyncio import AbstractServer, Future, Queue
+from typing import Callable, Awaitable
+
+from pyrogram.errors import FloodWait
+
+from modules.NodeProtocol import NodeConnection, start_server
+from modules.WorkerPool import WorkerPool
+from modules.models.Job import Job
+
+# Time given to a worker node to introduce itself
+HANDSHAKE_TIMEOUT: float = 10
+
+
+class RemoteJobError(Exception):
+    """
+    Raised when a worker node fails a job, it carries the name of the error raised on the node
+    """
+    error: str
+    retryable: bool
+
+    def __init__(self, error: str, message: str, retryable: bool):
+        super().__init__(f'{error} on the worker node: {message}')
+        self.error = error
+        self.retryable = retryable
+
+
+class RemoteNode:
+    """
+    A worker node connected to the coordinator. Each of its slots takes jobs from the shared queue, so the nodes
+    download alongside the local workers. A job is sent to the node and awaited until the node reports its outcome,
+    the progress updates are forwarded to the job's progress callback.
+    """
+    name: str
+    slots: int
+    _connection: NodeConnection
+    _pending: dict[int, tuple[Future, Callable | None, tuple]]
+    _closed: bool
+    _pool: WorkerPool
+
+    def __init__(self, name: str, slots: int, connection: NodeConnection, queue: Queue,
+                 handler: Callable[[Job, "RemoteNode"], Awaitable[None]]):
+        self.name = name
+        self.slots = slots
+        self._connection = connection
+        self._pending = {}
+        self._closed = False
+        self._pool = WorkerPool(queue, lambda job: handler(job, self))
+
+    def get_busy_count(self) -> int:
+        """
+        This function returns the number of jobs running on the node
+        :return: The number of running jobs
+        """
+        return len(self._pending)
+
+    async def run(self, job: Job, progress: Callable | None = None, progress_args: tuple = ()) -> dict:
+        """
+        This function downloads a job on the node. Cancelling it cancels the job on the node too.
+        :param job: The job to download
+        :param progress: A coroutine called as progress(current, total, *progress_args) on each update of the node
+        :param progress_args: Extra arguments passed to the progress callback
+        :return: The outcome of the job: file_path (None if dropped by the collision policy), file_size, sha256 and
+        the outcomes of the post-processing
+        :raise RemoteJobError: If the node fails the job
+        :raise ConnectionError: If the node disconnects before the end of the job
+        """
+        if self._closed:
+            raise ConnectionError(f'The worker node {self.name} is disconnected')
+        future: Future = asyncio.get_event_loop().create_future()
+        self._pending[job.id] = (future, progress, progress_args)
+        try:
+            await self._connection.send({"type": "job", "job": {
+                "id": job.id, "chat_id": job.chat_id, "message_id": job.message_id, "file_name": job.file_name,
+                "file_size": job.file_size, "user_id": job.user_id}})
+            return await future
+        except asyncio.CancelledError:
+            self._connection.send_nowait({"type": "cancel", "job_id": job.id})
+            raise
+        finally:
+            self._pending.pop(job.id, None)
+
+    async def serve(self) -> None:
+        """
+        This function processes the frames sent by the node until it disconnects
+        """
+        self._pool.resize(self.slots)
+        try:
+            while frame := await self._connection.receive():
+                pending = self._pending.get(frame.get("job_id"))
+                if not pending:
+                    continue
+                future, progress, progress_args = pending
+                if frame["type"] == "progress" and progress:
+                    await progress(frame["current"], frame["total"], *progress_args)
+                elif frame["type"] == "done" and not future.done():
+                    future.set_result(frame["result"])
+                elif frame["type"] == "failed" and not future.done():
+                    future.set_exception(FloodWait(value=frame["flood_wait"]) if frame.get("flood_wait") else
+                                         RemoteJobError(frame["error"], frame["message"], frame["retryable"]))
+        except (ValueError, KeyError) as e:
+            logging.error(f'Worker node {self.name} sent a malformed frame, disconnecting it. Error:\n {e}')
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        This function detaches the node: its idle slots stop taking jobs and the running ones fail, to be retried
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # The busy slots retire once their job fails
+        self._pool.resize(0)
+        for future, _, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f'The worker node {self.name} disconnected'))
+        self._connection.close()
+
+    def stop(self) -> None:
+        """
+        This function cancels all the slots of the node, on shutdown
+        """
+        self._closed = True
+        self._pool.stop()
+        self._connection.close()
+
+
+class Coordinator:
+    """
+    Accepts the worker nodes connecting over a unix socket or TCP, authenticated by a shared token.
+    A node introduces itself with its name and number of slots, then pulls jobs from the queue until it disconnects.
+    """
+    _address: str
+    _token: str
+    _queue: Queue
+    _handler: Callable[[Job, RemoteNode], Awaitable[None]]
+    _server: AbstractServer | None
+    _nodes: list[RemoteNode]
+
+    def __init__(self, address: str, token: str, queue: Queue, handler: Callable[[Job, RemoteNode], Awaitable[None]]):
+        """
+        :param address: unix:/path/to/socket or host:port
+        :param token: The secret the nodes must present, empty to accept any node
+        :param queue: The jobs queue
+        :param handler: The coroutine processing a job on a node
+        """
+        self._address = address
+        self._token = token
+        self._queue = queue
+        self._handler = handler
+        self._server = None
+        self._nodes = []
+
+    def get_nodes(self) -> list[RemoteNode]:
+        """
+        This function returns the connected worker nodes
+        :return: The list of RemoteNode instances
+        """
+        return list(self._nodes)
+
+    async def start(self) -> None:
+        """
+        This function starts accepting the worker nodes
+        """
+        self._server = await start_server(self._address, self._accept)
+        logging.info(f'Waiting for worker nodes on {self._address}')
+
+    def stop(self) -> None:
+        """
+        This function stops accepting the worker nodes and cancels their jobs, they stay pending in the job store
+        """
+        if self._server:
+            self._server.close()
+            self._server = None
+        for node in self._nodes:
+            node.stop()
+        self._nodes.clear()
+
+    async def _accept(self, connection: NodeConnection) -> None:
+        """
+        This function authenticates a worker node and serves it until it disconnects
+        :param connection: The connection of the node
+        """
+        try:
+            hello: dict | None = await asyncio.wait_for(connection.receive(), timeout=HANDSHAKE_TIMEOUT)
+            if not hello or hello.get("type") != "hello":
+                return
+            if not hmac.compare_digest(str(hello.get("token", "")), self._token):
+                logging.warning(f'Rejected a worker node from {connection.get_peer()}: wrong token')
+                await connection.send({"type": "error", "message": "Wrong token"})
+                return
+            slots: int = int(hello["slots"])
+            if slots < 1:
+                raise ValueError("A node must have at least one slot")
+            node: RemoteNode = RemoteNode(str(hello.get("name") or connection.get_peer()), slots, connection,
+                                          self._queue, self._handler)
+            await connection.send({"type": "welcome"})
+        except (asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f'Rejected a worker node from {connection.get_peer()}: {e}')
+            return
+        logging.info(f'Worker node {node.name} connected from {connection.get_peer()} with {node.slots} slots')
+        self._nodes.append(node)
+        try:
+            await node.serve()
+        finally:
+            if node in self._nodes:
+                self._nodes.remove(node)
+            logging.warning(f'Worker node {node.name} disconnected')
@@ -0,0 +1,150 @@
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+# Extended attribute used to recognize the downloaded files when rebuilding the index
+XATTR_NAME: str = "user.tg_file_unique_id"
+
+
+class DedupIndex:
+    """
+    A persistent index of the downloaded media keyed by Telegram's file_unique_id
+    """
+    _db_path: Path
+    _connection: sqlite3.Connection
+
+    def __init__(self, db_path: Path):
+        self._db_path = db_path
+        self._connection = self._connect()
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS media ("
+            "file_unique_id TEXT PRIMARY KEY, "
+            "path TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "sha256 TEXT, "
+            "created_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def lookup(self, file_unique_id: str) -> dict | None:
+        """
+        This function searches an already downloaded media, entries whose file changed or disappeared are dropped
+        :param file_unique_id: The file_unique_id of the media
+        :return: A dict with path, size and sha256 of the stored file if it is still available, None otherwise
+        """
+        return self._lookup(self._connection, file_unique_id)
+
+    def add(self, file_unique_id: str, path: str, size: int, sha256: str | None = None) -> None:
+        """
+        This function records a downloaded media
+        :param file_unique_id: The file_unique_id of the media
+        :param path: The path of the downloaded file
+        :param size: The size of the file
+        :param sha256: The hex digest of the file, if known
+        """
+        self._insert(self._connection, file_unique_id, path, size, sha256)
+        if hasattr(os, "setxattr"):
+            try:
+                os.setxattr(path, XATTR_NAME, file_unique_id.encode())
+            except OSError:
+                # The filesystem doesn't support extended attributes, the file can't be recovered by a rebuild
+                pass
+
+    def remove(self, file_unique_id: str) -> None:
+        """
+        This function deletes an entry from the index
+        :param file_unique_id: The file_unique_id of the media
+        """
+        self._delete(self._connection, file_unique_id)
+
+    def rebuild(self, download_paths: list[str]) -> tuple[int, int]:
+        """
+        This function drops the entries of missing files and indexes the files tagged with their file_unique_id.
+        It's meant to run in a worker thread, so it uses its own connection.
+        :param download_paths: The directories to scan
+        :return: A tuple with the number of dropped entries and the number of indexed files
+        """
+        connection: sqlite3.Connection = self._connect()
+        try:
+            dropped: int = 0
+            for row in connection.execute("SELECT file_unique_id FROM media").fetchall():
+                if not self._lookup(connection, row["file_unique_id"]):
+                    dropped += 1
+            indexed: int = 0
+            if hasattr(os, "getxattr"):
+                for download_path in download_paths:
+                    for root, _, files in os.walk(download_path):
+                        for name in files:
+                            path: str = os.path.join(root, name)
+                            try:
+                                file_unique_id: str = os.getxattr(path, XATTR_NAME).decode()
+                            except OSError:
+                                continue
+                            if not self._lookup(connection, file_unique_id):
+                                self._insert(connection, file_unique_id, path, os.path.getsize(path))
+                                indexed += 1
+        finally:
+            connection.close()
+        logging.info(f"Dedup index rebuilt: {dropped} entries dropped, {indexed} files indexed")
+        return dropped, indexed
+
+    def close(self) -> None:
+        """
+        This function closes the database connection
+        """
+        self._connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        This function opens a connection to the index, a connection must be used only by the thread that opened it
+        :return: A new SQLite connection
+        """
+        connection: sqlite3.Connection = sqlite3.connect(self._db_path)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _lookup(self, connection: sqlite3.Connection, file_unique_id: str) -> dict | None:
+        """
+        This function searches an entry, dropping it if its file changed or disappeared
+        :param connection: The connection of the calling thread
+        :param file_unique_id: The file_unique_id of the media
+        :return: The entry as a dict, None if missing or dropped
+        """
+        row = connection.execute("SELECT * FROM media WHERE file_unique_id = ?", (file_unique_id,)).fetchone()
+        if not row:
+            return None
+        if not os.path.isfile(row["path"]) or os.path.getsize(row["path"]) != row["size"]:
+            logging.info(f'{row["path"]} - Indexed file is not available anymore, dropping it from the index')
+            self._delete(connection, file_unique_id)
+            return None
+        return dict(row)
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, file_unique_id: str, path: str, size: int,
+                sha256: str | None = None) -> None:
+        """
+        This function writes an entry
+        :param connection: The connection of the calling thread
+        :param file_unique_id: The file_unique_id of the media
+        :param path: The path of the downloaded file
+        :param size: The size of the file
+        :param sha256: The hex digest of the file, if known
+        """
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO media (file_unique_id, path, size, sha256, created_at) VALUES (?, ?, ?, ?, ?)",
+                (file_unique_id, os.path.abspath(path), size, sha256, time.time()))
+
+    @staticmethod
+    def _delete(connection: sqlite3.Connection, file_unique_id: str) -> None:
+        """
+        This function deletes an entry
+        :param connection: The connection of the calling thread
+        :param file_unique_id: The file_unique_id of the media
+        """
+        with connection:
+            connection.execute("DELETE FROM media WHERE file_unique_id = ?", (file_unique_id,))
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import shutil
+
+from modules.FileFinalizer import PARTIAL_SUFFIX
+from modules.helpers import format_size
+
+# How often a held job checks the free space again, it may be freed outside the bot
+POLL_INTERVAL: float = 30
+
+
+class InsufficientDiskSpace(Exception):
+    """
+    Raised when a file doesn't fit on the disk and no running download can give space back
+    """
+
+
+class DiskAdmission:
+    """
+    Admits a download only if its file fits in the free space of the target filesystem, minus the space still
+    needed by the running downloads and a safety margin. The space still needed by a download is its size minus the
+    blocks already allocated to its partial file, so preallocated and resumed files are accounted for.
+    A job that doesn't fit is held while other downloads run, since a failing one gives its space back and the user
+    may free some meanwhile, and fails when no running download is left.
+    """
+    _margin: int
+    _reservations: dict[int, tuple[int, str, int]]
+    _changed: asyncio.Event
+
+    def __init__(self, margin: int):
+        self._margin = margin
+        self._reservations = {}
+        self._changed = asyncio.Event()
+
+    @staticmethod
+    def _get_device(file_path: str) -> tuple[int, str]:
+        """
+        This function finds the filesystem of a file that may not exist yet
+        :param file_path: The path of the file
+        :return: A tuple with the device id and its nearest existing directory
+        """
+        directory: str = os.path.dirname(os.path.abspath(file_path))
+        while not os.path.isdir(directory):
+            directory = os.path.dirname(directory)
+        return os.stat(directory).st_dev, directory
+
+    @staticmethod
+    def _get_allocated(file_path: str) -> int:
+        """
+        This function returns the space already taken by a partial file
+        :param file_path: The path of the partial file
+        :return: The allocated bytes, 0 if the file doesn't exist
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return 0
+        # st_blocks counts the preallocated space too, it's not available on every platform
+        return stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size
+
+    def get_available(self, file_path: str) -> int:
+        """
+        This function computes the space available to a new download
+        :param file_path: The destination path of the download
+        :return: The available bytes, it can be negative
+        """
+        device, directory = self._get_device(file_path)
+        needed: int = sum(max(0, size - self._get_allocated(partial_path))
+                          for reservation_device, partial_path, size in self._reservations.values()
+                          if reservation_device == device)
+        return shutil.disk_usage(directory).free - needed - self._margin
+
+    def can_admit(self, file_path: str, size: int) -> bool:
+        """
+        This function checks if a download can start right away
+        :param file_path: The destination path of the download
+        :param size: The size of the file
+        :return: True if the file fits, False otherwise
+        """
+        return size <= self.get_available(file_path) + self._get_allocated(f'{file_path}{PARTIAL_SUFFIX}')
+
+    async def acquire(self, job_id: int, file_path: str, size: int) -> None:
+        """
+        This function waits until the file fits on the disk and reserves its space
+        :param job_id: The id of the job
+        :param file_path: The destination path of the download
+        :param size: The size of the file
+        :raise InsufficientDiskSpace: If the file doesn't fit and no running download can free space
+        """
+        device, _ = self._get_device(file_path)
+        partial_path: str = f'{file_path}{PARTIAL_SUFFIX}'
+        while True:
+            changed: asyncio.Event = self._changed
+            # The partial file of a resumed download already takes part of the space
+            available: int = self.get_available(file_path) + self._get_allocated(partial_path)
+            if size <= available:
+                self._reservations[job_id] = (device, partial_path, size)
+                return
+            if not any(reservation[0] == device for reservation in self._reservations.values()):
+                raise InsufficientDiskSpace(f'The file needs {format_size(size)}, only '
+                                            f'{format_size(max(0, available))} are available')
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, job_id: int) -> None:
+        """
+        This function frees the reservation of a job and wakes up the held jobs
+        :param job_id: The id of the job
+        """
+        if self._reservations.pop(job_id, None):
+            logging.debug(f'Disk reservation of job #{job_id} released')
+            self._changed.set()
+            self._changed = asyncio.Event()
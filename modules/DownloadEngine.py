@@ -0,0 +1,427 @@
+import asyncio
+import contextlib
+import errno
+import inspect
+import logging
+import math
+import os
+from typing import Callable, AsyncIterator, Awaitable
+
+from pyrogram import Client, raw
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Session, Auth
+from pyrogram.types import Message
+
+from modules.ChunkJournal import ChunkJournal
+from modules.FileFinalizer import FileFinalizer, PARTIAL_SUFFIX
+from modules.RateLimiter import RateLimiter, TokenBucket
+from modules.StreamHasher import StreamHasher
+from modules.StreamSink import StreamSink, SinkWriter
+
+# Telegram serves files in 1 MiB blocks, a GetFile request can't cross a block boundary
+CHUNK_SIZE: int = 1024 * 1024
+# Below this size the connection setup costs more than the parallel fetch saves
+MIN_CHUNKED_SIZE: int = 10 * CHUNK_SIZE
+
+
+class CdnRedirect(Exception):
+    """
+    Raised when Telegram asks to fetch the file from a CDN, the chunked engine doesn't handle CDN downloads
+    """
+
+
+class DownloadInterrupted(Exception):
+    """
+    Raised when the download stopped before receiving the whole file
+    """
+
+
+class _PathLocks:
+    """
+    A lock for each path, dropped once nobody holds it or waits for it
+    """
+    _locks: dict[str, asyncio.Lock]
+    _holders: dict[str, int]
+
+    def __init__(self):
+        self._locks = {}
+        self._holders = {}
+
+    def is_locked(self, path: str) -> bool:
+        """
+        This function tells if a path is held
+        :param path: The path
+        :return: True if someone holds the path, False otherwise
+        """
+        lock: asyncio.Lock | None = self._locks.get(os.path.abspath(path))
+        return lock is not None and lock.locked()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, path: str) -> AsyncIterator[None]:
+        """
+        This function holds a path, waiting for the previous holder to release it
+        :param path: The path
+        """
+        path = os.path.abspath(path)
+        lock: asyncio.Lock = self._locks.setdefault(path, asyncio.Lock())
+        self._holders[path] = self._holders.get(path, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[path] -= 1
+            if not self._holders[path]:
+                del self._holders[path]
+                del self._locks[path]
+
+
+# Shared by the engines of all the clients: the partial file and its journal are named after the destination, two
+# jobs saving to the same path would write the same partial file and take each other's chunks as done
+_partial_files: _PathLocks = _PathLocks()
+
+
+class DownloadEngine:
+    _client: Client
+    _connections: int
+    _resume: bool
+    _preallocate: bool
+    _finalizer: FileFinalizer
+    _rate_limiter: RateLimiter
+    _sessions: dict[int, list[Session]]
+    _sessions_lock: asyncio.Lock
+    _next_session: dict[int, int]
+
+    def __init__(self, client: Client, connections: int, resume: bool, rate_limiter: RateLimiter,
+                 preallocate: bool = True, finalizer: FileFinalizer | None = None):
+        self._client = client
+        self._connections = connections
+        self._resume = resume
+        self._preallocate = preallocate
+        self._finalizer = finalizer or FileFinalizer("overwrite")
+        self._rate_limiter = rate_limiter
+        self._sessions = {}
+        self._sessions_lock = asyncio.Lock()
+        self._next_session = {}
+
+    async def download(self, message: Message, file_path: str, progress: Callable | None = None,
+                       progress_args: tuple = (), hasher: StreamHasher | None = None) -> str | None:
+        """
+        This function downloads the media of a message splitting it into chunks fetched in parallel.
+        The data is written to a partial file, renamed to the destination only once complete and flushed to the disk.
+        The downloads saving to the same path run one at a time, a later one resumes the partial file of an
+        interrupted one.
+        :param message: The message containing the media
+        :param file_path: The destination path of the file
+        :param progress: A coroutine called as progress(current, total, *progress_args) after each chunk
+        :param progress_args: Extra arguments passed to the progress callback
+        :param hasher: An optional hasher fed with the chunks, a resumed download can't feed it
+        :return: The path of the downloaded file, None if it was dropped by the collision policy
+        """
+        media = getattr(message, message.media.value)
+        file_size: int = getattr(media, "file_size", 0) or 0
+        bucket: TokenBucket = self._rate_limiter.create_job_bucket()
+        if _partial_files.is_locked(file_path):
+            logging.info(f'{os.path.basename(file_path)} - Another download is saving to the same path, waiting for it')
+        async with _partial_files.hold(file_path):
+            if file_size >= MIN_CHUNKED_SIZE:
+                try:
+                    return await self._download_chunked(message, file_size, file_path, bucket, progress,
+                                                        progress_args, hasher)
+                except CdnRedirect:
+                    logging.info(f'{os.path.basename(file_path)} - Served by CDN, falling back to single stream '
+                                 f'download')
+            return await self._download_stream(message, file_size, file_path, bucket, progress, progress_args, hasher)
+
+    async def download_to_sink(self, message: Message, sink: StreamSink, file_name: str, context: dict,
+                               progress: Callable | None = None, progress_args: tuple = (),
+                               hasher: StreamHasher | None = None) -> str:
+        """
+        This function streams the media of a message straight to a sink, nothing is written to the disk.
+        The chunks are fetched in order over Pyrogram's single stream, each one is requested only once the sink
+        accepted the previous one, so a slow sink slows the download down.
+        :param message: The message containing the media
+        :param sink: The sink receiving the file
+        :param file_name: The target file name, relative to the download dir, or absolute when routed elsewhere
+        :param context: The job details passed to the sink
+        :param progress: A coroutine called as progress(current, total, *progress_args) after each chunk
+        :param progress_args: Extra arguments passed to the progress callback
+        :param hasher: An optional hasher fed with the chunks
+        :return: Where the sink stored the file
+        """
+        media = getattr(message, message.media.value)
+        file_size: int = getattr(media, "file_size", 0) or 0
+        bucket: TokenBucket = self._rate_limiter.create_job_bucket()
+        writer: SinkWriter = await sink.open(file_name, context)
+        try:
+            await self._pump(message, file_size, bucket, writer.write, progress, progress_args, hasher)
+            return await writer.close()
+        except BaseException:
+            await writer.abort()
+            raise
+
+    async def close(self) -> None:
+        """
+        This function stops all the media sessions opened by the engine
+        """
+        async with self._sessions_lock:
+            for sessions in self._sessions.values():
+                for session in sessions:
+                    await session.stop()
+            self._sessions.clear()
+            self._next_session.clear()
+
+    async def _download_stream(self, message: Message, file_size: int, file_path: str, bucket: TokenBucket,
+                               progress: Callable | None, progress_args: tuple,
+                               hasher: StreamHasher | None) -> str | None:
+        """
+        This function downloads a file over Pyrogram's single stream, the only one supporting CDN files
+        :param message: The message containing the media
+        :param file_size: The size of the media in bytes, 0 if unknown
+        :param file_path: The destination path of the file
+        :param bucket: The bandwidth bucket of the job
+        :param progress: The progress callback
+        :param progress_args: Extra arguments passed to the progress callback
+        :param hasher: The hasher fed with the chunks
+        :return: The path of the downloaded file, None if it was dropped by the collision policy
+        """
+        partial_path: str = f'{file_path}{PARTIAL_SUFFIX}'
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        try:
+            with open(partial_path, "wb") as file:
+                async def write(chunk: bytes) -> None:
+                    file.write(chunk)
+
+                await self._pump(message, file_size, bucket, write, progress, progress_args, hasher)
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        return self._finalizer.finalize(partial_path, file_path)
+
+    async def _pump(self, message: Message, file_size: int, bucket: TokenBucket,
+                    write: Callable[[bytes], Awaitable[None]], progress: Callable | None, progress_args: tuple,
+                    hasher: StreamHasher | None) -> None:
+        """
+        This function passes the chunks of Pyrogram's single stream to a writer, in order
+        :param message: The message containing the media
+        :param file_size: The size of the media in bytes, 0 if unknown
+        :param bucket: The bandwidth bucket of the job
+        :param write: A coroutine receiving each chunk
+        :param progress: The progress callback
+        :param progress_args: Extra arguments passed to the progress callback
+        :param hasher: The hasher fed with the chunks
+        :raise DownloadInterrupted: If the stream ended before the whole file
+        """
+        received: int = 0
+        index: int = 0
+        async for chunk in self._stream(message):
+            # The next chunk is requested only when the loop asks for it
+            await self._rate_limiter.consume(len(chunk), bucket)
+            await write(chunk)
+            if hasher:
+                await hasher.feed(index, chunk)
+            index += 1
+            received += len(chunk)
+            await self._report(progress, progress_args, received, file_size)
+        # Pyrogram logs and swallows the transfer errors, ending the stream early
+        if not received or (file_size and received != file_size):
+            raise DownloadInterrupted(f'The single stream download stopped at {received}/{file_size} bytes, '
+                                      f'check logs!')
+
+    def _stream(self, message: Message) -> AsyncIterator[bytes]:
+        """
+        This function streams the chunks of a media in order
+        :param message: The message containing the media
+        :return: An async iterator of the chunks
+        """
+        return self._client.stream_media(message)
+
+    @staticmethod
+    async def _report(progress: Callable | None, progress_args: tuple, current: int, total: int) -> None:
+        """
+        This function calls the progress callback, if any
+        :param progress: The progress callback
+        :param progress_args: Extra arguments passed to the progress callback
+        :param current: The downloaded bytes
+        :param total: The size of the file
+        """
+        if progress:
+            if inspect.iscoroutinefunction(progress):
+                await progress(current, total, *progress_args)
+            else:
+                progress(current, total, *progress_args)
+
+    async def _download_chunked(self, message: Message, file_size: int, file_path: str, bucket: TokenBucket,
+                                progress: Callable | None, progress_args: tuple,
+                                hasher: StreamHasher | None) -> str | None:
+        """
+        This function fetches all the chunks of a file and writes them at their offset in a preallocated file.
+        When resume is enabled the completed chunks are recorded in a journal, so an interrupted download keeps its
+        partial file and the next attempt only fetches the missing chunks.
+        :param message: The message containing the media
+        :param file_size: The size of the media in bytes
+        :param file_path: The destination path of the file
+        :param bucket: The bandwidth bucket of the job
+        :param progress: The progress callback
+        :param progress_args: Extra arguments passed to the progress callback
+        :param hasher: The hasher fed with the chunks, a resumed download can't feed it
+        :return: The path of the downloaded file, None if it was dropped by the collision policy
+        """
+        media = getattr(message, message.media.value)
+        file_id: FileId = FileId.decode(media.file_id)
+        location = self._get_location(file_id)
+        await self._get_sessions(file_id.dc_id)
+        chunks: int = math.ceil(file_size / CHUNK_SIZE)
+        temp_file_path: str = f'{file_path}{PARTIAL_SUFFIX}'
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        journal = ChunkJournal(temp_file_path)
+        identity: dict = {"file_unique_id": media.file_unique_id, "file_size": file_size}
+        completed: set[int] | None = journal.load(identity) \
+            if self._resume and os.path.isfile(temp_file_path) else None
+        if completed:
+            logging.info(f'{os.path.basename(file_path)} - Resuming download, {len(completed)}/{chunks} chunks '
+                         f'already available')
+        pending: asyncio.Queue = asyncio.Queue()
+        for index in range(chunks):
+            if not completed or index not in completed:
+                pending.put_nowait(index)
+        downloaded: list[int] = [sum(min(CHUNK_SIZE, file_size - index * CHUNK_SIZE) for index in completed or [])]
+
+        async def fetcher() -> None:
+            while not pending.empty():
+                index: int = pending.get_nowait()
+                expected: int = min(CHUNK_SIZE, file_size - index * CHUNK_SIZE)
+                await self._rate_limiter.consume(expected, bucket)
+                chunk: bytes = await self._get_chunk(file_id.dc_id, location, index)
+                if len(chunk) != expected:
+                    raise DownloadInterrupted(f'Chunk {index} is {len(chunk)} bytes long, {expected} were expected')
+                file.seek(index * CHUNK_SIZE)
+                file.write(chunk)
+                if self._resume:
+                    file.flush()
+                    journal.mark(index)
+                if hasher and not completed:
+                    await hasher.feed(index, chunk)
+                downloaded[0] += len(chunk)
+                await self._report(progress, progress_args, downloaded[0], file_size)
+
+        file = open(temp_file_path, "r+b" if completed is not None else "wb")
+        try:
+            self._allocate(file, file_size)
+            if self._resume:
+                journal.open({**identity, "chat_id": message.chat.id, "message_id": message.id},
+                             resume=completed is not None)
+            fetchers = [asyncio.create_task(fetcher()) for _ in range(min(self._connections, chunks))]
+            try:
+                await asyncio.gather(*fetchers)
+            except BaseException:
+                for f in fetchers:
+                    f.cancel()
+                raise
+            # A file is finalized only when every chunk has been written
+            if not pending.empty() or downloaded[0] != file_size:
+                raise DownloadInterrupted(f'The chunked download stopped at {downloaded[0]}/{file_size} bytes, '
+                                          f'{pending.qsize()} chunks were not fetched')
+        except BaseException:
+            file.close()
+            if self._resume:
+                journal.close()
+                logging.info(f'{os.path.basename(file_path)} - Partial download kept to be resumed, '
+                             f'{downloaded[0]}/{file_size} bytes available')
+            else:
+                os.remove(temp_file_path)
+            raise
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+        journal.remove()
+        return self._finalizer.finalize(temp_file_path, file_path)
+
+    def _allocate(self, file, file_size: int) -> None:
+        """
+        This function sizes the partial file, reserving its blocks on the disk when preallocation is enabled.
+        Reserving the whole file at once lets the filesystem lay it out contiguously and fails as soon as the disk
+        is full, instead of after downloading most of the file.
+        :param file: The partial file, opened for writing
+        :param file_size: The size of the media in bytes
+        """
+        file.truncate(file_size)
+        if self._preallocate and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(file.fileno(), 0, file_size)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise
+                # The filesystem doesn't support it, the file stays sparse
+                logging.debug(f'Unable to preallocate {file_size} bytes: {e}')
+
+    async def _get_chunk(self, dc_id: int, location, index: int) -> bytes:
+        """
+        This function requests a single chunk of a file using the next session of the DC pool
+        :param dc_id: The DC where the file is stored
+        :param location: The raw input file location
+        :param index: The index of the chunk
+        :return: The bytes of the chunk
+        """
+        sessions: list[Session] = self._sessions[dc_id]
+        session: Session = sessions[self._next_session[dc_id] % len(sessions)]
+        self._next_session[dc_id] += 1
+        r = await session.invoke(
+            raw.functions.upload.GetFile(location=location, offset=index * CHUNK_SIZE, limit=CHUNK_SIZE),
+            sleep_threshold=30
+        )
+        if not isinstance(r, raw.types.upload.File):
+            raise CdnRedirect()
+        return r.bytes
+
+    async def _get_sessions(self, dc_id: int) -> list[Session]:
+        """
+        This function returns the media sessions pool of a DC, opening the missing sessions if needed
+        :param dc_id: The DC id
+        :return: The list of started sessions
+        """
+        async with self._sessions_lock:
+            sessions: list[Session] = self._sessions.setdefault(dc_id, [])
+            self._next_session.setdefault(dc_id, 0)
+            if len(sessions) >= self._connections:
+                return sessions
+            client: Client = self._client
+            test_mode: bool = await client.storage.test_mode()
+            is_home_dc: bool = dc_id == await client.storage.dc_id()
+            auth_key: bytes = await client.storage.auth_key() if is_home_dc \
+                else await Auth(client, dc_id, test_mode).create()
+            authorized: bool = is_home_dc
+            while len(sessions) < self._connections:
+                session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+                await session.start()
+                if not authorized:
+                    exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                    await session.invoke(
+                        raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
+                    authorized = True
+                sessions.append(session)
+            logging.info(f'Opened {len(sessions)} media sessions to DC{dc_id}')
+            return sessions
+
+    @staticmethod
+    def _get_location(file_id: FileId):
+        """
+        This function builds the raw input location of a file
+        :param file_id: The decoded file id
+        :return: A raw InputFileLocation
+        """
+        if file_id.file_type == FileType.PHOTO:
+            return raw.types.InputPhotoFileLocation(
+                id=file_id.media_id,
+                access_hash=file_id.access_hash,
+                file_reference=file_id.file_reference,
+                thumb_size=file_id.thumbnail_size
+            )
+        return raw.types.InputDocumentFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
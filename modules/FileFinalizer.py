@@ -0,0 +1,131 @@
+import logging
+import os
+
+# What to do when the destination of a download already exists
+COLLISION_POLICIES: list[str] = ["suffix", "skip", "overwrite"]
+# Suffix of the partial files, the same used by Pyrogram
+PARTIAL_SUFFIX: str = ".temp"
+# Suffix of the chunks journal of a resumable partial file
+JOURNAL_SUFFIX: str = ".journal"
+
+
+class FileFinalizer:
+    """
+    Turns the partial file of a completed download into the final file: the data is flushed to the disk, then the file
+    is atomically renamed, so the final name never shows a truncated file, even after a crash.
+    """
+    _policy: str
+
+    def __init__(self, policy: str):
+        self._policy = policy
+
+    def is_skipped(self, file_path: str) -> bool:
+        """
+        This function checks if a download would be dropped because its destination already exists
+        :param file_path: The destination path
+        :return: True if the policy is skip and the file exists, False otherwise
+        """
+        return self._policy == "skip" and os.path.exists(file_path)
+
+    def finalize(self, partial_path: str, file_path: str) -> str | None:
+        """
+        This function moves a completed partial file to its destination, applying the collision policy
+        :param partial_path: The path of the partial file, already flushed to the disk
+        :param file_path: The destination path
+        :return: The path of the final file, it differs from the destination when a suffix is added.
+        None if the download is dropped because the destination exists.
+        """
+        if self._policy == "overwrite":
+            os.replace(partial_path, file_path)
+        elif self._policy == "skip":
+            if not self._rename_no_clobber(partial_path, file_path):
+                logging.warning(f'{os.path.basename(file_path)} - The file already exists, dropping the download')
+                os.remove(partial_path)
+                return None
+        else:
+            stem, ext = os.path.splitext(file_path)
+            candidate: str = file_path
+            index: int = 1
+            while not self._rename_no_clobber(partial_path, candidate):
+                candidate = f'{stem} ({index}){ext}'
+                index += 1
+            if candidate != file_path:
+                logging.info(f'{os.path.basename(file_path)} - The file already exists, saved as '
+                             f'{os.path.basename(candidate)}')
+            file_path = candidate
+        self._sync_directory(os.path.dirname(os.path.abspath(file_path)))
+        return file_path
+
+    @staticmethod
+    def _rename_no_clobber(source: str, destination: str) -> bool:
+        """
+        This function renames a file only if the destination doesn't exist, without races when hardlinks are supported
+        :param source: The path of the file
+        :param destination: The new path
+        :return: True if the file has been renamed, False if the destination exists
+        """
+        try:
+            os.link(source, destination)
+        except FileExistsError:
+            return False
+        except OSError:
+            # The filesystem doesn't support hardlinks, fall back to a check and a rename
+            if os.path.exists(destination):
+                return False
+            os.replace(source, destination)
+            return True
+        os.remove(source)
+        return True
+
+    @staticmethod
+    def _sync_directory(directory: str) -> None:
+        """
+        This function flushes a directory entry, making a rename durable
+        :param directory: The directory path
+        """
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        try:
+            fd: int = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def sweep(paths: list[str], resume: bool) -> tuple[int, int]:
+        """
+        This function cleans the partial files left by a previous run, the resumable ones are kept when resume is
+        enabled. It must run while no download is running, like at startup, since every partial file is swept.
+        :param paths: The directories to scan
+        :param resume: A control flag to keep the partial files with a chunks journal
+        :return: A tuple with the number of removed and kept partial files
+        """
+        removed, kept = 0, 0
+        for path in dict.fromkeys(paths):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    if not name.endswith(PARTIAL_SUFFIX) and not name.endswith(PARTIAL_SUFFIX + JOURNAL_SUFFIX):
+                        continue
+                    file_path: str = os.path.join(root, name)
+                    try:
+                        if name.endswith(JOURNAL_SUFFIX):
+                            # An orphan journal, its partial file is gone
+                            if not os.path.exists(file_path[:-len(JOURNAL_SUFFIX)]) and os.path.exists(file_path):
+                                os.remove(file_path)
+                            continue
+                        if resume and os.path.exists(file_path + JOURNAL_SUFFIX):
+                            kept += 1
+                            continue
+                        os.remove(file_path)
+                        removed += 1
+                        # Its journal may have been walked already
+                        if os.path.exists(file_path + JOURNAL_SUFFIX):
+                            os.remove(file_path + JOURNAL_SUFFIX)
+                    except OSError as e:
+                        logging.warning(f'Unable to clean the partial file {file_path}, error:\n {e}')
+        return removed, kept
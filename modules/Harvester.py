@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Awaitable
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait, BotMethodInvalid
+from pyrogram.types import Message, Chat
+
+from modules.models.HarvestFilters import HarvestFilters
+
+# Maximum number of message ids accepted by a single get_messages call
+PAGE_SIZE: int = 200
+
+
+class Harvester:
+    """
+    Pages through the history of a chat by message id and hands the matching media messages over, page by page.
+    The last harvested id of each chat is persisted, so a new harvest continues where the previous one stopped.
+    Ids are fetched with get_messages because bots are not allowed to read the chat history.
+
+    Each message handed over stays pending until the caller reports it with complete() or fail(): the cursor never
+    moves past a pending message, and the failed ones are handed over again by the next incremental harvest.
+    """
+    _client: Client
+    _connection: sqlite3.Connection
+    _pending: dict[int, set[int]]
+    _scanned: dict[int, int]
+
+    def __init__(self, client: Client, db_path: Path):
+        self._client = client
+        self._pending = {}
+        self._scanned = {}
+        self._connection = sqlite3.connect(db_path)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS harvest_cursors ("
+            "chat_id INTEGER PRIMARY KEY, "
+            "last_id INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS harvest_failures ("
+            "chat_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "PRIMARY KEY (chat_id, message_id))"
+        )
+        self._connection.commit()
+
+    def get_cursor(self, chat_id: int) -> int:
+        """
+        This function returns the last harvested message id of a chat
+        :param chat_id: The chat id
+        :return: The last harvested id, 0 if the chat was never harvested
+        """
+        row = self._connection.execute("SELECT last_id FROM harvest_cursors WHERE chat_id = ?", (chat_id,)).fetchone()
+        return row["last_id"] if row else 0
+
+    def set_cursor(self, chat_id: int, last_id: int) -> None:
+        """
+        This function persists the last harvested message id of a chat
+        :param chat_id: The chat id
+        :param last_id: The last harvested id
+        """
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO harvest_cursors (chat_id, last_id, updated_at) "
+                                     "VALUES (?, ?, ?)", (chat_id, last_id, time.time()))
+
+    def get_failures(self, chat_id: int) -> list[int]:
+        """
+        This function returns the harvested messages of a chat that failed to download
+        :param chat_id: The chat id
+        :return: The sorted message ids
+        """
+        rows = self._connection.execute("SELECT message_id FROM harvest_failures WHERE chat_id = ? "
+                                        "ORDER BY message_id", (chat_id,)).fetchall()
+        return [row["message_id"] for row in rows]
+
+    def complete(self, chat_id: int, message_id: int) -> None:
+        """
+        This function reports a harvested message as handled, downloaded or skipped
+        :param chat_id: The chat id
+        :param message_id: The message id
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM harvest_failures WHERE chat_id = ? AND message_id = ?",
+                                     (chat_id, message_id))
+        self._release(chat_id, message_id)
+
+    def fail(self, chat_id: int, message_id: int) -> None:
+        """
+        This function reports a harvested message that failed to download, it will be harvested again
+        :param chat_id: The chat id
+        :param message_id: The message id
+        """
+        with self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO harvest_failures (chat_id, message_id) VALUES (?, ?)",
+                                     (chat_id, message_id))
+        self._release(chat_id, message_id)
+
+    def _release(self, chat_id: int, message_id: int) -> None:
+        """
+        This function stops waiting for a harvested message, moving the cursor forward if possible
+        :param chat_id: The chat id
+        :param message_id: The message id
+        """
+        self._pending.get(chat_id, set()).discard(message_id)
+        self._advance(chat_id)
+
+    def _advance(self, chat_id: int) -> None:
+        """
+        This function moves the cursor of a chat up to its first pending message, it never moves back
+        :param chat_id: The chat id
+        """
+        if chat_id not in self._scanned:
+            return
+        cursor: int = self.get_cursor(chat_id)
+        # The retried messages behind the cursor are tracked by the failures table
+        pending: list[int] = [message_id for message_id in self._pending.get(chat_id, set()) if message_id > cursor]
+        last_id: int = min(min(pending) - 1, self._scanned[chat_id]) if pending else self._scanned[chat_id]
+        if last_id > cursor:
+            self.set_cursor(chat_id, last_id)
+
+    async def get_last_id(self, chat_id: int) -> int:
+        """
+        This function returns the id of the newest message of a chat
+        :param chat_id: The chat id
+        :return: The newest message id
+        :raise ValueError: If the session is a bot, which can't read the chat history
+        """
+        try:
+            async for message in self._client.get_chat_history(chat_id, limit=1):
+                return message.id
+        except BotMethodInvalid:
+            raise ValueError("Bots can't read the chat history, the last message id must be provided")
+        return 0
+
+    async def harvest(self, chat: str | int, from_id: int | None, to_id: int | None, filters: HarvestFilters,
+                      on_page: Callable[[Chat, list[Message]], Awaitable[None]]) -> int:
+        """
+        This function harvests the media messages of a chat
+        :param chat: The chat id or username
+        :param from_id: The first message id, None to continue from the persisted cursor
+        :param to_id: The last message id, None to harvest up to the newest message
+        :param filters: The filters the messages must pass
+        :param on_page: A coroutine receiving the chat and the matching messages of each page, each message must be
+        reported with complete() or fail()
+        :return: The number of matching messages
+        """
+        resolved_chat: Chat = await self._client.get_chat(chat)
+        # The failed messages of the previous harvests are attempted again first
+        retried: list[int] = self.get_failures(resolved_chat.id) if from_id is None else []
+        retried_ids: set[int] = set(retried)
+        if from_id is None:
+            from_id = self.get_cursor(resolved_chat.id) + 1
+        if to_id is None:
+            to_id = await self.get_last_id(resolved_chat.id)
+        logging.info(f'Harvesting {chat} from message {from_id} to {to_id}' +
+                     (f', retrying {len(retried)} failed messages' if retried else ''))
+        # Each page is a list of ids and, for the pages of the range, the last id it scans
+        pages: list[tuple[list[int], int | None]] = \
+            [(retried[index:index + PAGE_SIZE], None) for index in range(0, len(retried), PAGE_SIZE)]
+        for start in range(from_id, to_id + 1, PAGE_SIZE):
+            end: int = min(start + PAGE_SIZE, to_id + 1)
+            pages.append(([message_id for message_id in range(start, end) if message_id not in retried_ids], end - 1))
+        pending: set[int] = self._pending.setdefault(resolved_chat.id, set())
+        matched: int = 0
+        for ids, last_id in pages:
+            if ids:
+                while True:
+                    try:
+                        messages: list[Message] = await self._client.get_messages(resolved_chat.id, ids)
+                        break
+                    except FloodWait as e:
+                        logging.warning(f'Harvest of {chat} hit a FloodWait, waiting {e.value} seconds')
+                        await asyncio.sleep(e.value)
+                page: list[Message] = [message for message in messages if filters.match(message)]
+                matched += len(page)
+                pending.update(message.id for message in page)
+                for message_id in retried_ids.intersection(ids).difference(pending):
+                    # A failed message deleted meanwhile is forgotten
+                    self.complete(resolved_chat.id, message_id)
+                if page:
+                    await on_page(resolved_chat, page)
+            if last_id is not None:
+                self._scanned[resolved_chat.id] = max(self._scanned.get(resolved_chat.id, 0), last_id)
+                self._advance(resolved_chat.id)
+        logging.info(f'Harvest of {chat} completed, {matched} media found')
+        return matched
+
+    def close(self) -> None:
+        """
+        This function closes the database connection
+        """
+        self._connection.close()
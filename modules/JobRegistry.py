@@ -0,0 +1,171 @@
+from asyncio import Task
+from typing import Callable
+
+from modules.JobScheduler import JobScheduler
+from modules.RetryScheduler import RetryScheduler
+from modules.models.Job import Job, JobState
+
+# The states after which a job is forgotten, the job store keeps their history
+FINAL_STATES: tuple[JobState, ...] = (JobState.DONE, JobState.FAILED, JobState.ABORTED)
+
+
+class JobRegistry:
+    """
+    Tracks the jobs of this run from their creation to their end, wherever they are: in queue, downloading, waiting
+    for a retry or paused by the user. The ended jobs and their tasks are evicted right away, so the memory doesn't
+    grow with the uptime.
+    """
+    _queue: JobScheduler
+    _retry_scheduler: RetryScheduler
+    _enqueue: Callable[[Job], None]
+    _jobs: dict[int, Job]
+    _tasks: dict[int, Task]
+    _paused: dict[int, Job]
+
+    def __init__(self, queue: JobScheduler, retry_scheduler: RetryScheduler, enqueue: Callable[[Job], None]):
+        """
+        :param queue: The jobs queue
+        :param retry_scheduler: The scheduler of the retries
+        :param enqueue: The function that puts a job back in the queue
+        """
+        self._queue = queue
+        self._retry_scheduler = retry_scheduler
+        self._enqueue = enqueue
+        self._jobs = {}
+        self._tasks = {}
+        self._paused = {}
+
+    def add(self, job: Job) -> None:
+        """
+        This function starts tracking a job
+        :param job: A stored Job instance
+        """
+        self._jobs[job.id] = job
+
+    def update(self, job: Job) -> None:
+        """
+        This function records the new state of a job, forgetting it once ended
+        :param job: The updated Job instance
+        """
+        if job.state in FINAL_STATES:
+            self._jobs.pop(job.id, None)
+            self._tasks.pop(job.id, None)
+            self._paused.pop(job.id, None)
+
+    def get(self, job_id: int) -> Job | None:
+        """
+        This function searches a tracked job
+        :param job_id: The id of the job
+        :return: The Job instance, None if the job ended or doesn't exist
+        """
+        return self._jobs.get(job_id)
+
+    def get_count(self) -> int:
+        """
+        This function returns the number of tracked jobs
+        :return: The number of jobs not ended yet
+        """
+        return len(self._jobs)
+
+    def get_status(self, job: Job) -> str:
+        """
+        This function describes where a job is
+        :param job: A tracked Job instance
+        :return: One of downloading, queued, retrying, paused
+        """
+        if job.id in self._paused:
+            return "paused"
+        if self._retry_scheduler.is_pending(job.id):
+            return "retrying"
+        if job.state == JobState.DOWNLOADING:
+            return "downloading"
+        return "queued"
+
+    def get_jobs(self) -> list[Job]:
+        """
+        This function returns the tracked jobs: the downloading ones, the queued ones in the order they will be
+        served, then the ones waiting for a retry and the paused ones
+        :return: A list of Job instances
+        """
+        statuses: dict[int, str] = {job.id: self.get_status(job) for job in self._jobs.values()}
+        queued: list[Job] = [job for job in self._queue.get_jobs() if statuses.get(job.id) == "queued"]
+        # Taken by a worker, or not handed to the queue yet
+        queued += [job for job in self._jobs.values() if statuses[job.id] == "queued" and job not in queued]
+        return [job for job in self._jobs.values() if statuses[job.id] == "downloading"] + queued + \
+            [job for job in self._jobs.values() if statuses[job.id] == "retrying"] + list(self._paused.values())
+
+    def attach(self, job: Job, task: Task) -> None:
+        """
+        This function binds a job to the task downloading it, the task is cancelled right away if the job was
+        interrupted before its download started
+        :param job: A tracked Job instance
+        :param task: The download task
+        """
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None) if self._tasks.get(job.id) is task else None)
+        if job.interrupt:
+            task.cancel()
+
+    def cancel(self, job_id: int) -> Job | None:
+        """
+        This function cancels a job. A running download is interrupted and ended by its worker, a job waiting in
+        queue, for a retry or paused is taken out and returned, the caller has to end it.
+        :param job_id: The id of the job
+        :return: The taken out Job instance, None if the job is running or doesn't exist
+        """
+        job: Job | None = self._jobs.get(job_id)
+        if not job:
+            return None
+        waiting: Job | None = self._paused.pop(job_id, None) or self._queue.remove(job_id) \
+            or self._retry_scheduler.cancel(job_id)
+        if waiting:
+            return waiting
+        self._interrupt(job, "cancel")
+        return None
+
+    def pause(self, job_id: int) -> bool:
+        """
+        This function holds a job until it is resumed. A running download is interrupted, its worker hands the job
+        back with hold(), the partial file is kept when resume is enabled.
+        :param job_id: The id of the job
+        :return: True if the job is paused, False if it doesn't exist or it is already paused
+        """
+        job: Job | None = self._jobs.get(job_id)
+        if not job or job_id in self._paused:
+            return False
+        if self._queue.remove(job_id) or self._retry_scheduler.cancel(job_id):
+            self.hold(job)
+        else:
+            self._interrupt(job, "pause")
+        return True
+
+    def hold(self, job: Job) -> None:
+        """
+        This function keeps a paused job out of the queue
+        :param job: The paused Job instance
+        """
+        job.interrupt = None
+        self._paused[job.id] = job
+
+    def resume(self, job_id: int) -> bool:
+        """
+        This function puts a paused job back in the queue
+        :param job_id: The id of the job
+        :return: True if the job is queued again, False if it wasn't paused
+        """
+        job: Job | None = self._paused.pop(job_id, None)
+        if not job:
+            return False
+        self._enqueue(job)
+        return True
+
+    def _interrupt(self, job: Job, reason: str) -> None:
+        """
+        This function interrupts the download of a running job
+        :param job: The running Job instance
+        :param reason: cancel or pause, read by the worker handling the interruption
+        """
+        job.interrupt = reason
+        task: Task | None = self._tasks.get(job.id)
+        if task:
+            task.cancel()
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from typing import Iterator
+
+from modules.models.Job import Job
+
+
+class _FairLanes:
+    """
+    The storage of the scheduler: one lane per user served in round-robin, plus a priority lane served first
+    """
+    _smallest_first: bool
+    _priority: deque[Job]
+    _lanes: dict[int, list[tuple[int, int, Job]]]
+    _turns: deque[int]
+    _sequence: Iterator[int]
+    _size: int
+
+    def __init__(self, smallest_first: bool):
+        self._smallest_first = smallest_first
+        self._priority = deque()
+        self._lanes = {}
+        self._turns = deque()
+        self._sequence = itertools.count()
+        self._size = 0
+
+    def set_smallest_first(self, smallest_first: bool) -> None:
+        self._smallest_first = smallest_first
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Job]:
+        yield from self._priority
+        for user_id in self._turns:
+            for _, _, job in sorted(self._lanes[user_id]):
+                yield job
+
+    def push(self, job: Job) -> None:
+        lane: list[tuple[int, int, Job]] | None = self._lanes.get(job.user_id)
+        if lane is None:
+            lane = self._lanes[job.user_id] = []
+            self._turns.append(job.user_id)
+        # The sequence number keeps the FIFO order among jobs with the same key
+        heapq.heappush(lane, (job.file_size if self._smallest_first else 0, next(self._sequence), job))
+        self._size += 1
+
+    def pop(self) -> Job:
+        self._size -= 1
+        if self._priority:
+            return self._priority.popleft()
+        user_id: int = self._turns.popleft()
+        lane: list[tuple[int, int, Job]] = self._lanes[user_id]
+        _, _, job = heapq.heappop(lane)
+        if lane:
+            self._turns.append(user_id)
+        else:
+            del self._lanes[user_id]
+        return job
+
+    def push_front(self, job: Job) -> None:
+        self._priority.appendleft(job)
+        self._size += 1
+
+    def bump(self, job_id: int) -> Job | None:
+        job: Job | None = self._take(job_id)
+        if job:
+            self._priority.append(job)
+        return job
+
+    def remove(self, job_id: int) -> Job | None:
+        job: Job | None = next((job for job in self._priority if job.id == job_id), None)
+        if job:
+            self._priority.remove(job)
+        else:
+            job = self._take(job_id)
+        if job:
+            self._size -= 1
+        return job
+
+    def _take(self, job_id: int) -> Job | None:
+        for user_id, lane in self._lanes.items():
+            for entry in lane:
+                if entry[2].id == job_id:
+                    lane.remove(entry)
+                    heapq.heapify(lane)
+                    if not lane:
+                        del self._lanes[user_id]
+                        self._turns.remove(user_id)
+                    return entry[2]
+        return None
+
+
+class JobScheduler(asyncio.Queue):
+    """
+    A drop-in replacement of the jobs queue that serves the users in round-robin,
+    so a big batch of a user doesn't starve the others. Each user's jobs are served in FIFO order,
+    or smallest file first when size priority is enabled; bumped jobs are served before everything else.
+    While paused the jobs are kept and no worker takes them.
+    """
+    _queue: _FairLanes
+    _resumed: asyncio.Event
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = _FairLanes(False)
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+
+    async def get(self) -> Job:
+        while True:
+            await self._resumed.wait()
+            job: Job = await super().get()
+            if self._resumed.is_set():
+                return job
+            # Paused while waiting for a job, it stays the next one to be served
+            self._queue.push_front(job)
+
+    def set_paused(self, paused: bool) -> None:
+        """
+        This function stops or restarts serving the jobs, the running ones are not affected
+        :param paused: A control flag to hold the queued jobs
+        """
+        if paused:
+            self._resumed.clear()
+        else:
+            self._resumed.set()
+
+    def is_paused(self) -> bool:
+        """
+        This function tells if the queue is paused
+        :return: True if the jobs are held, False otherwise
+        """
+        return not self._resumed.is_set()
+
+    def _put(self, job: Job) -> None:
+        self._queue.push(job)
+
+    def _get(self) -> Job:
+        return self._queue.pop()
+
+    def set_smallest_first(self, smallest_first: bool) -> None:
+        """
+        This function enables the size priority, it only affects the jobs enqueued afterwards
+        :param smallest_first: A control flag to serve each user's smallest files first
+        """
+        self._queue.set_smallest_first(smallest_first)
+
+    def get_jobs(self) -> list[Job]:
+        """
+        This function returns the queued jobs, the bumped ones first and then the others grouped by user
+        :return: A list of Job instances
+        """
+        return list(self._queue)
+
+    def bump(self, job_id: int) -> Job | None:
+        """
+        This function moves a queued job in front of all the others
+        :param job_id: The id of the job
+        :return: The bumped Job instance, None if the job is not queued
+        """
+        return self._queue.bump(job_id)
+
+    def remove(self, job_id: int) -> Job | None:
+        """
+        This function takes a job out of the queue
+        :param job_id: The id of the job
+        :return: The removed Job instance, None if the job is not queued
+        """
+        job: Job | None = self._queue.remove(job_id)
+        if job:
+            self.task_done()
+        return job
@@ -0,0 +1,111 @@
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+from modules.models.Job import Job, JobState
+
+
+class JobStore:
+    _db_path: Path
+    _connection: sqlite3.Connection
+
+    def __init__(self, db_path: Path):
+        self._db_path = db_path
+        self._connection = sqlite3.connect(db_path)
+        self._connection.row_factory = sqlite3.Row
+        # WAL keeps the per-job writes cheap, NORMAL sync is still safe against process crashes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "chat_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "reply_id INTEGER NOT NULL, "
+            "file_name TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._migrate({"user_id": "INTEGER NOT NULL DEFAULT 0", "file_size": "INTEGER NOT NULL DEFAULT 0",
+                       "reply_chat_id": "INTEGER NOT NULL DEFAULT 0"})
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self._connection.commit()
+
+    def _migrate(self, columns: dict[str, str]) -> None:
+        """
+        This function adds to the jobs table the columns introduced after its creation
+        :param columns: A dict mapping the column names to their SQL definition
+        """
+        existing: set[str] = {row["name"] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+        for name, definition in columns.items():
+            if name not in existing:
+                self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    def add(self, chat_id: int, message_id: int, reply_chat_id: int, reply_id: int, file_name: str, user_id: int,
+            file_size: int) -> Job:
+        """
+        This function stores a new queued job
+        :param chat_id: The chat where the media message was sent
+        :param message_id: The id of the media message
+        :param reply_chat_id: The chat where the bot's status reply is sent
+        :param reply_id: The id of the bot's status reply, 0 if not sent yet
+        :param file_name: The target file name
+        :param user_id: The id of the user that requested the download
+        :param file_size: The size of the media, 0 if unknown
+        :return: The stored Job instance
+        """
+        data: dict = {"chat_id": chat_id, "message_id": message_id, "reply_chat_id": reply_chat_id,
+                      "reply_id": reply_id, "file_name": file_name, "user_id": user_id, "file_size": file_size,
+                      "state": JobState.QUEUED.value, "created_at": time.time()}
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (chat_id, message_id, reply_chat_id, reply_id, file_name, user_id, file_size, "
+                "state, created_at) VALUES (:chat_id, :message_id, :reply_chat_id, :reply_id, :file_name, :user_id, "
+                ":file_size, :state, :created_at)", data)
+        return Job({"id": cursor.lastrowid, **data})
+
+    def update_state(self, job: Job, state: JobState) -> None:
+        """
+        This function changes the state of a stored job
+        :param job: A stored Job instance
+        :param state: The new state
+        """
+        job.state = state
+        with self._connection:
+            self._connection.execute("UPDATE jobs SET state = ? WHERE id = ?", (state.value, job.id))
+
+    def update_reply(self, job: Job, reply_id: int) -> None:
+        """
+        This function changes the status reply bound to a stored job
+        :param job: A stored Job instance
+        :param reply_id: The id of the new status reply
+        """
+        job.reply_id = reply_id
+        with self._connection:
+            self._connection.execute("UPDATE jobs SET reply_id = ? WHERE id = ?", (reply_id, job.id))
+
+    def get_pending(self) -> list[Job]:
+        """
+        This function returns the jobs that were queued or downloading, in the order they were enqueued
+        :return: A list of Job instances
+        """
+        rows = self._connection.execute("SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY id",
+                                        (JobState.QUEUED.value, JobState.DOWNLOADING.value)).fetchall()
+        return [Job(dict(row)) for row in rows]
+
+    def purge_finished(self) -> None:
+        """
+        This function deletes the jobs that reached a final state
+        """
+        with self._connection:
+            cursor = self._connection.execute("DELETE FROM jobs WHERE state NOT IN (?, ?)",
+                                              (JobState.QUEUED.value, JobState.DOWNLOADING.value))
+        if cursor.rowcount:
+            logging.info(f"Purged {cursor.rowcount} finished jobs from the job store")
+
+    def close(self) -> None:
+        """
+        This function closes the database connection
+        """
+        self._connection.close()
@@ -0,0 +1,108 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from modules.models.ConfigFile import ConfigFile
+
+TEXT_FORMAT: str = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_LEVELS: list[str] = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+ROTATION_INTERVALS: list[str] = ["S", "M", "H", "D", "MIDNIGHT"] + [f'W{day}' for day in range(7)]
+# The attributes of every record, anything else has been passed with extra=
+_RECORD_ATTRIBUTES: set[str] = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as a JSON object on a single line, with the fields passed as extra=
+    (like job_id, file_size, duration, throughput) at the top level
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict = {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) +
+                       f'.{int(record.msecs):03d}', "level": record.levelname, "logger": record.name,
+                       "message": record.getMessage()}
+        entry.update((key, value) for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LogManager:
+    """
+    Sets up the logging of a process so that no handler runs on the caller's thread: the records are put in a queue
+    and a background thread writes them to the console, as text, and to a rotating log file, as JSON lines.
+    The file is appended to, so the history survives the restarts. Until configure() is called the file rotates with
+    the default settings.
+    """
+    _file_name: str
+    _queue: queue.SimpleQueue
+    _listener: QueueListener | None
+
+    def __init__(self, file_name: str):
+        """
+        :param file_name: The path of the log file
+        """
+        self._file_name = file_name
+        self._queue = queue.SimpleQueue()
+        self._listener = None
+        root: logging.Logger = logging.getLogger()
+        root.setLevel(logging.INFO)
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(self._queue))
+        self._start(self._create_file_handler(ConfigFile.TG_LOG_MAX_SIZE, ConfigFile.TG_LOG_BACKUPS,
+                                              ConfigFile.TG_LOG_ROTATE_WHEN))
+        atexit.register(self.stop)
+
+    def configure(self, level: str, max_size: int, backups: int, rotate_when: str) -> None:
+        """
+        This function applies the logging settings of the config
+        :param level: The minimum level logged, like INFO
+        :param max_size: The size in MB after which the log file is rotated, used when rotate_when is empty
+        :param backups: The number of rotated files kept
+        :param rotate_when: The rotation interval of TimedRotatingFileHandler (like midnight or H), empty to rotate
+        by size
+        """
+        logging.getLogger().setLevel(level.upper())
+        file_handler: logging.Handler = self._create_file_handler(max_size, backups, rotate_when)
+        # The pending records are written with the old handlers before the switch
+        self.stop()
+        self._start(file_handler)
+
+    def stop(self) -> None:
+        """
+        This function writes the pending records and stops the background thread
+        """
+        if self._listener:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+    def _create_file_handler(self, max_size: int, backups: int, rotate_when: str) -> logging.Handler:
+        """
+        This function creates the handler of the log file
+        :param max_size: The size in MB after which the file is rotated, used when rotate_when is empty
+        :param backups: The number of rotated files kept
+        :param rotate_when: The rotation interval, empty to rotate by size
+        :return: A rotating file handler
+        """
+        if rotate_when:
+            return TimedRotatingFileHandler(self._file_name, when=rotate_when, backupCount=backups, encoding="utf-8")
+        return RotatingFileHandler(self._file_name, maxBytes=max_size * 1024 * 1024, backupCount=backups,
+                                   encoding="utf-8")
+
+    def _start(self, file_handler: logging.Handler) -> None:
+        """
+        This function starts the background thread writing the records
+        :param file_handler: The handler of the log file
+        """
+        file_handler.setFormatter(JsonFormatter())
+        console_handler: logging.Handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        self._listener = QueueListener(self._queue, console_handler, file_handler)
+        self._listener.start()
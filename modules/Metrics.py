@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import math
+from asyncio import StreamReader, StreamWriter
+from typing import Callable
+
+# Default histogram buckets, in seconds
+TIME_BUCKETS: list[float] = [0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600]
+# Default histogram buckets, in bytes per second
+SPEED_BUCKETS: list[float] = [64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2,
+                              20 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2]
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    """
+    This function renders a set of labels in the Prometheus text format
+    :param labels: A tuple of (name, value) pairs
+    :return: The rendered labels, empty if there are none
+    """
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}" if labels else ""
+
+
+class Counter:
+    name: str
+    help: str
+    _values: dict[tuple[tuple[str, str], ...], float]
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        This function increments the counter
+        :param amount: The increment
+        :param labels: The labels of the series
+        """
+        key: tuple[tuple[str, str], ...] = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        """
+        This function returns the value of a series
+        :param labels: The labels of the series
+        :return: The current value
+        """
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> list[str]:
+        lines: list[str] = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+class Gauge:
+    name: str
+    help: str
+    _callback: Callable[[], float]
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self._callback = callback
+
+    def get(self) -> float:
+        """
+        This function reads the current value
+        :return: The value returned by the callback
+        """
+        return self._callback()
+
+    def render(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.get()}']
+
+
+class Histogram:
+    name: str
+    help: str
+    count: int
+    sum: float
+    _buckets: list[float]
+    _counts: list[int]
+
+    def __init__(self, name: str, help_text: str, buckets: list[float]):
+        self.name = name
+        self.help = help_text
+        self.count = 0
+        self.sum = 0
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+
+    def observe(self, value: float) -> None:
+        """
+        This function records a sample
+        :param value: The sample
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                self._counts[i] += 1
+                break
+
+    def get_quantile(self, quantile: float) -> float | None:
+        """
+        This function estimates a quantile as the upper bound of the bucket containing it
+        :param quantile: The quantile, between 0 and 1
+        :return: The estimated value, None if there are no samples, inf if it exceeds the largest bucket
+        """
+        if not self.count:
+            return None
+        cumulative: int = 0
+        for bound, count in zip(self._buckets, self._counts):
+            cumulative += count
+            if cumulative >= quantile * self.count:
+                return bound
+        return math.inf
+
+    def render(self) -> list[str]:
+        lines: list[str] = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        cumulative: int = 0
+        for bound, count in zip(self._buckets, self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{self.name}_sum {self.sum}')
+        lines.append(f'{self.name}_count {self.count}')
+        return lines
+
+
+class Metrics:
+    """
+    A minimal metrics registry exposed in the Prometheus text format by a small HTTP server
+    """
+    _metrics: list[Counter | Gauge | Histogram]
+    _server: asyncio.Server | None
+
+    def __init__(self):
+        self._metrics = []
+        self._server = None
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        """
+        This function registers a counter
+        :param name: The metric name
+        :param help_text: The metric description
+        :return: The Counter instance
+        """
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        """
+        This function registers a gauge whose value is read when scraped
+        :param name: The metric name
+        :param help_text: The metric description
+        :param callback: A function returning the current value
+        :return: The Gauge instance
+        """
+        metric = Gauge(name, help_text, callback)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: list[float]) -> Histogram:
+        """
+        This function registers a histogram
+        :param name: The metric name
+        :param help_text: The metric description
+        :param buckets: The upper bounds of the buckets, sorted
+        :return: The Histogram instance
+        """
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        This function renders all the metrics in the Prometheus text format
+        :return: The metrics page
+        """
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def start_server(self, host: str, port: int) -> None:
+        """
+        This function starts serving the metrics on http://<host>:<port>/metrics
+        :param host: The address to bind, like 127.0.0.1
+        :param port: The TCP port
+        """
+        self._server = await asyncio.start_server(self._handle_request, host, port)
+        logging.info(f"Metrics available on {host}:{port}")
+
+    async def stop_server(self) -> None:
+        """
+        This function stops the metrics server
+        """
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_request(self, reader: StreamReader, writer: StreamWriter) -> None:
+        """
+        This function answers a single HTTP request
+        :param reader: The connection's reader
+        :param writer: The connection's writer
+        """
+        try:
+            request_line: bytes = await asyncio.wait_for(reader.readline(), timeout=5)
+            parts: list[str] = request_line.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render()
+            else:
+                status, body = "404 Not Found", "Not Found\n"
+            payload: bytes = body.encode()
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode() + payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
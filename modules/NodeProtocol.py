@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import stat
+from asyncio import StreamReader, StreamWriter, AbstractServer
+from typing import Callable, Awaitable
+
+# The frames are JSON objects, one per line
+FRAME_LIMIT: int = 1024 * 1024
+
+
+def parse_address(address: str) -> tuple[str, str, int]:
+    """
+    This function parses the address of the coordinator
+    :param address: unix:/path/to/socket or host:port
+    :return: A tuple with the transport (unix or tcp), the path or host and the port (0 for unix sockets)
+    :raise ValueError: If the address is malformed
+    """
+    if address.startswith("unix:"):
+        path: str = address[len("unix:"):]
+        if not path:
+            raise ValueError("The unix socket path can't be empty")
+        return "unix", path, 0
+    host, separator, port = address.rpartition(":")
+    if not separator or not port.isdigit() or not 0 < int(port) <= 65535:
+        raise ValueError(f'The address {address} must be unix:/path or host:port')
+    return "tcp", host.strip("[]") or "0.0.0.0", int(port)
+
+
+class NodeConnection:
+    """
+    A connection between the coordinator and a worker node, exchanging JSON frames
+    """
+    _reader: StreamReader
+    _writer: StreamWriter
+    _lock: asyncio.Lock
+
+    def __init__(self, reader: StreamReader, writer: StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        # Concurrent drains aren't supported on every Python version
+        self._lock = asyncio.Lock()
+
+    def get_peer(self) -> str:
+        """
+        This function returns the remote address of the connection
+        :return: The host:port of a TCP peer, the socket path otherwise
+        """
+        peer = self._writer.get_extra_info("peername")
+        return f'{peer[0]}:{peer[1]}' if isinstance(peer, tuple) else str(peer or "unix socket")
+
+    async def send(self, frame: dict) -> None:
+        """
+        This function sends a frame, waiting for the socket buffer to drain
+        :param frame: The frame to send
+        """
+        async with self._lock:
+            self._writer.write(json.dumps(frame).encode() + b"\n")
+            await self._writer.drain()
+
+    def send_nowait(self, frame: dict) -> None:
+        """
+        This function sends a frame without waiting, usable while a task is being cancelled
+        :param frame: The frame to send
+        """
+        if not self._writer.is_closing():
+            self._writer.write(json.dumps(frame).encode() + b"\n")
+
+    async def receive(self) -> dict | None:
+        """
+        This function waits for the next frame
+        :return: The received frame, None if the connection has been closed
+        :raise ValueError: If the peer sent a malformed frame
+        """
+        try:
+            line: bytes = await self._reader.readline()
+        except ConnectionError:
+            return None
+        if not line:
+            return None
+        frame = json.loads(line)
+        if not isinstance(frame, dict):
+            raise ValueError("A frame must be a JSON object")
+        return frame
+
+    def close(self) -> None:
+        """
+        This function closes the connection
+        """
+        self._writer.close()
+
+
+async def open_connection(address: str) -> NodeConnection:
+    """
+    This function connects to the coordinator
+    :param address: unix:/path/to/socket or host:port
+    :return: The NodeConnection instance
+    """
+    transport, host, port = parse_address(address)
+    if transport == "unix":
+        reader, writer = await asyncio.open_unix_connection(host, limit=FRAME_LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=FRAME_LIMIT)
+    return NodeConnection(reader, writer)
+
+
+async def start_server(address: str, handler: Callable[[NodeConnection], Awaitable[None]]) -> AbstractServer:
+    """
+    This function starts accepting the worker nodes
+    :param address: unix:/path/to/socket or host:port
+    :param handler: The coroutine serving each connection
+    :return: The server instance
+    """
+    async def serve(reader: StreamReader, writer: StreamWriter) -> None:
+        connection: NodeConnection = NodeConnection(reader, writer)
+        try:
+            await handler(connection)
+        finally:
+            connection.close()
+
+    transport, host, port = parse_address(address)
+    if transport == "unix":
+        # The socket left by a previous run would make the bind fail
+        if os.path.exists(host) and stat.S_ISSOCK(os.stat(host).st_mode):
+            os.remove(host)
+        return await asyncio.start_unix_server(serve, host, limit=FRAME_LIMIT)
+    return await asyncio.start_server(serve, host, port, limit=FRAME_LIMIT)
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import logging
+import os
+import signal
+import subprocess
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the blocks read when hashing a file after its download
+READ_BLOCK_SIZE: int = 4 * 1024 * 1024
+# Maximum time a hook can run before being killed
+HOOK_TIMEOUT: float = 3600
+ARCHIVE_EXTENSIONS: tuple[str, ...] = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+class PostStage:
+    """
+    A step applied to each downloaded file. Stages run in order in a worker thread, they can read the results of the
+    previous ones and add their own to the context.
+    """
+    name: str = ""
+
+    def run(self, file_path: str, context: dict) -> str | None:
+        """
+        This function processes a downloaded file
+        :param file_path: The path of the downloaded file
+        :param context: The job details and the results of the previous stages
+        :return: A short outcome shown to the user, None if there is nothing to report
+        """
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        """
+        This function interrupts the running work of the stage, it is called on shutdown
+        """
+
+
+class HashStage(PostStage):
+    """
+    Computes the SHA-256 of the file, unless it was already computed while downloading
+    """
+    name = "hash"
+
+    def run(self, file_path: str, context: dict) -> str | None:
+        if not context.get("sha256"):
+            sha256 = hashlib.sha256()
+            with open(file_path, "rb") as file:
+                while block := file.read(READ_BLOCK_SIZE):
+                    sha256.update(block)
+            context["sha256"] = sha256.hexdigest()
+        return f'SHA-256 {context["sha256"]}'
+
+
+class ExtractStage(PostStage):
+    """
+    Extracts zip and tar archives in a folder named after the archive, the archive itself is kept
+    """
+    name = "extract"
+
+    def run(self, file_path: str, context: dict) -> str | None:
+        lower_path: str = file_path.lower()
+        extension: str | None = next((ext for ext in ARCHIVE_EXTENSIONS if lower_path.endswith(ext)), None)
+        if not extension:
+            return None
+        destination: str = os.path.realpath(file_path[:-len(extension)])
+        if extension == ".zip":
+            with zipfile.ZipFile(file_path) as archive:
+                members: list[str] = archive.namelist()
+                self._check_members(destination, members)
+                archive.extractall(destination)
+        else:
+            with tarfile.open(file_path) as archive:
+                tar_members: list[tarfile.TarInfo] = [member for member in archive.getmembers()
+                                                      if member.isfile() or member.isdir()]
+                self._check_members(destination, [member.name for member in tar_members])
+                archive.extractall(destination, members=tar_members)
+                members = [member.name for member in tar_members]
+        context["extracted_path"] = destination
+        return f'{len(members)} entries extracted in {os.path.basename(destination)}'
+
+    @staticmethod
+    def _check_members(destination: str, names: list[str]) -> None:
+        """
+        This function rejects the archives with entries pointing outside the destination folder
+        :param destination: The extraction folder
+        :param names: The names of the archive's entries
+        :raise ValueError: If an entry escapes the destination folder
+        """
+        for name in names:
+            path: str = os.path.realpath(os.path.join(destination, name))
+            if path != destination and not path.startswith(destination + os.sep):
+                raise ValueError(f'The archive entry {name} points outside the extraction folder')
+
+
+class HookStage(PostStage):
+    """
+    Runs a user-defined shell command, the file details are passed as environment variables.
+    The running commands are killed on shutdown, with the processes they started.
+    """
+    name = "hook"
+    _command: str
+    _processes: set[subprocess.Popen]
+    _lock: threading.Lock
+    _stopped: bool
+
+    def __init__(self, command: str):
+        self._command = command
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def run(self, file_path: str, context: dict) -> str | None:
+        env: dict[str, str] = {**os.environ, "TG_FILE_PATH": os.path.abspath(file_path)}
+        for key, value in context.items():
+            if value is not None:
+                env[f'TG_{key.upper()}'] = str(value)
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("The hook was not run, stopping")
+            # A session of its own, so the shell and its children are killed together
+            process = subprocess.Popen(self._command, shell=True, env=env, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, text=True, start_new_session=True)
+            self._processes.add(process)
+        try:
+            _, stderr = process.communicate(timeout=HOOK_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._kill(process)
+            process.communicate()
+            raise
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        if self._stopped:
+            raise RuntimeError("The hook was killed, stopping")
+        if process.returncode:
+            raise RuntimeError(f'The hook exited with code {process.returncode}: {stderr.strip()[-200:]}')
+        return "hook completed"
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            for process in self._processes:
+                self._kill(process)
+
+    @staticmethod
+    def _kill(process: subprocess.Popen) -> None:
+        """
+        This function kills a hook with the processes it started
+        :param process: The shell running the hook
+        """
+        if process.poll() is not None:
+            # It already exited, its process group id may belong to another process by now
+            return
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except OSError:
+            pass
+
+
+class PostProcessor:
+    """
+    Runs the post-download stages of each file in a bounded thread pool, so hashing, extraction and hooks never block
+    the event loop driving the downloads. A failing stage stops the following ones for that file only.
+    """
+    _stages: list[PostStage]
+    _executor: ThreadPoolExecutor
+    _hash_executor: ThreadPoolExecutor
+
+    def __init__(self, workers: int, stages: list[PostStage]):
+        self._stages = stages
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="post")
+        # A separate pool, so a long extraction never stalls the downloads feeding their hashers
+        self._hash_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+
+    @staticmethod
+    def create_stages(hash_files: bool, extract: bool, hook: str) -> list[PostStage]:
+        """
+        This function builds the stages enabled by the configuration
+        :param hash_files: A control flag to compute the SHA-256 of the files
+        :param extract: A control flag to extract the archives
+        :param hook: A shell command run on each file, empty to disable it
+        :return: The list of stages in execution order
+        """
+        stages: list[PostStage] = []
+        if hash_files:
+            stages.append(HashStage())
+        if extract:
+            stages.append(ExtractStage())
+        if hook:
+            stages.append(HookStage(hook))
+        return stages
+
+    def get_hash_executor(self) -> ThreadPoolExecutor:
+        """
+        This function returns the pool hashing the chunks while they are downloaded
+        :return: The ThreadPoolExecutor instance
+        """
+        return self._hash_executor
+
+    def is_hashing(self) -> bool:
+        """
+        This function tells if the files are hashed, so the download can compute the hash while streaming
+        :return: True if the hash stage is enabled, False otherwise
+        """
+        return any(isinstance(stage, HashStage) for stage in self._stages)
+
+    async def process(self, file_path: str, context: dict) -> list[str]:
+        """
+        This function applies all the stages to a downloaded file
+        :param file_path: The path of the downloaded file
+        :param context: The job details, updated with the results of the stages
+        :return: The outcomes of the stages
+        """
+        if not self._stages:
+            return []
+        return await asyncio.get_event_loop().run_in_executor(self._executor, self._run, list(self._stages),
+                                                              file_path, context)
+
+    @staticmethod
+    def _run(stages: list[PostStage], file_path: str, context: dict) -> list[str]:
+        """
+        This function runs the stages in the current thread
+        :param stages: The stages to run
+        :param file_path: The path of the downloaded file
+        :param context: The job details, updated with the results of the stages
+        :return: The outcomes of the stages
+        """
+        outcomes: list[str] = []
+        for stage in stages:
+            try:
+                outcome: str | None = stage.run(file_path, context)
+            except Exception as e:
+                logging.error(f'{os.path.basename(file_path)} - Post-processing stage {stage.name} failed: {e}')
+                outcomes.append(f'{stage.name} failed: {e}')
+                break
+            if outcome:
+                logging.info(f'{os.path.basename(file_path)} - {outcome}')
+                outcomes.append(outcome)
+        return outcomes
+
+    def close(self) -> None:
+        """
+        This function stops the pool, the queued files are dropped and the running hooks are killed, so the shutdown
+        only waits for the hashing and extractions in progress
+        """
+        for stage in self._stages:
+            stage.stop()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._hash_executor.shutdown(wait=True, cancel_futures=True)
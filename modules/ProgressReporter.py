@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from asyncio import Task
+
+from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.types import Message
+
+from modules.helpers import format_size, format_duration
+
+
+class _Progress:
+    reply: Message
+    current: int
+    total: int
+    started_at: float
+    start_bytes: int
+    title: str
+    # A fixed status shown in place of the progress
+    text: str | None
+    last_text: str
+
+    def __init__(self, reply: Message, current: int, total: int):
+        self.reply = reply
+        self.current = current
+        self.total = total
+        self.title = ""
+        self.text = None
+        self.started_at = time.monotonic()
+        # A resumed download starts from a non-zero offset, it must not count in the speed
+        self.start_bytes = current
+        self.last_text = reply.text or ""
+
+
+class ProgressReporter:
+    """
+    Collects the progress of all the downloads and edits the status replies on a global budget.
+    Only the latest state of each reply is kept, the replies are refreshed in round-robin order.
+    """
+    _interval: float
+    _progresses: dict[tuple[int, int], _Progress]
+    _dirty: dict[tuple[int, int], None]
+    _wakeup: asyncio.Event
+    _edit_lock: asyncio.Lock
+    # Monotonic time until which no edit is sent, set by a FloodWait
+    _paused_until: float
+    _task: Task | None
+
+    def __init__(self, edits_per_second: float):
+        self._interval = 1 / edits_per_second
+        self._progresses = {}
+        self._dirty = {}
+        self._wakeup = asyncio.Event()
+        self._edit_lock = asyncio.Lock()
+        self._paused_until = 0
+        self._task = None
+
+    def set_rate(self, edits_per_second: float) -> None:
+        """
+        This function changes the global edits budget
+        :param edits_per_second: The maximum number of edits per second
+        """
+        self._interval = 1 / edits_per_second
+
+    def start(self) -> None:
+        """
+        This function starts the flushing loop
+        """
+        self._task = asyncio.get_event_loop_policy().get_event_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        """
+        This function stops the flushing loop
+        """
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def update(self, reply: Message, current: int, total: int, title: str = "") -> None:
+        """
+        This function records the progress of a download, it never calls Telegram
+        :param reply: The status reply of the download
+        :param current: The downloaded bytes
+        :param total: The size of the file
+        :param title: An optional line shown above the progress
+        """
+        key: tuple[int, int] = (reply.chat.id, reply.id)
+        progress: _Progress | None = self._progresses.get(key)
+        if not progress:
+            progress = self._progresses[key] = _Progress(reply, current, total)
+        progress.current = current
+        progress.total = total
+        progress.title = title
+        progress.text = None
+        self._dirty[key] = None
+        self._wakeup.set()
+
+    def show(self, reply: Message, text: str) -> None:
+        """
+        This function queues a status text for a reply, on the same budget of the progress updates. Only the last
+        text of each reply is sent, so a bulk operation touching many jobs of a batch edits its reply once.
+        :param reply: The status reply
+        :param text: The status text
+        """
+        key: tuple[int, int] = (reply.chat.id, reply.id)
+        progress: _Progress | None = self._progresses.get(key)
+        if not progress:
+            progress = self._progresses[key] = _Progress(reply, 0, 0)
+        progress.text = text
+        self._dirty[key] = None
+        self._wakeup.set()
+
+    async def finish(self, reply: Message) -> None:
+        """
+        This function stops tracking a download, when it returns no progress edit can overwrite the reply anymore
+        :param reply: The status reply of the download
+        """
+        key: tuple[int, int] = (reply.chat.id, reply.id)
+        self._progresses.pop(key, None)
+        self._dirty.pop(key, None)
+        # Wait for an in-flight edit of the same reply
+        async with self._edit_lock:
+            pass
+
+    @staticmethod
+    def get_text(progress: _Progress) -> str:
+        """
+        This function renders the status text of a download
+        :param progress: The download progress
+        :return: The status text
+        """
+        if progress.text is not None:
+            return progress.text
+        status: int = int(progress.current * 100 / progress.total) if progress.total else 0
+        elapsed: float = time.monotonic() - progress.started_at
+        speed: float = (progress.current - progress.start_bytes) / elapsed if elapsed > 0 else 0
+        text: str = f'{progress.title}\nDownloading: {status}%' if progress.title else f'Downloading: {status}%'
+        if speed > 0:
+            eta: float = (progress.total - progress.current) / speed
+            text += f'\n{format_size(speed)}/s - ETA {format_duration(eta)}'
+        return text
+
+    async def _run(self) -> None:
+        """
+        The flushing loop, it edits at most one reply per interval
+        """
+        while True:
+            await self._wakeup.wait()
+            if not self._dirty:
+                self._wakeup.clear()
+                continue
+            # Waited without holding the edit lock, so finish() never waits for a FloodWait
+            if (delay := self._paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+                continue
+            key: tuple[int, int] = next(iter(self._dirty))
+            del self._dirty[key]
+            progress: _Progress = self._progresses[key]
+            text: str = self.get_text(progress)
+            if text != progress.last_text:
+                async with self._edit_lock:
+                    try:
+                        if key in self._progresses:
+                            await progress.reply.edit(text)
+                            progress.last_text = text
+                    except MessageNotModified:
+                        progress.last_text = text
+                    except FloodWait as e:
+                        logging.warning(f'Progress updates hit a FloodWait, pausing them for {e.value} seconds')
+                        self._paused_until = time.monotonic() + e.value
+                        if key in self._progresses:
+                            # Sent again once the wait is over
+                            self._dirty[key] = None
+                    except Exception as e:
+                        logging.error(f'Unable to update a download progress, error:\n {e}')
+                await asyncio.sleep(self._interval)
+            # A status is sent once, unless a download took the reply over meanwhile
+            if progress.text is not None and key not in self._dirty and self._progresses.get(key) is progress:
+                del self._progresses[key]
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from datetime import datetime
+
+from modules.helpers import parse_rate_schedule
+
+
+class TokenBucket:
+    """
+    A token bucket allowing bursts of one second, a rate of 0 means unlimited
+    """
+    _rate: float
+    _tokens: float
+    _updated_at: float
+    _lock: asyncio.Lock
+
+    def __init__(self, rate: float):
+        self._rate = rate
+        self._tokens = rate
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        """
+        This function changes the rate of the bucket
+        :param rate: The new rate in bytes per second
+        """
+        if rate != self._rate:
+            self._rate = rate
+            self._tokens = min(self._tokens, rate)
+
+    async def consume(self, amount: int) -> None:
+        """
+        This function takes tokens from the bucket, waiting until the debt is paid back
+        :param amount: The number of bytes
+        """
+        if self._rate <= 0:
+            return
+        # The lock makes the consumers wait in turn, a request bigger than the bucket goes in debt
+        async with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(self._rate, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            self._tokens -= amount
+            if self._tokens < 0:
+                await asyncio.sleep(-self._tokens / self._rate)
+
+
+class RateLimiter:
+    """
+    Limits the download bandwidth with a global bucket shared by all the jobs and a bucket for each job.
+    The global limit can change during the day following a schedule.
+    """
+    _limit: int
+    _job_limit: int
+    _schedule: list[tuple[int, int, int]]
+    _global: TokenBucket
+    _consumed: int
+
+    def __init__(self, limit: int, job_limit: int, schedule: str):
+        self._limit = limit
+        self._job_limit = job_limit
+        self._schedule = parse_rate_schedule(schedule)
+        self._global = TokenBucket(self.get_current_limit() * 1024)
+        self._consumed = 0
+
+    def set_limit(self, limit: int) -> None:
+        """
+        This function changes the global limit used outside the scheduled time ranges
+        :param limit: The limit in KB/s, 0 means unlimited
+        """
+        self._limit = limit
+
+    def set_job_limit(self, job_limit: int) -> None:
+        """
+        This function changes the limit of each job, it affects the jobs started afterwards
+        :param job_limit: The limit in KB/s, 0 means unlimited
+        """
+        self._job_limit = job_limit
+
+    def set_schedule(self, schedule: str) -> None:
+        """
+        This function changes the time ranges with a custom global limit
+        :param schedule: A schedule in the HH:MM-HH:MM=KB/s format, separated by comma
+        """
+        self._schedule = parse_rate_schedule(schedule)
+
+    def get_current_limit(self) -> int:
+        """
+        This function returns the global limit for the current time of day
+        :return: The limit in KB/s, 0 means unlimited
+        """
+        now = datetime.now()
+        minute: int = now.hour * 60 + now.minute
+        for start, end, limit in self._schedule:
+            if start <= minute < end or (end <= start and (minute >= start or minute < end)):
+                return limit
+        return self._limit
+
+    def create_job_bucket(self) -> TokenBucket:
+        """
+        This function creates the bucket limiting a single job
+        :return: A TokenBucket instance
+        """
+        return TokenBucket(self._job_limit * 1024)
+
+    async def consume(self, amount: int, job_bucket: TokenBucket) -> None:
+        """
+        This function waits until the job is allowed to download the given amount of bytes
+        :param amount: The number of bytes
+        :param job_bucket: The bucket of the job
+        """
+        await job_bucket.consume(amount)
+        self._global.set_rate(self.get_current_limit() * 1024)
+        await self._global.consume(amount)
+        self._consumed += amount
+
+    def get_consumed(self) -> int:
+        """
+        This function returns the bytes let through since the start, every local download goes through the limiter
+        :return: The number of bytes
+        """
+        return self._consumed
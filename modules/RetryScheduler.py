@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import random
+from asyncio import TimerHandle
+from typing import Callable
+
+from pyrogram.errors import FloodWait, InternalServerError, ServiceUnavailable, SeeOther, FileReferenceExpired, \
+    FileReferenceInvalid
+
+from modules.Coordinator import RemoteJobError
+from modules.DownloadEngine import DownloadInterrupted
+from modules.models.Job import Job
+
+# Errors worth another attempt, everything else (bad requests, missing permissions...) fails the job immediately
+RETRYABLE_ERRORS: tuple = (FloodWait, InternalServerError, ServiceUnavailable, SeeOther, FileReferenceExpired,
+                           FileReferenceInvalid, ConnectionError, DownloadInterrupted)
+BASE_DELAY: float = 5
+MAX_DELAY: float = 300
+
+
+class RetryScheduler:
+    """
+    Re-enqueues the jobs that failed with a transient error after a backoff delay.
+    The delay is waited on a timer, so the worker is free to process other jobs meanwhile.
+    """
+    _max_attempts: int
+    _pending: dict[int, tuple[TimerHandle, Job]]
+
+    def __init__(self, max_attempts: int):
+        self._max_attempts = max_attempts
+        self._pending = {}
+
+    def get_max_attempts(self) -> int:
+        """
+        This function returns the maximum number of attempts for a job
+        :return: The maximum number of attempts
+        """
+        return self._max_attempts
+
+    def get_pending_count(self) -> int:
+        """
+        This function returns the number of jobs waiting for a new attempt
+        :return: The number of scheduled attempts
+        """
+        return len(self._pending)
+
+    def should_retry(self, job: Job, error: BaseException) -> bool:
+        """
+        This function checks if a failed job can be attempted again
+        :param job: The failed job
+        :param error: The error raised by the download
+        :return: True if the error is transient and the job has attempts left, False otherwise
+        """
+        retryable: bool = isinstance(error, RETRYABLE_ERRORS) or (isinstance(error, RemoteJobError) and error.retryable)
+        return retryable and job.attempts + 1 < self._max_attempts
+
+    def get_delay(self, job: Job, error: BaseException) -> float:
+        """
+        This function computes how long to wait before the next attempt of a job
+        :param job: The failed job
+        :param error: The error raised by the download
+        :return: The delay in seconds
+        """
+        if isinstance(error, FloodWait):
+            # Telegram tells exactly how long to wait, the jitter avoids all the jobs waking up together
+            return error.value + random.uniform(1, 5)
+        return random.uniform(0.5, 1.5) * min(MAX_DELAY, BASE_DELAY * 2 ** job.attempts)
+
+    def schedule(self, job: Job, error: BaseException, enqueue: Callable[[Job], None]) -> float:
+        """
+        This function schedules the next attempt of a job
+        :param job: The failed job
+        :param error: The error raised by the download
+        :param enqueue: The function that puts the job back in the queue
+        :return: The delay in seconds before the job is enqueued again
+        """
+        delay: float = self.get_delay(job, error)
+        job.attempts += 1
+
+        def wake_up() -> None:
+            self._pending.pop(job.id, None)
+            logging.info(f'{job.file_name} - Enqueueing attempt {job.attempts + 1}/{self._max_attempts}')
+            enqueue(job)
+
+        handle: TimerHandle = asyncio.get_event_loop().call_later(delay, wake_up)
+        self._pending[job.id] = (handle, job)
+        return delay
+
+    def is_pending(self, job_id: int) -> bool:
+        """
+        This function tells if a job is waiting for its next attempt
+        :param job_id: The id of the job
+        :return: True if an attempt is scheduled, False otherwise
+        """
+        return job_id in self._pending
+
+    def cancel(self, job_id: int) -> Job | None:
+        """
+        This function cancels the scheduled attempt of a job
+        :param job_id: The id of the job
+        :return: The job that was waiting, None if no attempt was scheduled
+        """
+        handle, job = self._pending.pop(job_id, (None, None))
+        if handle:
+            handle.cancel()
+        return job
@@ -0,0 +1,226 @@
+import asyncio
+import inspect
+import logging
+import os
+import random
+from typing import Callable, AsyncIterator
+
+from pyrogram.enums import MessageMediaType
+from pyrogram.errors import FloodWait, InternalServerError
+from pyrogram.file_id import FileId, FileType
+
+from modules.DownloadEngine import DownloadEngine, CHUNK_SIZE
+from modules.RateLimiter import TokenBucket
+
+# Returned by every chunk request, a view avoids copying a megabyte for each chunk
+_PAYLOAD: memoryview = memoryview(bytes(CHUNK_SIZE))
+# Pyrogram sleeps through the FloodWaits shorter than this threshold instead of raising them
+SLEEP_THRESHOLD: float = 30
+
+
+class SimulatedFileServer:
+    """
+    A local stand-in for the Telegram file servers, serving zero-filled files in 1 MiB chunks.
+    Each request waits a fixed latency plus the transfer time at the bandwidth of a single connection, all the
+    requests share the bandwidth of the server. FloodWaits and server errors are injected at random.
+    """
+    requests: int
+    flood_waits: int
+    flood_wait_seconds: float
+    failures: int
+    _latency: float
+    _connection_bandwidth: float
+    _bandwidth: TokenBucket
+    _flood_wait_rate: float
+    _flood_wait: float
+    _failure_rate: float
+    _time_scale: float
+    _random: random.Random
+    _files: dict[int, int]
+
+    def __init__(self, latency: float, connection_bandwidth: float, server_bandwidth: float, flood_wait_rate: float,
+                 flood_wait: float, failure_rate: float, time_scale: float, seed: int):
+        """
+        :param latency: The latency of a request in seconds
+        :param connection_bandwidth: The bandwidth of a single connection in bytes per second
+        :param server_bandwidth: The bandwidth shared by all the connections in bytes per second, 0 means unlimited
+        :param flood_wait_rate: The probability of a request hitting a FloodWait
+        :param flood_wait: The FloodWait duration in seconds, as told by Telegram
+        :param failure_rate: The probability of a request failing with a server error
+        :param time_scale: The factor applied to the FloodWait durations actually waited
+        :param seed: The seed of the injected errors
+        """
+        self.requests = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self.failures = 0
+        self._latency = latency
+        self._connection_bandwidth = connection_bandwidth
+        self._bandwidth = TokenBucket(server_bandwidth)
+        self._flood_wait_rate = flood_wait_rate
+        self._flood_wait = flood_wait
+        self._failure_rate = failure_rate
+        self._time_scale = time_scale
+        self._random = random.Random(seed)
+        self._files = {}
+
+    def add_file(self, file_size: int) -> int:
+        """
+        This function stores a new file on the server
+        :param file_size: The size of the file in bytes
+        :return: The media id of the file
+        """
+        media_id: int = len(self._files) + 1
+        self._files[media_id] = file_size
+        return media_id
+
+    async def get_chunk(self, media_id: int, index: int) -> memoryview:
+        """
+        This function serves a chunk of a file, like upload.GetFile
+        :param media_id: The media id of the file
+        :param index: The index of the chunk
+        :return: The bytes of the chunk
+        :raise FloodWait: If the injected FloodWait is longer than the sleep threshold
+        :raise InternalServerError: If a server error is injected
+        """
+        self.requests += 1
+        draw: float = self._random.random()
+        if draw < self._flood_wait_rate:
+            self.flood_waits += 1
+            self.flood_wait_seconds += self._flood_wait
+            if self._flood_wait > SLEEP_THRESHOLD:
+                raise FloodWait(value=int(self._flood_wait))
+            await asyncio.sleep(self._flood_wait * self._time_scale)
+        elif draw < self._flood_wait_rate + self._failure_rate:
+            self.failures += 1
+            await asyncio.sleep(self._latency)
+            raise InternalServerError()
+        size: int = min(CHUNK_SIZE, self._files[media_id] - index * CHUNK_SIZE)
+        await self._bandwidth.consume(size)
+        await asyncio.sleep(self._latency + size / self._connection_bandwidth)
+        return _PAYLOAD[:size]
+
+
+class _SimulatedChat:
+    id: int
+
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class _SimulatedDocument:
+    file_id: str
+    file_unique_id: str
+    file_size: int
+    file_name: str
+
+    def __init__(self, media_id: int, file_size: int):
+        self.file_id = FileId(file_type=FileType.DOCUMENT, dc_id=2, media_id=media_id, access_hash=0,
+                              file_reference=b"").encode()
+        self.file_unique_id = f'simulated_{media_id}'
+        self.file_size = file_size
+        self.file_name = f'simulated_{media_id}.bin'
+
+
+class SimulatedMessage:
+    """
+    A document message hosted by the simulated server, its download mimics Pyrogram's single stream download
+    """
+    id: int
+    chat: _SimulatedChat
+    media: MessageMediaType
+    document: _SimulatedDocument
+    _server: SimulatedFileServer
+
+    def __init__(self, server: SimulatedFileServer, file_size: int):
+        media_id: int = server.add_file(file_size)
+        self.id = media_id
+        self.chat = _SimulatedChat(1)
+        self.media = MessageMediaType.DOCUMENT
+        self.document = _SimulatedDocument(media_id, file_size)
+        self._server = server
+
+    async def stream(self) -> AsyncIterator[memoryview]:
+        """
+        This function streams the file chunk by chunk over a single connection, like Pyrogram's stream_media
+        :return: An async iterator of the chunks, it ends early if the download fails
+        """
+        try:
+            for index in range((self.document.file_size + CHUNK_SIZE - 1) // CHUNK_SIZE):
+                yield await self._server.get_chunk(self.id, index)
+        except Exception as e:
+            # Pyrogram logs and swallows the transfer errors
+            logging.debug(f'{self.document.file_name} - Simulated download failed: {e}')
+
+    async def download(self, file_name: str, progress: Callable | None = None, progress_args: tuple = ()) -> str | None:
+        """
+        This function downloads the file chunk by chunk over a single connection
+        :param file_name: The destination path
+        :param progress: The progress callback, awaited before requesting the next chunk
+        :param progress_args: Extra arguments passed to the progress callback
+        :return: The destination path, None if the download failed
+        """
+        file_size: int = self.document.file_size
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), exist_ok=True)
+        with open(file_name, "wb") as file:
+            async for chunk in self.stream():
+                file.write(chunk)
+                if progress:
+                    if inspect.iscoroutinefunction(progress):
+                        await progress(file.tell(), file_size, *progress_args)
+                    else:
+                        progress(file.tell(), file_size, *progress_args)
+            received: int = file.tell()
+        if received != file_size:
+            os.remove(file_name)
+            return None
+        return file_name
+
+
+class SimulatedReply:
+    """
+    A status reply counting the edits sent to the Bot API
+    """
+    id: int
+    chat: _SimulatedChat
+    text: str
+    edits: int
+    _latency: float
+
+    def __init__(self, reply_id: int, latency: float):
+        self.id = reply_id
+        self.chat = _SimulatedChat(1)
+        self.text = ""
+        self.edits = 0
+        self._latency = latency
+
+    async def edit(self, text: str) -> "SimulatedReply":
+        """
+        This function simulates the edit of the reply
+        :param text: The new text
+        :return: The edited reply
+        """
+        self.edits += 1
+        await asyncio.sleep(self._latency)
+        self.text = text
+        return self
+
+
+class SimulatedDownloadEngine(DownloadEngine):
+    """
+    The download engine fetching its chunks from the simulated server instead of the Telegram media sessions
+    """
+    _server: SimulatedFileServer
+
+    def __init__(self, server: SimulatedFileServer, connections: int, resume: bool, rate_limiter):
+        super().__init__(None, connections, resume, rate_limiter)
+        self._server = server
+
+    async def _get_chunk(self, dc_id: int, location, index: int) -> bytes:
+        return await self._server.get_chunk(location.id, index)
+
+    async def _get_sessions(self, dc_id: int) -> list:
+        return []
+
+    def _stream(self, message: SimulatedMessage) -> AsyncIterator[memoryview]:
+        return message.stream()
@@ -0,0 +1,63 @@
+import logging
+import os
+import time
+
+
+def _get_process_age() -> float | None:
+    """
+    This function computes how long ago the process started, so the time spent importing is counted too
+    :return: The age in seconds, None if the platform doesn't expose it
+    """
+    try:
+        with open("/proc/self/stat") as stat_fp:
+            # The command name may contain spaces, the fields after it are fixed
+            start_ticks: int = int(stat_fp.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime_fp:
+            uptime: float = float(uptime_fp.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfiler:
+    """
+    Logs the time elapsed since the process started at each step of the startup, when enabled
+    """
+    _enabled: bool
+    _origin: float
+    _last: float
+    _steps: list[tuple[str, float]]
+
+    def __init__(self, enabled: bool):
+        self._enabled = enabled
+        now: float = time.monotonic()
+        # Without /proc the imports done before this point are not counted
+        self._origin = now - (_get_process_age() or 0) if enabled else now
+        self._last = self._origin
+        self._steps = []
+
+    def is_enabled(self) -> bool:
+        """
+        This function tells if the startup is being profiled
+        :return: True if enabled, False otherwise
+        """
+        return self._enabled
+
+    def mark(self, step: str) -> None:
+        """
+        This function records the end of a startup step
+        :param step: The name of the step
+        """
+        if not self._enabled:
+            return
+        now: float = time.monotonic()
+        self._steps.append((step, now - self._last))
+        logging.info(f'Startup profile - {step}: +{now - self._last:.3f}s (total {now - self._origin:.3f}s)')
+        self._last = now
+
+    def get_report(self) -> str:
+        """
+        This function summarizes the recorded steps
+        :return: A line with the duration of each step
+        """
+        return ", ".join(f'{step} {duration:.3f}s' for step, duration in self._steps)
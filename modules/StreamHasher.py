@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import math
+from concurrent.futures import Executor
+
+# Chunks kept in memory waiting for a slower one, beyond them the file is hashed after the download
+MAX_BUFFERED_CHUNKS: int = 32
+
+
+class StreamHasher:
+    """
+    Computes the SHA-256 of a file while its chunks are downloaded, so the file doesn't need to be read again.
+    The chunks can arrive out of order: the ones ahead of the hashed prefix are buffered, when the buffer grows too
+    much the streaming is given up and the file must be hashed after the download.
+    """
+    _executor: Executor
+    _chunks: int
+    _max_buffered: int
+    _hash: "hashlib._Hash"
+    _next: int
+    _buffer: dict[int, bytes]
+    _lock: asyncio.Lock
+    _valid: bool
+
+    def __init__(self, executor: Executor, file_size: int, chunk_size: int, max_buffered: int = MAX_BUFFERED_CHUNKS):
+        self._executor = executor
+        self._chunks = math.ceil(file_size / chunk_size)
+        self._max_buffered = max_buffered
+        self._hash = hashlib.sha256()
+        self._next = 0
+        self._buffer = {}
+        self._lock = asyncio.Lock()
+        self._valid = True
+
+    async def feed(self, index: int, chunk: bytes) -> None:
+        """
+        This function hashes a chunk, or buffers it until the previous ones are hashed
+        :param index: The index of the chunk
+        :param chunk: The bytes of the chunk
+        """
+        if not self._valid:
+            return
+        async with self._lock:
+            self._buffer[index] = bytes(chunk)
+            if len(self._buffer) > self._max_buffered:
+                self._valid = False
+                self._buffer.clear()
+                return
+            loop = asyncio.get_event_loop()
+            while self._next in self._buffer:
+                # hashlib releases the GIL on big buffers, the loop keeps serving the other downloads
+                await loop.run_in_executor(self._executor, self._hash.update, self._buffer.pop(self._next))
+                self._next += 1
+
+    def get_digest(self) -> str | None:
+        """
+        This function returns the SHA-256 of the whole file
+        :return: The hex digest, None if the file wasn't entirely streamed through the hasher
+        """
+        if not self._valid or self._next != self._chunks:
+            return None
+        return self._hash.hexdigest()
@@ -0,0 +1,478 @@
+import asyncio
+import datetime
+import errno
+import hashlib
+import hmac
+import http.client
+import logging
+import os
+import stat
+import urllib.parse
+from asyncio import Task
+from asyncio.subprocess import Process
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from modules.PostProcessor import HOOK_TIMEOUT
+
+# Size of the parts of a multipart upload, S3 requires at least 5 MiB for all of them but the last
+S3_PART_SIZE: int = 8 * 1024 * 1024
+# Maximum time of a single request to the object store
+S3_TIMEOUT: float = 300
+# How often a named pipe is checked for a reader
+FIFO_POLL_INTERVAL: float = 0.5
+
+
+class SinkError(Exception):
+    """
+    Raised when the target of a sink rejects a file
+    """
+
+
+def _get_key(file_name: str) -> str:
+    """
+    This function turns the name of a job into a relative path inside the sink
+    :param file_name: The target file name, relative to the download dir, or absolute when routed elsewhere
+    :return: The normalized relative path
+    """
+    key: str = os.path.normpath(file_name).lstrip(os.sep)
+    # A name can't escape the sink
+    return os.path.basename(key) if key.startswith("..") else key
+
+
+class SinkWriter:
+    """
+    A file being streamed to a sink. A write returns only once the target accepted the data, so a slow target slows
+    the download down instead of growing a buffer.
+    """
+
+    async def write(self, chunk: bytes) -> None:
+        """
+        This function sends the next chunk of the file
+        :param chunk: The bytes of the chunk
+        """
+        raise NotImplementedError
+
+    async def close(self) -> str:
+        """
+        This function completes the file once all the chunks have been written
+        :return: Where the file has been stored
+        """
+        raise NotImplementedError
+
+    async def abort(self) -> None:
+        """
+        This function drops an incomplete file
+        """
+        raise NotImplementedError
+
+
+class StreamSink:
+    """
+    A target receiving the downloaded files as streams, in place of the download directory
+    """
+    name: str = ""
+
+    async def open(self, file_name: str, context: dict) -> SinkWriter:
+        """
+        This function starts streaming a file
+        :param file_name: The target file name, relative to the download dir, or absolute when routed elsewhere
+        :param context: The job details
+        :return: The SinkWriter receiving the chunks
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def create(target: str, s3_endpoint: str, s3_access_key: str, s3_secret_key: str,
+               s3_region: str) -> "StreamSink":
+        """
+        This function builds the sink described by the configuration
+        :param target: fifo:/path/to/dir, exec:command or s3://bucket/prefix
+        :param s3_endpoint: The URL of the S3-compatible object store
+        :param s3_access_key: The access key of the object store
+        :param s3_secret_key: The secret key of the object store
+        :param s3_region: The region used to sign the requests
+        :return: The StreamSink instance
+        :raise ValueError: If the target is malformed
+        """
+        if target.startswith("fifo:"):
+            directory: str = target[len("fifo:"):]
+            if not directory:
+                raise ValueError("The named pipes directory can't be empty")
+            return FifoSink(directory)
+        if target.startswith("exec:"):
+            command: str = target[len("exec:"):].strip()
+            if not command:
+                raise ValueError("The command can't be empty")
+            return CommandSink(command)
+        if target.startswith("s3://"):
+            bucket, _, prefix = target[len("s3://"):].partition("/")
+            if not bucket:
+                raise ValueError("The bucket can't be empty")
+            return S3Sink(s3_endpoint, bucket, prefix, s3_access_key, s3_secret_key, s3_region)
+        raise ValueError(f'The sink {target} must be fifo:/path/to/dir, exec:command or s3://bucket/prefix')
+
+
+class FifoWriter(SinkWriter):
+    _path: str
+    _fd: int
+    _owned: bool
+
+    def __init__(self, path: str, fd: int, owned: bool):
+        self._path = path
+        self._fd = fd
+        self._owned = owned
+
+    async def write(self, chunk: bytes) -> None:
+        view: memoryview = memoryview(chunk)
+        while view:
+            try:
+                view = view[os.write(self._fd, view):]
+            except BlockingIOError:
+                await self._wait_writable()
+
+    async def _wait_writable(self) -> None:
+        """
+        This function waits for the reader to make room in the pipe
+        """
+        loop = asyncio.get_event_loop()
+        ready: asyncio.Future = loop.create_future()
+        loop.add_writer(self._fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_writer(self._fd)
+
+    async def close(self) -> str:
+        self._release()
+        return self._path
+
+    async def abort(self) -> None:
+        # The reader gets an early end of file
+        self._release()
+
+    def _release(self) -> None:
+        """
+        This function closes the pipe, removing it if it was created for this file
+        """
+        if self._fd < 0:
+            return
+        os.close(self._fd)
+        self._fd = -1
+        if self._owned and os.path.exists(self._path):
+            os.remove(self._path)
+
+
+class FifoSink(StreamSink):
+    """
+    Writes each file to a named pipe in a directory, created when missing and removed once the file ends.
+    The download starts when a reader opens the pipe.
+    """
+    name = "fifo"
+    _directory: str
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    async def open(self, file_name: str, context: dict) -> SinkWriter:
+        path: str = os.path.join(self._directory, _get_key(file_name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        owned: bool = not os.path.exists(path)
+        if owned:
+            os.mkfifo(path)
+        elif not stat.S_ISFIFO(os.stat(path).st_mode):
+            raise SinkError(f'{path} already exists and it is not a named pipe')
+        logging.info(f'{os.path.basename(path)} - Waiting for a reader on {path}')
+        try:
+            while True:
+                try:
+                    return FifoWriter(path, os.open(path, os.O_WRONLY | os.O_NONBLOCK), owned)
+                except OSError as e:
+                    # Opening a pipe without readers fails in non-blocking mode
+                    if e.errno != errno.ENXIO:
+                        raise
+                await asyncio.sleep(FIFO_POLL_INTERVAL)
+        except BaseException:
+            if owned and os.path.exists(path):
+                os.remove(path)
+            raise
+
+
+class CommandWriter(SinkWriter):
+    _command: str
+    _process: Process
+    _stderr: Task
+
+    def __init__(self, command: str, process: Process):
+        self._command = command
+        self._process = process
+        # Drained all along, a chatty command would block on a full stderr otherwise
+        self._stderr = asyncio.get_event_loop().create_task(process.stderr.read())
+
+    async def write(self, chunk: bytes) -> None:
+        try:
+            self._process.stdin.write(chunk)
+            await self._process.stdin.drain()
+        except ConnectionError:
+            return_code: int = await self._process.wait()
+            raise SinkError(f'The command exited with code {return_code} before reading the whole file: '
+                            f'{await self._get_stderr()}')
+
+    async def close(self) -> str:
+        self._process.stdin.close()
+        try:
+            return_code: int = await asyncio.wait_for(self._process.wait(), timeout=HOOK_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.abort()
+            raise SinkError(f'The command {self._command} is still running after {HOOK_TIMEOUT:.0f} seconds')
+        if return_code:
+            raise SinkError(f'The command exited with code {return_code}: {await self._get_stderr()}')
+        return f'the command {self._command}'
+
+    async def _get_stderr(self) -> str:
+        """
+        This function returns the end of the error output of the exited command
+        :return: The last 200 characters
+        """
+        return (await self._stderr).decode(errors="replace").strip()[-200:]
+
+    async def abort(self) -> None:
+        if self._process.returncode is None:
+            self._process.kill()
+        await self._process.wait()
+        self._stderr.cancel()
+
+
+class CommandSink(StreamSink):
+    """
+    Runs a shell command for each file and writes the file to its standard input.
+    The job details are passed as environment variables, like for the post-processing hook.
+    """
+    name = "exec"
+    _command: str
+
+    def __init__(self, command: str):
+        self._command = command
+
+    async def open(self, file_name: str, context: dict) -> SinkWriter:
+        env: dict[str, str] = {**os.environ}
+        for key, value in context.items():
+            if value is not None:
+                env[f'TG_{key.upper()}'] = str(value)
+        process: Process = await asyncio.create_subprocess_shell(
+            self._command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE, env=env)
+        return CommandWriter(self._command, process)
+
+
+class S3Writer(SinkWriter):
+    _sink: "S3Sink"
+    _key: str
+    _buffer: bytearray
+    _upload_id: str | None
+    _parts: list[tuple[int, str]]
+    _upload: Task | None
+
+    def __init__(self, sink: "S3Sink", key: str):
+        self._sink = sink
+        self._key = key
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self._upload = None
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        if len(self._buffer) >= S3_PART_SIZE:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        """
+        This function uploads the buffered data as the next part. A part uploads while the following one fills,
+        a third one waits for it, so at most two parts are kept in memory.
+        """
+        if self._upload:
+            await self._upload
+        if not self._upload_id:
+            _, data = await self._sink.request("POST", self._key, {"uploads": ""})
+            self._upload_id = _find_text(data, "UploadId")
+            if not self._upload_id:
+                raise SinkError("The object store didn't return an upload id")
+        part: bytes = bytes(self._buffer)
+        self._buffer = bytearray()
+        self._upload = asyncio.get_event_loop().create_task(self._upload_part(len(self._parts) + 1, part))
+        # Reserved now, so the part numbers follow the order of the data
+        self._parts.append((len(self._parts) + 1, ""))
+
+    async def _upload_part(self, number: int, part: bytes) -> None:
+        """
+        This function uploads a part of the multipart upload
+        :param number: The part number, starting from 1
+        :param part: The data of the part
+        """
+        headers, _ = await self._sink.request("PUT", self._key, {"partNumber": str(number),
+                                                                 "uploadId": self._upload_id}, part)
+        self._parts[number - 1] = (number, headers.get("ETag", ""))
+
+    async def close(self) -> str:
+        if not self._upload_id:
+            # A small file fits in a single request
+            await self._sink.request("PUT", self._key, {}, bytes(self._buffer))
+        else:
+            if self._buffer:
+                await self._flush()
+            await self._upload
+            body: str = "<CompleteMultipartUpload>" + "".join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag></Part>'
+                for number, etag in self._parts) + "</CompleteMultipartUpload>"
+            _, data = await self._sink.request("POST", self._key, {"uploadId": self._upload_id}, body.encode())
+            # The completion can fail after the response status has been sent
+            if _find_text(data, "Code"):
+                raise ConnectionError(f'The object store failed to complete the upload: {_find_text(data, "Code")}')
+        return f's3://{self._sink.get_bucket()}/{self._key}'
+
+    async def abort(self) -> None:
+        if self._upload:
+            # A part being sent can't be stopped, it would land after the abort
+            await asyncio.gather(self._upload, return_exceptions=True)
+        if self._upload_id:
+            try:
+                await self._sink.request("DELETE", self._key, {"uploadId": self._upload_id})
+            except Exception as e:
+                logging.warning(f'{self._key} - Unable to abort the multipart upload {self._upload_id}, '
+                                f'error:\n {e}')
+
+
+def _find_text(data: bytes, tag: str) -> str | None:
+    """
+    This function extracts the text of an element from an S3 XML response, ignoring the namespaces
+    :param data: The response body
+    :param tag: The element name
+    :return: The text of the first matching element, None if missing
+    """
+    try:
+        root = ElementTree.fromstring(data)
+    except ElementTree.ParseError:
+        return None
+    return next((element.text for element in root.iter() if element.tag.rsplit("}", 1)[-1] == tag), None)
+
+
+class S3Sink(StreamSink):
+    """
+    Uploads each file to an S3-compatible object store (AWS S3, MinIO...) with a multipart upload, the parts are
+    sent while the download goes on. The requests are signed with AWS Signature Version 4 and use path-style URLs.
+    """
+    name = "s3"
+    _scheme: str
+    _host: str
+    _bucket: str
+    _prefix: str
+    _access_key: str
+    _secret_key: str
+    _region: str
+
+    def __init__(self, endpoint: str, bucket: str, prefix: str, access_key: str, secret_key: str, region: str):
+        """
+        :param endpoint: The URL of the object store, like http://localhost:9000
+        :param bucket: The bucket receiving the files
+        :param prefix: A prefix prepended to the name of each file
+        :param access_key: The access key
+        :param secret_key: The secret key
+        :param region: The region used to sign the requests
+        :raise ValueError: If the endpoint or the credentials are missing
+        """
+        endpoint_url = urllib.parse.urlsplit(endpoint)
+        if endpoint_url.scheme not in ["http", "https"] or not endpoint_url.netloc:
+            raise ValueError(f'The S3 endpoint {endpoint} must be an http:// or https:// URL')
+        if not access_key or not secret_key:
+            raise ValueError("The S3 access key and secret key are required")
+        self._scheme = endpoint_url.scheme
+        self._host = endpoint_url.netloc
+        self._bucket = bucket
+        self._prefix = prefix
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._region = region
+
+    def get_bucket(self) -> str:
+        """
+        This function returns the bucket receiving the files
+        :return: The bucket name
+        """
+        return self._bucket
+
+    async def open(self, file_name: str, context: dict) -> SinkWriter:
+        return S3Writer(self, self._prefix + _get_key(file_name))
+
+    async def request(self, method: str, key: str, query: dict[str, str],
+                      body: bytes = b"") -> tuple[http.client.HTTPMessage, bytes]:
+        """
+        This function sends a signed request in a worker thread
+        :param method: The HTTP method
+        :param key: The object key
+        :param query: The query string parameters
+        :param body: The request body
+        :return: A tuple with the response headers and body
+        :raise ConnectionError: If the object store is unreachable or fails with a server error
+        :raise SinkError: If the object store rejects the request
+        """
+        return await asyncio.get_event_loop().run_in_executor(None, self._request, method, key, query, body)
+
+    def _request(self, method: str, key: str, query: dict[str, str],
+                 body: bytes) -> tuple[http.client.HTTPMessage, bytes]:
+        """
+        This function sends a signed request
+        :param method: The HTTP method
+        :param key: The object key
+        :param query: The query string parameters
+        :param body: The request body
+        :return: A tuple with the response headers and body
+        """
+        path: str = urllib.parse.quote(f'/{self._bucket}/{key}', safe="/~")
+        query_string: str = "&".join(f'{urllib.parse.quote(name, safe="~")}={urllib.parse.quote(value, safe="~")}'
+                                     for name, value in sorted(query.items()))
+        headers: dict[str, str] = self._sign(method, path, query_string, hashlib.sha256(body).hexdigest())
+        connection_class = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(self._host, timeout=S3_TIMEOUT)
+        try:
+            connection.request(method, f'{path}?{query_string}' if query_string else path, body=body,
+                               headers=headers)
+            response = connection.getresponse()
+            data: bytes = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise ConnectionError(f'Unable to reach the object store: {e}') from e
+        finally:
+            connection.close()
+        if response.status >= 500:
+            raise ConnectionError(f'The object store failed with status {response.status}: '
+                                  f'{_find_text(data, "Code") or response.reason}')
+        if response.status >= 300:
+            raise SinkError(f'The object store rejected the request with status {response.status}: '
+                            f'{_find_text(data, "Message") or _find_text(data, "Code") or response.reason}')
+        return response.headers, data
+
+    def _sign(self, method: str, path: str, query_string: str, payload_hash: str) -> dict[str, str]:
+        """
+        This function computes the headers of a request signed with AWS Signature Version 4
+        :param method: The HTTP method
+        :param path: The encoded path
+        :param query_string: The canonical query string
+        :param payload_hash: The hex SHA-256 of the body
+        :return: The headers to send
+        """
+        amz_date: str = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers: dict[str, str] = {"host": self._host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+        signed_headers: str = ";".join(sorted(headers))
+        canonical_request: str = "\n".join([method, path, query_string,
+                                            *(f'{name}:{headers[name]}' for name in sorted(headers)), "",
+                                            signed_headers, payload_hash])
+        scope: str = f'{amz_date[:8]}/{self._region}/s3/aws4_request'
+        string_to_sign: str = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope,
+                                         hashlib.sha256(canonical_request.encode()).hexdigest()])
+        signing_key: bytes = f'AWS4{self._secret_key}'.encode()
+        for part in [amz_date[:8], self._region, "s3", "aws4_request"]:
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature: str = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = f'AWS4-HMAC-SHA256 Credential={self._access_key}/{scope}, ' \
+                                   f'SignedHeaders={signed_headers}, Signature={signature}'
+        return headers
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from asyncio import Task, Queue
+from typing import Callable, Awaitable
+
+
+class WorkerPool:
+    """
+    A resizable pool of workers consuming the jobs queue.
+    Growing the pool spawns new workers immediately, shrinking it stops the idle workers and lets the busy ones retire
+    after finishing their current job, so no job is lost.
+    """
+    _queue: Queue
+    _handler: Callable[[object], Awaitable[None]]
+    _size: int
+    _workers: list[Task]
+    _idle: set[Task]
+
+    def __init__(self, queue: Queue, handler: Callable[[object], Awaitable[None]]):
+        self._queue = queue
+        self._handler = handler
+        self._size = 0
+        self._workers = []
+        self._idle = set()
+
+    def get_size(self) -> int:
+        """
+        This function returns the target number of workers
+        :return: The pool size
+        """
+        return self._size
+
+    def get_busy_count(self) -> int:
+        """
+        This function returns the number of workers that are processing a job
+        :return: The number of busy workers
+        """
+        return len(self._workers) - len(self._idle)
+
+    def resize(self, size: int) -> None:
+        """
+        This function changes the number of workers without interrupting the running jobs
+        :param size: The new number of workers
+        """
+        logging.info(f"Resizing worker pool from {self._size} to {size}")
+        self._size = size
+        loop = asyncio.get_event_loop_policy().get_event_loop()
+        while len(self._workers) < size:
+            self._workers.append(loop.create_task(self._worker()))
+        surplus: int = len(self._workers) - size
+        for w in list(self._idle)[:surplus]:
+            self._retire(w)
+            w.cancel()
+
+    def stop(self) -> None:
+        """
+        This function cancels all the workers, including the busy ones
+        """
+        logging.info("Killing all the workers")
+        self._size = 0
+        for w in self._workers:
+            w.cancel()
+        self._workers.clear()
+        self._idle.clear()
+
+    def _retire(self, worker: Task) -> None:
+        """
+        This function removes a worker from the pool
+        :param worker: The worker task
+        """
+        self._idle.discard(worker)
+        if worker in self._workers:
+            self._workers.remove(worker)
+
+    async def _worker(self) -> None:
+        """
+        The worker loop, it processes jobs until the pool has more workers than needed
+        """
+        me: Task = asyncio.current_task()
+        while len(self._workers) <= self._size:
+            self._idle.add(me)
+            # Get a "work item" out of the queue.
+            job = await self._queue.get()
+            self._idle.discard(me)
+            try:
+                await self._handler(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f'Worker failed to process a job, error:\n {e}')
+            finally:
+                # Notify the queue that the "work item" has been processed.
+                self._queue.task_done()
+        self._retire(me)
+        logging.info("Surplus worker retired")
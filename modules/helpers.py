@@ -1,8 +1,12 @@
+import json
 import logging
 import os
 import time
 from pathlib import Path
 
+from pyrogram.enums import MessageMediaType
+from pyrogram.types import Message, Photo, Voice, Video, Animation, Audio, Document
+
 from modules.models.ConfigFile import ConfigFile
 
 
@@ -46,6 +50,43 @@ def get_config_from_user_or_env() -> ConfigFile:
                                .replace("\"", ""))
     config.TG_MAX_PARALLEL = int(os.environ.get('TG_MAX_PARALLEL', 4))
     config.TG_DL_TIMEOUT = int(os.environ.get('TG_DL_TIMEOUT', 5400))
+    config.TG_DL_CONNECTIONS = int(os.environ.get('TG_DL_CONNECTIONS', ConfigFile.TG_DL_CONNECTIONS))
+    config.TG_PROGRESS_RATE = float(os.environ.get('TG_PROGRESS_RATE', ConfigFile.TG_PROGRESS_RATE))
+    config.TG_DL_RETRIES = int(os.environ.get('TG_DL_RETRIES', ConfigFile.TG_DL_RETRIES))
+    config.TG_DEDUP_MODE = os.environ.get('TG_DEDUP_MODE', ConfigFile.TG_DEDUP_MODE).lower()
+    config.TG_RATE_LIMIT = int(os.environ.get('TG_RATE_LIMIT', ConfigFile.TG_RATE_LIMIT))
+    config.TG_RATE_LIMIT_PER_JOB = int(os.environ.get('TG_RATE_LIMIT_PER_JOB', ConfigFile.TG_RATE_LIMIT_PER_JOB))
+    config.TG_RATE_SCHEDULE = os.environ.get('TG_RATE_SCHEDULE', ConfigFile.TG_RATE_SCHEDULE)
+    config.TG_METRICS_PORT = int(os.environ.get('TG_METRICS_PORT', ConfigFile.TG_METRICS_PORT))
+    config.TG_METRICS_HOST = os.environ.get('TG_METRICS_HOST', ConfigFile.TG_METRICS_HOST)
+    config.TG_API_PORT = int(os.environ.get('TG_API_PORT', ConfigFile.TG_API_PORT))
+    config.TG_API_TOKEN = os.environ.get('TG_API_TOKEN', ConfigFile.TG_API_TOKEN)
+    config.TG_POST_WORKERS = int(os.environ.get('TG_POST_WORKERS', ConfigFile.TG_POST_WORKERS))
+    config.TG_POST_HOOK = os.environ.get('TG_POST_HOOK', ConfigFile.TG_POST_HOOK)
+    config.TG_DISK_MARGIN = int(os.environ.get('TG_DISK_MARGIN', ConfigFile.TG_DISK_MARGIN))
+    config.TG_COLLISION_POLICY = os.environ.get('TG_COLLISION_POLICY', ConfigFile.TG_COLLISION_POLICY).lower()
+    config.TG_COORDINATOR_ADDRESS = os.environ.get('TG_COORDINATOR_ADDRESS', ConfigFile.TG_COORDINATOR_ADDRESS)
+    config.TG_COORDINATOR_TOKEN = os.environ.get('TG_COORDINATOR_TOKEN', ConfigFile.TG_COORDINATOR_TOKEN)
+    config.TG_MIN_PARALLEL = int(os.environ.get('TG_MIN_PARALLEL', ConfigFile.TG_MIN_PARALLEL))
+    config.TG_STREAM_SINK = os.environ.get('TG_STREAM_SINK', ConfigFile.TG_STREAM_SINK)
+    config.TG_S3_ENDPOINT = os.environ.get('TG_S3_ENDPOINT', ConfigFile.TG_S3_ENDPOINT)
+    config.TG_S3_ACCESS_KEY = os.environ.get('TG_S3_ACCESS_KEY', ConfigFile.TG_S3_ACCESS_KEY)
+    config.TG_S3_SECRET_KEY = os.environ.get('TG_S3_SECRET_KEY', ConfigFile.TG_S3_SECRET_KEY)
+    config.TG_S3_REGION = os.environ.get('TG_S3_REGION', ConfigFile.TG_S3_REGION)
+    config.TG_LOG_LEVEL = os.environ.get('TG_LOG_LEVEL', ConfigFile.TG_LOG_LEVEL).upper()
+    config.TG_LOG_MAX_SIZE = int(os.environ.get('TG_LOG_MAX_SIZE', ConfigFile.TG_LOG_MAX_SIZE))
+    config.TG_LOG_BACKUPS = int(os.environ.get('TG_LOG_BACKUPS', ConfigFile.TG_LOG_BACKUPS))
+    config.TG_LOG_ROTATE_WHEN = os.environ.get('TG_LOG_ROTATE_WHEN', ConfigFile.TG_LOG_ROTATE_WHEN)
+    config.TG_ROUTING_RULES = json.loads(os.environ.get('TG_ROUTING_RULES') or "[]")
+    config.TG_POOL_BOT_TOKENS = [token for token in os.environ.get('TG_POOL_BOT_TOKENS', "").split(",") if token]
+    config.TG_POOL_SESSIONS = [session for session in os.environ.get('TG_POOL_SESSIONS', "").split(",") if session]
+    config.TG_DL_RESUME = parse_bool(os.environ.get('TG_DL_RESUME', str(ConfigFile.TG_DL_RESUME)))
+    config.TG_SMALLEST_FIRST = parse_bool(os.environ.get('TG_SMALLEST_FIRST', str(ConfigFile.TG_SMALLEST_FIRST)))
+    config.TG_POST_HASH = parse_bool(os.environ.get('TG_POST_HASH', str(ConfigFile.TG_POST_HASH)))
+    config.TG_POST_EXTRACT = parse_bool(os.environ.get('TG_POST_EXTRACT', str(ConfigFile.TG_POST_EXTRACT)))
+    config.TG_PREALLOCATE = parse_bool(os.environ.get('TG_PREALLOCATE', str(ConfigFile.TG_PREALLOCATE)))
+    config.TG_ADAPTIVE_PARALLEL = parse_bool(os.environ.get('TG_ADAPTIVE_PARALLEL',
+                                                            str(ConfigFile.TG_ADAPTIVE_PARALLEL)))
     while True:
         authorized_users = get_env('TG_AUTHORIZED_USER_ID',
                                    "Enter the list authorized users' id (separated by comma, can't be empty): ")
@@ -56,6 +97,102 @@ def get_config_from_user_or_env() -> ConfigFile:
     return config
 
 
+def parse_bool(value: str) -> bool:
+    """
+    This function converts a textual flag, as provided by env vars, into a boolean
+    :param value: A string like true/false, yes/no or 1/0
+    :return: True if the value represents an enabled flag, False otherwise
+    """
+    return value.strip().lower() in ["true", "yes", "1"]
+
+
+def format_size(size: float) -> str:
+    """
+    This function formats a size in bytes using the most suitable unit
+    :param size: A size in bytes
+    :return: A human-readable size
+    """
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
+
+
+def parse_size(size: str) -> int:
+    """
+    This function parses a size with an optional unit, like 500KB or 1.5GB
+    :param size: A size in bytes, KB, MB or GB
+    :return: The size in bytes
+    :raise ValueError: If the size is malformed
+    """
+    size = size.strip().upper()
+    for exponent, unit in reversed(list(enumerate(["B", "KB", "MB", "GB"]))):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * 1024 ** exponent)
+    return int(size)
+
+
+def format_duration(seconds: float) -> str:
+    """
+    This function formats a duration as hours, minutes and seconds
+    :param seconds: A duration in seconds
+    :return: A human-readable duration
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+
+def parse_rate_schedule(schedule: str) -> list[tuple[int, int, int]]:
+    """
+    This function parses a bandwidth schedule like "09:00-18:00=2048,18:00-20:00=8192"
+    :param schedule: A comma separated list of HH:MM-HH:MM=KB/s ranges, the end of a range is excluded
+    :return: A list of tuples (start minute, end minute, limit in KB/s)
+    :raise ValueError: If the schedule is malformed
+    """
+    ranges: list[tuple[int, int, int]] = []
+    for item in filter(None, [item.strip() for item in schedule.split(",")]):
+        time_range, limit = item.split("=")
+        minutes: list[int] = []
+        for hour_minute in time_range.split("-"):
+            hours, minutes_of_hour = [int(value) for value in hour_minute.strip().split(":")]
+            if not 0 <= hours < 24 or not 0 <= minutes_of_hour < 60:
+                raise ValueError(f'Invalid time {hour_minute} in bandwidth schedule')
+            minutes.append(hours * 60 + minutes_of_hour)
+        start, end = minutes
+        ranges.append((start, end, int(limit)))
+    return ranges
+
+
+def get_extension(media_type: MessageMediaType, media: Photo | Voice | Video | Animation | Audio | Document) -> str:
+    """
+    This function returns the most probable file extension based on the media type
+    :param media_type: The media_type property of a message
+    :param media: The media object of a message
+    :return: A string corresponding to the file extension
+    """
+    if media_type == MessageMediaType.PHOTO:
+        return "jpg"
+    else:
+        default = "unknown"
+        if media_type in [MessageMediaType.VOICE, MessageMediaType.AUDIO]:
+            default = "mp3"
+        elif media_type in [MessageMediaType.ANIMATION, MessageMediaType.VIDEO]:
+            default = "mp4"
+        return default if not media.mime_type else media.mime_type.split("/")[1]
+
+
+def get_default_file_name(message: Message) -> str:
+    """
+    This function returns the name of a media when the user is not asked for a custom one
+    :param message: The media message
+    :return: The original file name if available, the file_unique_id otherwise
+    """
+    media: Photo | Voice | Video | Animation | Audio | Document = getattr(message, message.media.value)
+    return getattr(media, "file_name", None) or f'{media.file_unique_id}.{get_extension(message.media, media)}'
+
+
 def is_json(file: Path) -> bool:
     """
     This function check if the file extension is 'json'
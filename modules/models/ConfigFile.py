@@ -7,6 +7,42 @@ class ConfigFile:
     TG_MAX_PARALLEL: int
     TG_DL_TIMEOUT: int
     TG_AUTHORIZED_USER_ID: list[int]
+    TG_DL_CONNECTIONS: int = 4
+    TG_DL_RESUME: bool = True
+    TG_PROGRESS_RATE: float = 1
+    TG_DL_RETRIES: int = 5
+    TG_DEDUP_MODE: str = "skip"
+    TG_SMALLEST_FIRST: bool = False
+    TG_RATE_LIMIT: int = 0
+    TG_RATE_LIMIT_PER_JOB: int = 0
+    TG_RATE_SCHEDULE: str = ""
+    TG_METRICS_PORT: int = 0
+    TG_METRICS_HOST: str = "127.0.0.1"
+    TG_API_PORT: int = 0
+    TG_API_TOKEN: str = ""
+    TG_POST_WORKERS: int = 2
+    TG_POST_HASH: bool = False
+    TG_POST_EXTRACT: bool = False
+    TG_POST_HOOK: str = ""
+    TG_DISK_MARGIN: int = 100
+    TG_PREALLOCATE: bool = True
+    TG_COLLISION_POLICY: str = "suffix"
+    TG_POOL_BOT_TOKENS: list[str] = []
+    TG_POOL_SESSIONS: list[str] = []
+    TG_COORDINATOR_ADDRESS: str = ""
+    TG_COORDINATOR_TOKEN: str = ""
+    TG_ADAPTIVE_PARALLEL: bool = False
+    TG_MIN_PARALLEL: int = 1
+    TG_STREAM_SINK: str = ""
+    TG_S3_ENDPOINT: str = ""
+    TG_S3_ACCESS_KEY: str = ""
+    TG_S3_SECRET_KEY: str = ""
+    TG_S3_REGION: str = "us-east-1"
+    TG_LOG_LEVEL: str = "INFO"
+    TG_LOG_MAX_SIZE: int = 10
+    TG_LOG_BACKUPS: int = 5
+    TG_LOG_ROTATE_WHEN: str = ""
+    TG_ROUTING_RULES: list[dict] = []
 
     def __init__(self, data=None):
         if data is None:
@@ -19,3 +55,39 @@ class ConfigFile:
         self.TG_MAX_PARALLEL = data['TG_MAX_PARALLEL']
         self.TG_DL_TIMEOUT = data['TG_DL_TIMEOUT']
         self.TG_AUTHORIZED_USER_ID = data['TG_AUTHORIZED_USER_ID']
+        self.TG_DL_CONNECTIONS = data.get('TG_DL_CONNECTIONS', ConfigFile.TG_DL_CONNECTIONS)
+        self.TG_DL_RESUME = data.get('TG_DL_RESUME', ConfigFile.TG_DL_RESUME)
+        self.TG_PROGRESS_RATE = data.get('TG_PROGRESS_RATE', ConfigFile.TG_PROGRESS_RATE)
+        self.TG_DL_RETRIES = data.get('TG_DL_RETRIES', ConfigFile.TG_DL_RETRIES)
+        self.TG_DEDUP_MODE = data.get('TG_DEDUP_MODE', ConfigFile.TG_DEDUP_MODE)
+        self.TG_SMALLEST_FIRST = data.get('TG_SMALLEST_FIRST', ConfigFile.TG_SMALLEST_FIRST)
+        self.TG_RATE_LIMIT = data.get('TG_RATE_LIMIT', ConfigFile.TG_RATE_LIMIT)
+        self.TG_RATE_LIMIT_PER_JOB = data.get('TG_RATE_LIMIT_PER_JOB', ConfigFile.TG_RATE_LIMIT_PER_JOB)
+        self.TG_RATE_SCHEDULE = data.get('TG_RATE_SCHEDULE', ConfigFile.TG_RATE_SCHEDULE)
+        self.TG_METRICS_PORT = data.get('TG_METRICS_PORT', ConfigFile.TG_METRICS_PORT)
+        self.TG_METRICS_HOST = data.get('TG_METRICS_HOST', ConfigFile.TG_METRICS_HOST)
+        self.TG_API_PORT = data.get('TG_API_PORT', ConfigFile.TG_API_PORT)
+        self.TG_API_TOKEN = data.get('TG_API_TOKEN', ConfigFile.TG_API_TOKEN)
+        self.TG_POST_WORKERS = data.get('TG_POST_WORKERS', ConfigFile.TG_POST_WORKERS)
+        self.TG_POST_HASH = data.get('TG_POST_HASH', ConfigFile.TG_POST_HASH)
+        self.TG_POST_EXTRACT = data.get('TG_POST_EXTRACT', ConfigFile.TG_POST_EXTRACT)
+        self.TG_POST_HOOK = data.get('TG_POST_HOOK', ConfigFile.TG_POST_HOOK)
+        self.TG_DISK_MARGIN = data.get('TG_DISK_MARGIN', ConfigFile.TG_DISK_MARGIN)
+        self.TG_PREALLOCATE = data.get('TG_PREALLOCATE', ConfigFile.TG_PREALLOCATE)
+        self.TG_COLLISION_POLICY = data.get('TG_COLLISION_POLICY', ConfigFile.TG_COLLISION_POLICY)
+        self.TG_POOL_BOT_TOKENS = data.get('TG_POOL_BOT_TOKENS', list(ConfigFile.TG_POOL_BOT_TOKENS))
+        self.TG_POOL_SESSIONS = data.get('TG_POOL_SESSIONS', list(ConfigFile.TG_POOL_SESSIONS))
+        self.TG_COORDINATOR_ADDRESS = data.get('TG_COORDINATOR_ADDRESS', ConfigFile.TG_COORDINATOR_ADDRESS)
+        self.TG_COORDINATOR_TOKEN = data.get('TG_COORDINATOR_TOKEN', ConfigFile.TG_COORDINATOR_TOKEN)
+        self.TG_ADAPTIVE_PARALLEL = data.get('TG_ADAPTIVE_PARALLEL', ConfigFile.TG_ADAPTIVE_PARALLEL)
+        self.TG_MIN_PARALLEL = data.get('TG_MIN_PARALLEL', ConfigFile.TG_MIN_PARALLEL)
+        self.TG_STREAM_SINK = data.get('TG_STREAM_SINK', ConfigFile.TG_STREAM_SINK)
+        self.TG_S3_ENDPOINT = data.get('TG_S3_ENDPOINT', ConfigFile.TG_S3_ENDPOINT)
+        self.TG_S3_ACCESS_KEY = data.get('TG_S3_ACCESS_KEY', ConfigFile.TG_S3_ACCESS_KEY)
+        self.TG_S3_SECRET_KEY = data.get('TG_S3_SECRET_KEY', ConfigFile.TG_S3_SECRET_KEY)
+        self.TG_S3_REGION = data.get('TG_S3_REGION', ConfigFile.TG_S3_REGION)
+        self.TG_LOG_LEVEL = data.get('TG_LOG_LEVEL', ConfigFile.TG_LOG_LEVEL)
+        self.TG_LOG_MAX_SIZE = data.get('TG_LOG_MAX_SIZE', ConfigFile.TG_LOG_MAX_SIZE)
+        self.TG_LOG_BACKUPS = data.get('TG_LOG_BACKUPS', ConfigFile.TG_LOG_BACKUPS)
+        self.TG_LOG_ROTATE_WHEN = data.get('TG_LOG_ROTATE_WHEN', ConfigFile.TG_LOG_ROTATE_WHEN)
+        self.TG_ROUTING_RULES = data.get('TG_ROUTING_RULES', list(ConfigFile.TG_ROUTING_RULES))
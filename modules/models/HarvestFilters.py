@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from pyrogram.enums import MessageMediaType
+from pyrogram.types import Message
+
+from modules.helpers import parse_size
+
+DOWNLOADABLE_TYPES: list[MessageMediaType] = [MessageMediaType.ANIMATION, MessageMediaType.AUDIO,
+                                              MessageMediaType.DOCUMENT, MessageMediaType.PHOTO,
+                                              MessageMediaType.VIDEO, MessageMediaType.VOICE]
+
+
+class HarvestFilters:
+    """
+    The filters of a harvest, parsed from a list of key=value arguments: type (comma separated media types),
+    min_size and max_size (like 10MB), after and before (YYYY-MM-DD dates).
+    A malformed filter raises ValueError.
+    """
+    media_types: list[MessageMediaType]
+    min_size: int
+    max_size: int
+    after: datetime | None
+    before: datetime | None
+
+    def __init__(self, args: list[str] | None = None):
+        self.media_types = DOWNLOADABLE_TYPES
+        self.min_size = 0
+        self.max_size = 0
+        self.after = None
+        self.before = None
+        for arg in args or []:
+            key, value = arg.split("=", 1)
+            if key == "type":
+                self.media_types = [MessageMediaType(media_type) for media_type in value.split(",")]
+                if any(media_type not in DOWNLOADABLE_TYPES for media_type in self.media_types):
+                    raise ValueError(f'Unsupported media type in {value}')
+            elif key == "min_size":
+                self.min_size = parse_size(value)
+            elif key == "max_size":
+                self.max_size = parse_size(value)
+            elif key == "after":
+                self.after = datetime.strptime(value, "%Y-%m-%d")
+            elif key == "before":
+                self.before = datetime.strptime(value, "%Y-%m-%d")
+            else:
+                raise ValueError(f'Unknown filter {key}')
+
+    def match(self, message: Message) -> bool:
+        """
+        This function checks if a message contains a media to harvest
+        :param message: A message of the harvested chat
+        :return: True if the message passes all the filters, False otherwise
+        """
+        if message.empty or message.media not in self.media_types:
+            return False
+        size: int = getattr(getattr(message, message.media.value), "file_size", 0) or 0
+        if size < self.min_size or (self.max_size and size > self.max_size):
+            return False
+        if (self.after and message.date < self.after) or (self.before and message.date >= self.before):
+            return False
+        return True
@@ -0,0 +1,61 @@
+from enum import Enum
+
+from pyrogram.types import Message
+
+from modules.models.JobBatch import JobBatch
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    DOWNLOADING = "downloading"
+    DONE = "done"
+    FAILED = "failed"
+    ABORTED = "aborted"
+
+
+class Job:
+    id: int
+    chat_id: int
+    message_id: int
+    reply_chat_id: int
+    reply_id: int
+    file_name: str
+    user_id: int
+    file_size: int
+    state: JobState
+    created_at: float
+    # Runtime only, they are fetched again from Telegram when the job is restored
+    message: Message | None
+    reply: Message | None
+    attempts: int
+    batch: JobBatch | None
+    received: int
+    # Set when the job is cancelled or paused by the user, its running download is interrupted
+    interrupt: str | None
+    # Monotonic timestamps used by the metrics
+    enqueued_at: float
+    started_at: float
+    first_byte_at: float | None
+
+    def __init__(self, data=None):
+        self.message = None
+        self.reply = None
+        self.attempts = 0
+        self.batch = None
+        self.received = 0
+        self.interrupt = None
+        self.enqueued_at = self.started_at = 0
+        self.first_byte_at = None
+        if data is None:
+            return
+        self.id = data['id']
+        self.chat_id = data['chat_id']
+        self.message_id = data['message_id']
+        # The reply is sent in the media's chat, unless the media comes from a harvested chat
+        self.reply_chat_id = data['reply_chat_id'] or data['chat_id']
+        self.reply_id = data['reply_id']
+        self.file_name = data['file_name']
+        self.user_id = data['user_id']
+        self.file_size = data['file_size']
+        self.state = JobState(data['state'])
+        self.created_at = data['created_at']
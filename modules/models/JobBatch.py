@@ -0,0 +1,45 @@
+class JobBatch:
+    """
+    A group of jobs sharing the same status reply, like the media of an album
+    """
+    name: str
+    total: int
+    total_size: int
+    done: int
+    failed: int
+    received: dict[int, int]
+    # Set while more jobs may join the batch, like during a harvest
+    growing: bool
+
+    def __init__(self, name: str, total: int, total_size: int):
+        self.name = name
+        self.total = total
+        self.total_size = total_size
+        self.done = 0
+        self.failed = 0
+        self.received = {}
+        self.growing = False
+
+    def get_received(self) -> int:
+        """
+        This function returns the bytes downloaded by all the jobs of the batch
+        :return: The downloaded bytes
+        """
+        return sum(self.received.values())
+
+    def is_finished(self) -> bool:
+        """
+        This function checks if all the jobs of the batch ended
+        :return: True if no job is left and no more jobs can join, False otherwise
+        """
+        return not self.growing and self.done + self.failed >= self.total
+
+    def get_summary(self) -> str:
+        """
+        This function describes the state of the batch
+        :return: A human-readable summary
+        """
+        text: str = f'**{self.name}:** {self.done}/{self.total} downloaded'
+        if self.failed:
+            text += f', {self.failed} failed'
+        return text
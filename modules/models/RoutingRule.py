@@ -0,0 +1,91 @@
+import fnmatch
+import os
+import re
+from datetime import datetime
+
+from pyrogram.enums import MessageMediaType
+from pyrogram.types import Message
+
+from modules.helpers import parse_size
+
+# The file name is kept as is when a rule doesn't set a template
+DEFAULT_TEMPLATE: str = "{file_name}"
+
+
+class RoutingRule:
+    """
+    A destination rule of the config, parsed once from a dict. The optional conditions are media (list of media
+    types), mime (list of glob patterns), chat (list of source chat ids or usernames), user (list of user ids),
+    min_size and max_size (like 10MB), name (regex searched in the file name): a job matches the rule if it passes
+    all of them. The matching jobs are saved in path, named after template.
+    A malformed rule raises ValueError.
+    """
+    path: str
+    template: str
+    media_types: list[MessageMediaType] | None
+    mime: re.Pattern | None
+    chats: set[str] | None
+    users: set[int] | None
+    min_size: int
+    max_size: int
+    name: re.Pattern | None
+
+    def __init__(self, data: dict):
+        unknown: set[str] = set(data) - {"path", "template", "media", "mime", "chat", "user", "min_size", "max_size",
+                                         "name"}
+        if unknown:
+            raise ValueError(f'Unknown rule keys: {", ".join(sorted(unknown))}')
+        if not data.get("path"):
+            raise ValueError("A rule must have a path")
+        self.path = data["path"]
+        self.template = data.get("template") or DEFAULT_TEMPLATE
+        # Fails on unknown placeholders now rather than when a job is enqueued
+        self.render({key: "" for key in ["file_name", "stem", "ext", "media", "mime", "chat", "chat_id", "user_id",
+                                         "message_id"]} | {"date": datetime.now()})
+        self.media_types = [MessageMediaType(media_type) for media_type in data["media"]] if "media" in data \
+            else None
+        self.mime = re.compile("|".join(fnmatch.translate(pattern) for pattern in data["mime"]), re.IGNORECASE) \
+            if "mime" in data else None
+        self.chats = {str(chat).lstrip("@").lower() for chat in data["chat"]} if "chat" in data else None
+        self.users = {int(user_id) for user_id in data["user"]} if "user" in data else None
+        self.min_size = parse_size(str(data.get("min_size", 0)))
+        self.max_size = parse_size(str(data.get("max_size", 0)))
+        self.name = re.compile(data["name"]) if "name" in data else None
+
+    def match(self, message: Message, file_name: str, user_id: int) -> bool:
+        """
+        This function checks if a job is routed by this rule
+        :param message: The media message
+        :param file_name: The file name of the job
+        :param user_id: The id of the user that requested the download
+        :return: True if the job passes all the conditions, False otherwise
+        """
+        media = getattr(message, message.media.value)
+        if self.media_types is not None and message.media not in self.media_types:
+            return False
+        if self.mime and not self.mime.match(getattr(media, "mime_type", None) or ""):
+            return False
+        if self.chats is not None:
+            chat = message.forward_from_chat or message.chat
+            if str(chat.id) not in self.chats and (chat.username or "").lower() not in self.chats:
+                return False
+        if self.users is not None and user_id not in self.users:
+            return False
+        size: int = getattr(media, "file_size", 0) or 0
+        if size < self.min_size or (self.max_size and size > self.max_size):
+            return False
+        if self.name and not self.name.search(os.path.basename(file_name)):
+            return False
+        return True
+
+    def render(self, fields: dict) -> str:
+        """
+        This function builds the relative path of a file from the template
+        :param fields: The values of the placeholders
+        :return: The rendered path
+        :raise ValueError: If the template is malformed
+        """
+        try:
+            return self.template.format(**fields)
+        except (KeyError, IndexError) as e:
+            raise ValueError(f'Unknown placeholder {e} in template {self.template}')
@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pyrogram.enums import ChatType, MessageMediaType
+from pyrogram.errors import ChannelPrivate, FloodWait, InternalServerError
+
+from modules.ClientPool import ClientPool
+
+CHANNEL = SimpleNamespace(id=-100123, username="channel", type=ChatType.CHANNEL)
+
+
+def create_message(file_unique_id: str = "unique"):
+    return SimpleNamespace(id=7, chat=CHANNEL, forward_from_chat=None, forward_from_message_id=None,
+                           media=MessageMediaType.DOCUMENT, document=SimpleNamespace(file_unique_id=file_unique_id))
+
+
+class _Client:
+    def __init__(self, name: str, error: Exception | None = None):
+        self.name = name
+        self.error = error
+
+    async def get_messages(self, chat, message_id):
+        if self.error:
+            raise self.error
+        return create_message()
+
+
+def acquire(pool: ClientPool):
+    return asyncio.run(pool.acquire(create_message()))
+
+
+def test_the_least_loaded_account_is_picked():
+    pool = ClientPool([_Client("bot"), _Client("pool")], lambda client: None)
+    first, _ = acquire(pool)
+    second, _ = acquire(pool)
+    assert {first.get_name(), second.get_name()} == {"bot", "pool"}
+
+
+@pytest.mark.parametrize("error, banned", [(ChannelPrivate(), True), (FloodWait(value=60), False),
+                                           (InternalServerError(), False)])
+def test_only_access_errors_are_remembered(error, banned):
+    pooled_client = _Client("pool", error)
+    pool = ClientPool([_Client("bot"), pooled_client], lambda client: None)
+    # The bot is busy, the pool account is tried first
+    acquire(pool)
+    pooled, _ = acquire(pool)
+    assert pooled.get_name() == "bot"
+    other = next(p for p in pool._clients if p.client is pooled_client)
+    assert (CHANNEL.id in other.no_access) == banned
+    assert other.is_available() == (not isinstance(error, FloodWait))
+
+
+def test_the_limit_applies_to_every_account():
+    clients = [_Client("bot"), _Client("pool")]
+    ClientPool(clients, lambda client: None).set_max_transmissions(3)
+    assert all(client.get_file_semaphore._value == 3 for client in clients)
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules import ConcurrencyController as controller_module
+from modules.ConcurrencyController import ConcurrencyController, HOLD_INTERVALS
+
+
+class _Pool:
+    """
+    A worker pool always saturated
+    """
+
+    def __init__(self):
+        self.size = 0
+
+    def resize(self, size: int) -> None:
+        self.size = size
+
+    def get_busy_count(self) -> int:
+        return self.size
+
+
+class _Network:
+    """
+    The downloaded bytes grow with the workers up to a bandwidth cap, one second per step
+    """
+
+    def __init__(self, pool: _Pool, per_worker: int, cap: int):
+        self.now = 0.0
+        self.bytes = 0
+        self.pool = pool
+        self._per_worker = per_worker
+        self._cap = cap
+
+    def tick(self) -> None:
+        self.now += 1
+        self.bytes += min(self.pool.size * self._per_worker, self._cap)
+
+
+@pytest.fixture
+def network(monkeypatch) -> _Network:
+    pool = _Pool()
+    network = _Network(pool, 100, 410)
+    monkeypatch.setattr(controller_module, "time", SimpleNamespace(monotonic=lambda: network.now))
+    return network
+
+
+def create_controller(network: _Network, demand: int = 10) -> ConcurrencyController:
+    controller = ConcurrencyController(network.pool, lambda: network.bytes, lambda: demand, 1, 8)
+
+    async def start() -> None:
+        # The steps are driven by the test, not by the control loop
+        controller.start()
+        controller.stop()
+
+    asyncio.run(start())
+    return controller
+
+
+def run_steps(controller: ConcurrencyController, network: _Network, steps: int) -> None:
+    for _ in range(steps):
+        network.tick()
+        controller._step()
+
+
+def test_the_pool_grows_until_the_throughput_stops_growing(network):
+    controller = create_controller(network)
+    assert network.pool.size == 1
+    run_steps(controller, network, 4)
+    assert controller.get_limit() == 5
+    # The fifth worker hits the bandwidth cap, it is rolled back
+    run_steps(controller, network, 1)
+    assert controller.get_limit() == 4
+    run_steps(controller, network, HOLD_INTERVALS)
+    assert controller.get_limit() == 4
+    # Probed again once the hold is over
+    run_steps(controller, network, 1)
+    assert controller.get_limit() == network.pool.size == 5
+
+
+def test_no_growth_without_waiting_jobs(network):
+    controller = create_controller(network, demand=0)
+    run_steps(controller, network, 5)
+    assert controller.get_limit() == 1
+
+
+def test_flood_wait_halves_the_pool(network):
+    controller = create_controller(network)
+    run_steps(controller, network, 8)
+    assert controller.get_limit() == 4
+    controller.record_flood_wait()
+    run_steps(controller, network, 1)
+    assert controller.get_limit() == network.pool.size == 2
+    controller.set_maximum(1)
+    assert controller.get_limit() == 1
+    assert controller.get_bounds() == (1, 1)
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import socket
+
+from modules.ControlApi import ControlApi
+
+
+def get_free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+async def request(port: int, method: str, path: str, body: dict | None = None, token: str = "") -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data: bytes = json.dumps(body).encode() if body is not None else b""
+    headers: str = f'Authorization: Bearer {token}\r\n' if token else ""
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n{headers}Content-Length: {len(data)}\r\n\r\n'
+                 .encode() + data)
+    await writer.drain()
+    response: bytes = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+def run_api(token: str, requests: list[tuple]) -> tuple[list[tuple[int, dict]], dict]:
+    state: dict = {"paused": False, "cancelled": []}
+
+    async def cancel(job_id: int) -> bool:
+        if job_id > 10:
+            return False
+        state["cancelled"].append(job_id)
+        return True
+
+    async def run() -> list[tuple[int, dict]]:
+        api = ControlApi(token, lambda: {"paused": state["paused"]}, {"cancel": cancel},
+                         {"pause": lambda: state.update(paused=True)})
+        port: int = get_free_port()
+        await api.start_server(port)
+        try:
+            return [await request(port, *args) for args in requests]
+        finally:
+            await api.stop_server()
+
+    return asyncio.run(run()), state
+
+
+def test_queue_and_job_actions():
+    responses, state = run_api("", [
+        ("GET", "/queue"),
+        ("POST", "/queue/pause/"),
+        ("POST", "/jobs/cancel", {"ids": [1, 2, 11]}),
+        ("GET", "/jobs/cancel"),
+        ("POST", "/jobs/cancel", {"ids": "1"}),
+        ("POST", "/jobs/explode", {"ids": [1]}),
+    ])
+    assert responses == [
+        (200, {"paused": False}),
+        (200, {"paused": True}),
+        (200, {"done": [1, 2], "failed": [11]}),
+        (405, {"error": "Use POST"}),
+        (400, {"error": 'The body must be {"ids": [job ids]}'}),
+        (404, {"error": "Not found"}),
+    ]
+    assert state["cancelled"] == [1, 2]
+
+
+def test_the_token_is_required():
+    responses, state = run_api("secret", [
+        ("POST", "/queue/pause"),
+        ("POST", "/queue/pause", None, "wrong"),
+        ("POST", "/queue/pause", None, "secret"),
+    ])
+    assert [status for status, _ in responses] == [401, 401, 200]
+    assert state["paused"]
@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules.DedupIndex import DedupIndex, XATTR_NAME
+
+
+def create_file(path, content: bytes = b"media") -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def supports_xattr(path) -> bool:
+    try:
+        os.setxattr(create_file(path / "probe"), XATTR_NAME, b"probe")
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def test_missing_files_are_dropped(tmp_path):
+    index = DedupIndex(tmp_path / "jobs.db")
+    file_path: str = create_file(tmp_path / "downloads" / "a.mp4")
+    index.add("a", file_path, 5)
+    assert index.lookup("a")["path"] == file_path
+    os.remove(file_path)
+    assert index.lookup("a") is None
+
+
+def test_rebuild_scans_every_download_dir_in_another_thread(tmp_path):
+    if not supports_xattr(tmp_path):
+        pytest.skip("The filesystem doesn't support extended attributes")
+    index = DedupIndex(tmp_path / "jobs.db")
+    routed: str = create_file(tmp_path / "routed" / "b.mp4")
+    os.setxattr(routed, XATTR_NAME, b"b")
+    index.add("gone", create_file(tmp_path / "downloads" / "gone.mp4"), 5)
+    os.remove(tmp_path / "downloads" / "gone.mp4")
+    with ThreadPoolExecutor(1) as executor:
+        dropped, indexed = executor.submit(index.rebuild, [str(tmp_path / "downloads"),
+                                                           str(tmp_path / "routed")]).result()
+    assert (dropped, indexed) == (1, 1)
+    assert index.lookup("b")["path"] == routed
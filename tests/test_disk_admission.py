@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules import DiskAdmission as disk_admission_module
+from modules.DiskAdmission import DiskAdmission, InsufficientDiskSpace
+from modules.FileFinalizer import PARTIAL_SUFFIX
+
+MB: int = 1024 * 1024
+
+
+@pytest.fixture
+def disk(monkeypatch) -> SimpleNamespace:
+    disk = SimpleNamespace(free=100 * MB)
+    monkeypatch.setattr(disk_admission_module.shutil, "disk_usage", lambda path: SimpleNamespace(free=disk.free))
+    return disk
+
+
+def test_reservations_share_the_free_space(tmp_path, disk):
+    async def run() -> None:
+        admission = DiskAdmission(10 * MB)
+        await admission.acquire(1, str(tmp_path / "a.mp4"), 50 * MB)
+        assert admission.get_available(str(tmp_path / "b.mp4")) == 40 * MB
+        assert admission.can_admit(str(tmp_path / "b.mp4"), 40 * MB)
+        assert not admission.can_admit(str(tmp_path / "b.mp4"), 41 * MB)
+        # The second job waits for the first one to give its space back
+        waiting: asyncio.Task = asyncio.create_task(admission.acquire(2, str(tmp_path / "b.mp4"), 60 * MB))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        admission.release(1)
+        await asyncio.wait_for(waiting, 1)
+        admission.release(2)
+        assert admission.get_available(str(tmp_path / "c.mp4")) == 90 * MB
+
+    asyncio.run(run())
+
+
+def test_a_file_that_never_fits_fails(tmp_path, disk):
+    async def run() -> None:
+        admission = DiskAdmission(10 * MB)
+        with pytest.raises(InsufficientDiskSpace):
+            await admission.acquire(1, str(tmp_path / "a.mp4"), 91 * MB)
+        # A failed acquire takes nothing
+        assert admission.get_available(str(tmp_path / "a.mp4")) == 90 * MB
+
+    asyncio.run(run())
+
+
+def test_the_partial_file_already_takes_its_space(tmp_path, disk):
+    file_path: str = str(tmp_path / "a.mp4")
+    with open(file_path + PARTIAL_SUFFIX, "wb") as partial_fp:
+        partial_fp.write(b"\1" * (4 * MB))
+    disk.free = 40 * MB
+
+    async def run() -> None:
+        admission = DiskAdmission(0)
+        # A resumed download only needs the missing part
+        assert admission.can_admit(file_path, 44 * MB)
+        await admission.acquire(1, file_path, 44 * MB)
+        assert admission.get_available(str(tmp_path / "b.mp4")) == 0
+
+    asyncio.run(run())
+
+
+def test_the_missing_directories_are_resolved(tmp_path, disk):
+    admission = DiskAdmission(0)
+    assert admission.get_available(str(tmp_path / "not" / "created" / "a.mp4")) == 100 * MB
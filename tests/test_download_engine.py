@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+import pytest
+
+from modules.ChunkJournal import ChunkJournal
+from modules.DownloadEngine import DownloadInterrupted, MIN_CHUNKED_SIZE, CHUNK_SIZE
+from modules.FileFinalizer import JOURNAL_SUFFIX, PARTIAL_SUFFIX
+from modules.RateLimiter import RateLimiter
+from modules.SimulatedTelegram import SimulatedFileServer, SimulatedMessage, SimulatedDownloadEngine
+
+FILE_SIZE: int = MIN_CHUNKED_SIZE + CHUNK_SIZE // 2
+
+
+def create_server() -> SimulatedFileServer:
+    return SimulatedFileServer(0, 1024 ** 4, 0, 0, 0, 0, 0, 0)
+
+
+def test_chunked_download_writes_the_whole_file(tmp_path):
+    server: SimulatedFileServer = create_server()
+    engine = SimulatedDownloadEngine(server, 4, True, RateLimiter(0, 0, ""))
+    file_path: str = str(tmp_path / "file.bin")
+    assert asyncio.run(engine.download(SimulatedMessage(server, FILE_SIZE), file_path)) == file_path
+    assert os.path.getsize(file_path) == FILE_SIZE
+    assert server.requests == 11
+
+
+def test_chunked_download_without_connections_is_not_finalized(tmp_path):
+    server: SimulatedFileServer = create_server()
+    engine = SimulatedDownloadEngine(server, 0, True, RateLimiter(0, 0, ""))
+    file_path: str = str(tmp_path / "file.bin")
+    with pytest.raises(DownloadInterrupted):
+        asyncio.run(engine.download(SimulatedMessage(server, FILE_SIZE), file_path))
+    assert not os.path.exists(file_path)
+    # The preallocated partial file is kept to be resumed
+    assert os.path.exists(file_path + PARTIAL_SUFFIX)
+    assert server.requests == 0
+
+
+class _InterruptingRateLimiter(RateLimiter):
+    """
+    Interrupts the download after letting through the given number of chunks
+    """
+    _chunks: int
+
+    def __init__(self, chunks: int):
+        super().__init__(0, 0, "")
+        self._chunks = chunks
+
+    async def consume(self, amount: int, job_bucket) -> None:
+        if self._chunks == 0:
+            raise DownloadInterrupted("Interrupted by the test")
+        self._chunks -= 1
+        await super().consume(amount, job_bucket)
+
+
+def test_interrupted_download_is_resumed(tmp_path):
+    server: SimulatedFileServer = create_server()
+    message = SimulatedMessage(server, FILE_SIZE)
+    file_path: str = str(tmp_path / "file.bin")
+    with pytest.raises(DownloadInterrupted):
+        asyncio.run(SimulatedDownloadEngine(server, 1, True, _InterruptingRateLimiter(4)).download(message, file_path))
+    journal_path: str = file_path + PARTIAL_SUFFIX + JOURNAL_SUFFIX
+    assert ChunkJournal(file_path + PARTIAL_SUFFIX).load({"file_size": FILE_SIZE}) == {0, 1, 2, 3}
+    engine = SimulatedDownloadEngine(server, 2, True, RateLimiter(0, 0, ""))
+    assert asyncio.run(engine.download(message, file_path)) == file_path
+    assert os.path.getsize(file_path) == FILE_SIZE
+    # Only the missing chunks are fetched again
+    assert server.requests == 11
+    assert not os.path.exists(file_path + PARTIAL_SUFFIX)
+    assert not os.path.exists(journal_path)
+
+
+def test_journal_of_another_media_is_ignored(tmp_path):
+    server: SimulatedFileServer = create_server()
+    file_path: str = str(tmp_path / "file.bin")
+    with pytest.raises(DownloadInterrupted):
+        asyncio.run(SimulatedDownloadEngine(server, 1, True, _InterruptingRateLimiter(4))
+                    .download(SimulatedMessage(server, FILE_SIZE), file_path))
+    engine = SimulatedDownloadEngine(server, 2, True, RateLimiter(0, 0, ""))
+    assert asyncio.run(engine.download(SimulatedMessage(server, FILE_SIZE), file_path)) == file_path
+    assert server.requests == 4 + 11
+
+
+def test_journal_skips_a_half_written_line(tmp_path):
+    journal = ChunkJournal(str(tmp_path / "file.bin") + PARTIAL_SUFFIX)
+    journal.open({"file_size": 10}, resume=False)
+    journal.mark(0)
+    journal.mark(2)
+    journal.close()
+    with open(str(tmp_path / "file.bin") + PARTIAL_SUFFIX + JOURNAL_SUFFIX, "a") as journal_fp:
+        journal_fp.write("3")
+    assert journal.load({"file_size": 10}) == {0, 2}
+    assert journal.load({"file_size": 11}) is None
+
+
+def test_jobs_with_the_same_destination_do_not_share_the_partial_file(tmp_path):
+    server: SimulatedFileServer = SimulatedFileServer(0.001, 1024 ** 4, 0, 0, 0, 0, 0, 0)
+    message = SimulatedMessage(server, FILE_SIZE)
+    file_path: str = str(tmp_path / "file.bin")
+
+    async def run() -> list[str]:
+        engines = [SimulatedDownloadEngine(server, 2, True, RateLimiter(0, 0, "")) for _ in range(2)]
+        return await asyncio.gather(*[engine.download(message, file_path) for engine in engines])
+
+    assert asyncio.run(run()) == [file_path, file_path]
+    # The second job waits for the first one, it doesn't take its chunks as already downloaded
+    assert server.requests == 22
+    assert os.path.getsize(file_path) == FILE_SIZE
+    assert os.listdir(tmp_path) == ["file.bin"]
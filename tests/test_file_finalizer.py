@@ -0,0 +1,65 @@
+import os
+
+from modules.FileFinalizer import FileFinalizer, JOURNAL_SUFFIX, PARTIAL_SUFFIX
+
+
+def create_partial(directory, name: str, content: bytes) -> str:
+    path: str = os.path.join(directory, name + PARTIAL_SUFFIX)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_suffix_keeps_both_files(tmp_path):
+    destination: str = str(tmp_path / "video.mp4")
+    finalizer = FileFinalizer("suffix")
+    assert finalizer.finalize(create_partial(tmp_path, "video.mp4", b"first"), destination) == destination
+    second: str = finalizer.finalize(create_partial(tmp_path, "video.mp4", b"second"), destination)
+    third: str = finalizer.finalize(create_partial(tmp_path, "video.mp4", b"third"), destination)
+    assert second == str(tmp_path / "video (1).mp4")
+    assert third == str(tmp_path / "video (2).mp4")
+    assert [read(destination), read(second), read(third)] == [b"first", b"second", b"third"]
+    assert not any(name.endswith(PARTIAL_SUFFIX) for name in os.listdir(tmp_path))
+
+
+def test_skip_drops_the_new_download(tmp_path):
+    destination: str = str(tmp_path / "video.mp4")
+    finalizer = FileFinalizer("skip")
+    assert not finalizer.is_skipped(destination)
+    finalizer.finalize(create_partial(tmp_path, "video.mp4", b"first"), destination)
+    assert finalizer.is_skipped(destination)
+    assert finalizer.finalize(create_partial(tmp_path, "video.mp4", b"second"), destination) is None
+    assert read(destination) == b"first"
+    assert os.listdir(tmp_path) == ["video.mp4"]
+
+
+def test_overwrite_replaces_the_file(tmp_path):
+    destination: str = str(tmp_path / "video.mp4")
+    finalizer = FileFinalizer("overwrite")
+    finalizer.finalize(create_partial(tmp_path, "video.mp4", b"first"), destination)
+    assert not finalizer.is_skipped(destination)
+    assert finalizer.finalize(create_partial(tmp_path, "video.mp4", b"second"), destination) == destination
+    assert read(destination) == b"second"
+    assert os.listdir(tmp_path) == ["video.mp4"]
+
+
+def test_sweep_removes_the_fresh_partial_files_of_a_crash(tmp_path):
+    videos, books = tmp_path / "videos", tmp_path / "books"
+    videos.mkdir()
+    books.mkdir()
+    create_partial(videos, "lost.mp4", b"data")
+    resumable: str = create_partial(books, "resumable.pdf", b"data")
+    orphan_journal: str = str(books / ("orphan.pdf" + PARTIAL_SUFFIX + JOURNAL_SUFFIX))
+    for journal_path in [resumable + JOURNAL_SUFFIX, orphan_journal]:
+        with open(journal_path, "w") as journal_fp:
+            journal_fp.write("{}\n")
+    assert FileFinalizer.sweep([str(videos), str(books), str(videos)], True) == (1, 1)
+    assert os.listdir(videos) == []
+    assert sorted(os.listdir(books)) == [os.path.basename(resumable), os.path.basename(resumable) + JOURNAL_SUFFIX]
+    assert FileFinalizer.sweep([str(books)], False) == (1, 0)
+    assert os.listdir(books) == []
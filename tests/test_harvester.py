@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+from pyrogram.enums import MessageMediaType
+
+from modules.Harvester import Harvester
+from modules.models.HarvestFilters import HarvestFilters
+
+CHAT_ID: int = -100123
+
+
+class _Client:
+    """
+    A chat whose messages with an even id contain a document
+    """
+
+    def __init__(self, last_id: int):
+        self.last_id = last_id
+
+    async def get_chat(self, chat):
+        return SimpleNamespace(id=CHAT_ID, username=None)
+
+    async def get_messages(self, chat_id: int, ids: list[int]) -> list:
+        return [SimpleNamespace(id=message_id, empty=message_id > self.last_id,
+                                media=MessageMediaType.DOCUMENT if message_id % 2 == 0 else None,
+                                document=SimpleNamespace(file_size=1), date=None) for message_id in ids]
+
+
+def harvest(harvester: Harvester, to_id: int | None = None) -> list[int]:
+    handed_over: list[int] = []
+
+    async def on_page(_, messages: list) -> None:
+        handed_over.extend(message.id for message in messages)
+
+    asyncio.run(harvester.harvest(CHAT_ID, None, to_id, HarvestFilters(), on_page))
+    return handed_over
+
+
+def test_cursor_waits_for_the_pending_messages(tmp_path):
+    harvester = Harvester(_Client(10), tmp_path / "jobs.db")
+    assert harvest(harvester, 10) == [2, 4, 6, 8, 10]
+    # Nothing has been downloaded yet
+    assert harvester.get_cursor(CHAT_ID) == 1
+    harvester.complete(CHAT_ID, 4)
+    assert harvester.get_cursor(CHAT_ID) == 1
+    harvester.complete(CHAT_ID, 2)
+    assert harvester.get_cursor(CHAT_ID) == 5
+    for message_id in [6, 8, 10]:
+        harvester.complete(CHAT_ID, message_id)
+    assert harvester.get_cursor(CHAT_ID) == 10
+
+
+def test_interrupted_messages_are_harvested_again(tmp_path):
+    harvester = Harvester(_Client(10), tmp_path / "jobs.db")
+    harvest(harvester, 10)
+    harvester.complete(CHAT_ID, 2)
+    harvester.close()
+    # A new run, the downloads of the previous one never ended
+    assert harvest(Harvester(_Client(10), tmp_path / "jobs.db"), 10) == [4, 6, 8, 10]
+
+
+def test_failed_messages_are_retried_by_the_next_harvest(tmp_path):
+    harvester = Harvester(_Client(10), tmp_path / "jobs.db")
+    harvest(harvester, 10)
+    for message_id in [2, 6, 8, 10]:
+        harvester.complete(CHAT_ID, message_id)
+    harvester.fail(CHAT_ID, 4)
+    # The cursor moves on, the failure is kept aside
+    assert harvester.get_cursor(CHAT_ID) == 10
+    assert harvester.get_failures(CHAT_ID) == [4]
+    harvester.close()
+    harvester = Harvester(_Client(14), tmp_path / "jobs.db")
+    assert harvest(harvester, 14) == [4, 12, 14]
+    for message_id in [4, 12, 14]:
+        harvester.complete(CHAT_ID, message_id)
+    assert harvester.get_failures(CHAT_ID) == []
+    assert harvester.get_cursor(CHAT_ID) == 14
+
+
+def test_deleted_failed_messages_are_forgotten(tmp_path):
+    harvester = Harvester(_Client(0), tmp_path / "jobs.db")
+    harvester.fail(CHAT_ID, 4)
+    assert harvest(harvester, 10) == []
+    assert harvester.get_failures(CHAT_ID) == []
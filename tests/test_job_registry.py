@@ -0,0 +1,83 @@
+import asyncio
+
+from modules.JobRegistry import JobRegistry
+from modules.JobScheduler import JobScheduler
+from modules.RetryScheduler import RetryScheduler
+from modules.models.Job import Job, JobState
+
+
+def create_job(job_id: int) -> Job:
+    job = Job()
+    job.id, job.user_id, job.file_size, job.file_name, job.state = job_id, 1, 0, f'{job_id}.mp4', JobState.QUEUED
+    return job
+
+
+def create_registry() -> tuple[JobRegistry, JobScheduler, RetryScheduler]:
+    queue = JobScheduler()
+    retry_scheduler = RetryScheduler(3)
+    registry = JobRegistry(queue, retry_scheduler, queue.put_nowait)
+    return registry, queue, retry_scheduler
+
+
+def test_jobs_are_listed_by_status():
+    async def run() -> None:
+        registry, queue, retry_scheduler = create_registry()
+        jobs: list[Job] = [create_job(job_id) for job_id in range(1, 6)]
+        for job in jobs:
+            registry.add(job)
+        for job in jobs[:3] + jobs[4:]:
+            queue.put_nowait(job)
+        jobs[0].state = JobState.DOWNLOADING
+        retry_scheduler.schedule(jobs[3], ConnectionError(), queue.put_nowait)
+        assert registry.pause(5)
+        assert [registry.get_status(job) for job in registry.get_jobs()] == \
+            ["downloading", "queued", "queued", "retrying", "paused"]
+        # The paused job left the queue, it's served again once resumed
+        assert registry.resume(5) and not registry.resume(5)
+        assert queue.get_jobs()[-1] is jobs[4]
+        jobs[1].state = JobState.DONE
+        registry.update(jobs[1])
+        assert registry.get(2) is None and registry.get_count() == 4
+        retry_scheduler.cancel(4)
+
+    asyncio.run(run())
+
+
+def test_waiting_jobs_are_taken_out_and_running_ones_interrupted():
+    async def run() -> None:
+        registry, queue, retry_scheduler = create_registry()
+        queued, retrying, running = create_job(1), create_job(2), create_job(3)
+        for job in [queued, retrying, running]:
+            registry.add(job)
+        queue.put_nowait(queued)
+        retry_scheduler.schedule(retrying, ConnectionError(), queue.put_nowait)
+        assert registry.cancel(1) is queued and queue.qsize() == 0
+        assert registry.cancel(2) is retrying and not retry_scheduler.is_pending(2)
+        task: asyncio.Task = asyncio.create_task(asyncio.sleep(10))
+        registry.attach(running, task)
+        assert registry.cancel(3) is None
+        assert running.interrupt == "cancel"
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        assert registry.cancel(99) is None
+
+    asyncio.run(run())
+
+
+def test_a_job_interrupted_before_its_download_is_cancelled_on_attach():
+    async def run() -> None:
+        registry, _, _ = create_registry()
+        job = create_job(1)
+        registry.add(job)
+        assert registry.pause(1)
+        assert job.interrupt == "pause"
+        task: asyncio.Task = asyncio.create_task(asyncio.sleep(10))
+        registry.attach(job, task)
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        # The worker hands the job back
+        registry.hold(job)
+        assert job.interrupt is None and registry.get_status(job) == "paused"
+        assert not registry.pause(1)
+
+    asyncio.run(run())
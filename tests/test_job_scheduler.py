@@ -0,0 +1,70 @@
+import asyncio
+
+from modules.JobScheduler import JobScheduler
+from modules.models.Job import Job
+
+
+def create_job(job_id: int, user_id: int, file_size: int = 0) -> Job:
+    job = Job()
+    job.id, job.user_id, job.file_size = job_id, user_id, file_size
+    return job
+
+
+def drain(scheduler: JobScheduler) -> list[int]:
+    return [scheduler.get_nowait().id for _ in range(scheduler.qsize())]
+
+
+def test_users_are_served_in_round_robin():
+    async def run() -> list[int]:
+        scheduler = JobScheduler()
+        for job_id in range(1, 5):
+            scheduler.put_nowait(create_job(job_id, 1))
+        scheduler.put_nowait(create_job(5, 2))
+        scheduler.put_nowait(create_job(6, 2))
+        scheduler.put_nowait(create_job(7, 3))
+        return drain(scheduler)
+
+    assert asyncio.run(run()) == [1, 5, 7, 2, 6, 3, 4]
+
+
+def test_smallest_first_orders_each_user():
+    async def run() -> list[int]:
+        scheduler = JobScheduler()
+        scheduler.set_smallest_first(True)
+        scheduler.put_nowait(create_job(1, 1, 300))
+        scheduler.put_nowait(create_job(2, 1, 100))
+        scheduler.put_nowait(create_job(3, 1, 200))
+        scheduler.put_nowait(create_job(4, 1, 100))
+        return drain(scheduler)
+
+    assert asyncio.run(run()) == [2, 4, 3, 1]
+
+
+def test_bump_and_remove():
+    async def run() -> tuple[list[int], list[int]]:
+        scheduler = JobScheduler()
+        for job_id in range(1, 5):
+            scheduler.put_nowait(create_job(job_id, job_id % 2))
+        assert scheduler.bump(4).id == 4
+        assert scheduler.remove(1).id == 1
+        assert scheduler.remove(1) is None
+        assert scheduler.bump(1) is None
+        return [job.id for job in scheduler.get_jobs()], drain(scheduler)
+
+    listed, served = asyncio.run(run())
+    assert listed == served == [4, 3, 2]
+
+
+def test_paused_queue_holds_the_jobs():
+    async def run() -> None:
+        scheduler = JobScheduler()
+        scheduler.set_paused(True)
+        assert scheduler.is_paused()
+        getter: asyncio.Task = asyncio.create_task(scheduler.get())
+        scheduler.put_nowait(create_job(1, 1))
+        await asyncio.sleep(0.01)
+        assert not getter.done()
+        scheduler.set_paused(False)
+        assert (await asyncio.wait_for(getter, 1)).id == 1
+
+    asyncio.run(run())
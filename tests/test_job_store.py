@@ -0,0 +1,39 @@
+import sqlite3
+
+from modules.JobStore import JobStore
+from modules.models.Job import JobState
+
+
+def test_pending_jobs_survive_a_restart(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    first = store.add(1, 10, 0, 0, "a.mp4", 7, 100)
+    second = store.add(2, 20, 5, 0, "b.mp4", 8, 200)
+    done = store.add(1, 30, 0, 0, "c.mp4", 7, 300)
+    store.update_state(second, JobState.DOWNLOADING)
+    store.update_reply(second, 99)
+    store.update_state(done, JobState.DONE)
+    store.close()
+    store = JobStore(tmp_path / "jobs.db")
+    pending = store.get_pending()
+    assert [job.id for job in pending] == [first.id, second.id]
+    # Without a reply chat the reply is sent in the media's chat
+    assert pending[0].reply_chat_id == 1
+    assert (pending[1].reply_chat_id, pending[1].reply_id, pending[1].state) == (5, 99, JobState.DOWNLOADING)
+    assert (pending[1].file_name, pending[1].user_id, pending[1].file_size) == ("b.mp4", 8, 200)
+    store.purge_finished()
+    store.close()
+    with sqlite3.connect(tmp_path / "jobs.db") as connection:
+        assert connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 2
+
+
+def test_old_stores_are_migrated(tmp_path):
+    with sqlite3.connect(tmp_path / "jobs.db") as connection:
+        connection.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, "
+                           "message_id INTEGER NOT NULL, reply_id INTEGER NOT NULL, file_name TEXT NOT NULL, "
+                           "state TEXT NOT NULL, created_at REAL NOT NULL)")
+        connection.execute("INSERT INTO jobs (chat_id, message_id, reply_id, file_name, state, created_at) "
+                           "VALUES (1, 10, 3, 'a.mp4', 'queued', 0)")
+    store = JobStore(tmp_path / "jobs.db")
+    job = store.get_pending()[0]
+    assert (job.user_id, job.file_size, job.reply_chat_id, job.reply_id) == (0, 0, 1, 3)
+    store.close()
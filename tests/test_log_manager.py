@@ -0,0 +1,73 @@
+import atexit
+import json
+import logging
+import sys
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+
+import pytest
+
+from modules.LogManager import LogManager, JsonFormatter
+
+
+@pytest.fixture
+def log_manager(tmp_path):
+    root: logging.Logger = logging.getLogger()
+    handlers: list[logging.Handler] = root.handlers[:]
+    level: int = root.level
+    manager = LogManager(str(tmp_path / "test.log"))
+    yield manager
+    manager.stop()
+    atexit.unregister(manager.stop)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def read_entries(tmp_path) -> list[dict]:
+    with open(tmp_path / "test.log", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_json_formatter_puts_the_extra_fields_at_the_top_level():
+    record = logging.LogRecord("downloader", logging.INFO, __file__, 1, "%s downloaded", ("file.bin",), None)
+    record.__dict__.update(job_id=3, file_size=10, path=object)
+    entry: dict = json.loads(JsonFormatter().format(record))
+    assert entry.pop("time")
+    assert entry == {"level": "INFO", "logger": "downloader", "message": "file.bin downloaded", "job_id": 3,
+                     "file_size": 10, "path": str(object)}
+
+
+def test_json_formatter_adds_the_exception():
+    try:
+        raise OSError("Disk full")
+    except OSError:
+        record = logging.makeLogRecord({"msg": "Failed", "levelname": "ERROR", "exc_info": sys.exc_info()})
+    entry: dict = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Failed"
+    assert "OSError: Disk full" in entry["exception"]
+
+
+def test_records_are_written_as_json_lines(log_manager, tmp_path):
+    logging.info("Downloaded", extra={"job_id": 1, "duration": 1.5})
+    logging.debug("Not logged")
+    log_manager.stop()
+    assert [(entry["level"], entry["message"], entry.get("job_id")) for entry in read_entries(tmp_path)] == [
+        ("INFO", "Downloaded", 1)]
+
+
+def test_configure_applies_the_level_and_the_rotation(log_manager, tmp_path):
+    assert isinstance(log_manager._listener.handlers[1], RotatingFileHandler)
+    logging.info("Before")
+    log_manager.configure("warning", 1, 2, "midnight")
+    file_handler: logging.Handler = log_manager._listener.handlers[1]
+    assert isinstance(file_handler, TimedRotatingFileHandler) and file_handler.backupCount == 2
+    logging.info("Dropped")
+    logging.warning("After")
+    log_manager.configure("info", 5, 1, "")
+    file_handler = log_manager._listener.handlers[1]
+    assert isinstance(file_handler, RotatingFileHandler) and file_handler.maxBytes == 5 * 1024 * 1024
+    log_manager.stop()
+    # The file is appended to across the switches
+    assert [entry["message"] for entry in read_entries(tmp_path)] == ["Before", "After"]
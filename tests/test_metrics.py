@@ -0,0 +1,84 @@
+import asyncio
+import math
+import socket
+
+from modules.Metrics import Metrics
+
+
+def get_free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def create_metrics() -> Metrics:
+    metrics = Metrics()
+    downloads = metrics.counter("tg_downloads_total", "Finished downloads")
+    downloads.inc(outcome="done")
+    downloads.inc(2, outcome="failed")
+    metrics.gauge("tg_queue_size", "Waiting jobs", lambda: 4)
+    duration = metrics.histogram("tg_download_seconds", "Download duration", [1, 10])
+    for value in (0.5, 5, 20):
+        duration.observe(value)
+    return metrics
+
+
+def test_render():
+    assert create_metrics().render().splitlines() == [
+        "# HELP tg_downloads_total Finished downloads",
+        "# TYPE tg_downloads_total counter",
+        'tg_downloads_total{outcome="done"} 1',
+        'tg_downloads_total{outcome="failed"} 2',
+        "# HELP tg_queue_size Waiting jobs",
+        "# TYPE tg_queue_size gauge",
+        "tg_queue_size 4",
+        "# HELP tg_download_seconds Download duration",
+        "# TYPE tg_download_seconds histogram",
+        'tg_download_seconds_bucket{le="1"} 1',
+        'tg_download_seconds_bucket{le="10"} 2',
+        'tg_download_seconds_bucket{le="+Inf"} 3',
+        "tg_download_seconds_sum 25.5",
+        "tg_download_seconds_count 3",
+    ]
+
+
+def test_counter_labels_are_sorted():
+    counter = Metrics().counter("tg_bytes_total", "Downloaded bytes")
+    counter.inc(10, chat="1", kind="video")
+    counter.inc(5, kind="video", chat="1")
+    assert counter.get(kind="video", chat="1") == 15
+    assert counter.get(chat="2") == 0
+
+
+def test_histogram_quantiles():
+    histogram = Metrics().histogram("tg_speed", "Download speed", [1, 10, 100])
+    assert histogram.get_quantile(0.5) is None
+    for value in (0.5, 2, 3, 50, 500):
+        histogram.observe(value)
+    assert histogram.get_quantile(0.2) == 1
+    assert histogram.get_quantile(0.5) == 10
+    assert histogram.get_quantile(0.8) == 100
+    assert histogram.get_quantile(0.99) == math.inf
+
+
+def test_server_serves_the_metrics_page():
+    metrics = create_metrics()
+
+    async def get(port: int, path: str) -> tuple[bytes, bytes]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        await writer.drain()
+        head, _, body = (await reader.read()).partition(b"\r\n\r\n")
+        writer.close()
+        return head.split(b"\r\n")[0], body
+
+    async def run() -> list[tuple[bytes, bytes]]:
+        port: int = get_free_port()
+        await metrics.start_server("127.0.0.1", port)
+        try:
+            return [await get(port, "/metrics?format=text"), await get(port, "/")]
+        finally:
+            await metrics.stop_server()
+
+    assert asyncio.run(run()) == [(b"HTTP/1.1 200 OK", metrics.render().encode()),
+                                  (b"HTTP/1.1 404 Not Found", b"Not Found\n")]
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+
+from modules.Coordinator import Coordinator, RemoteJobError
+from modules.NodeProtocol import parse_address, open_connection, start_server, NodeConnection
+from modules.models.Job import Job
+
+
+def create_job(job_id: int) -> Job:
+    job = Job()
+    job.id = job_id
+    job.chat_id = job.user_id = 1
+    job.message_id = job_id
+    job.file_name = f'file{job_id}.bin'
+    job.file_size = 10
+    return job
+
+
+def test_parse_address():
+    assert parse_address("unix:/tmp/tg.sock") == ("unix", "/tmp/tg.sock", 0)
+    assert parse_address("10.0.0.2:8090") == ("tcp", "10.0.0.2", 8090)
+    assert parse_address("[::1]:8090") == ("tcp", "::1", 8090)
+    assert parse_address(":8090") == ("tcp", "0.0.0.0", 8090)
+    for address in ("unix:", "localhost", "localhost:http", "localhost:0", "localhost:70000"):
+        with pytest.raises(ValueError):
+            parse_address(address)
+
+
+def test_frames_round_trip(tmp_path):
+    address: str = f'unix:{tmp_path / "node.sock"}'
+
+    async def echo(connection: NodeConnection) -> None:
+        while frame := await connection.receive():
+            await connection.send({"echo": frame})
+
+    async def run() -> list:
+        server = await start_server(address, echo)
+        try:
+            connection: NodeConnection = await open_connection(address)
+            await connection.send({"type": "hello", "slots": 2})
+            connection.send_nowait({"type": "cancel", "job_id": 3})
+            frames: list = [await connection.receive(), await connection.receive()]
+            connection.close()
+            return frames
+        finally:
+            server.close()
+
+    assert asyncio.run(run()) == [{"echo": {"type": "hello", "slots": 2}}, {"echo": {"type": "cancel", "job_id": 3}}]
+
+
+def test_receive_rejects_a_non_object_frame_and_ends_on_close(tmp_path):
+    address: str = f'unix:{tmp_path / "node.sock"}'
+
+    async def reply(connection: NodeConnection) -> None:
+        connection._writer.write(b'[1, 2]\n')
+        await connection._writer.drain()
+
+    async def run() -> dict | None:
+        server = await start_server(address, reply)
+        try:
+            connection: NodeConnection = await open_connection(address)
+            with pytest.raises(ValueError):
+                await connection.receive()
+            frame: dict | None = await connection.receive()
+            connection.close()
+            return frame
+        finally:
+            server.close()
+
+    assert asyncio.run(run()) is None
+
+
+def test_start_server_replaces_a_stale_socket(tmp_path):
+    address: str = f'unix:{tmp_path / "node.sock"}'
+
+    async def run() -> None:
+        for _ in range(2):
+            server = await start_server(address, lambda connection: asyncio.sleep(0))
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(run())
+
+
+def run_coordinator(tmp_path, node) -> tuple[list, list]:
+    address: str = f'unix:{tmp_path / "coordinator.sock"}'
+    outcomes: list = []
+
+    async def handler(job: Job, remote_node) -> None:
+        async def progress(current: int, total: int, name: str) -> None:
+            outcomes.append((name, current, total))
+
+        try:
+            outcomes.append(await remote_node.run(job, progress, ("progress",)))
+        except (RemoteJobError, ConnectionError) as e:
+            outcomes.append(type(e).__name__)
+
+    async def run() -> list:
+        coordinator = Coordinator(address, "secret", queue, handler)
+        await coordinator.start()
+        try:
+            connection: NodeConnection = await open_connection(address)
+            frames: list = await node(connection, coordinator)
+            connection.close()
+            return frames
+        finally:
+            coordinator.stop()
+
+    queue: asyncio.Queue = asyncio.Queue()
+    return asyncio.run(run()), outcomes
+
+
+def test_coordinator_rejects_a_wrong_token(tmp_path):
+    async def node(connection: NodeConnection, coordinator: Coordinator) -> list:
+        await connection.send({"type": "hello", "token": "guess", "slots": 1})
+        return [await connection.receive(), await connection.receive(), coordinator.get_nodes()]
+
+    frames, _ = run_coordinator(tmp_path, node)
+    assert frames == [{"type": "error", "message": "Wrong token"}, None, []]
+
+
+def test_coordinator_sends_the_jobs_to_the_node(tmp_path):
+    async def node(connection: NodeConnection, coordinator: Coordinator) -> list:
+        await connection.send({"type": "hello", "token": "secret", "name": "node1", "slots": 1})
+        frames: list = [await connection.receive()]
+        [remote_node] = coordinator.get_nodes()
+        frames.append((remote_node.name, remote_node.slots))
+        for job_id in (1, 2):
+            coordinator._queue.put_nowait(create_job(job_id))
+        job: dict = (await connection.receive())["job"]
+        frames.append(job)
+        await connection.send({"type": "progress", "job_id": 1, "current": 5, "total": 10})
+        await connection.send({"type": "done", "job_id": 1, "result": {"file_path": "/downloads/file1.bin"}})
+        # A single slot, the second job is sent once the first one is done
+        frames.append((await connection.receive())["job"]["id"])
+        await connection.send({"type": "failed", "job_id": 2, "error": "OSError", "message": "Disk full",
+                               "retryable": True})
+        await coordinator._queue.join()
+        return frames
+
+    frames, outcomes = run_coordinator(tmp_path, node)
+    assert frames == [
+        {"type": "welcome"},
+        ("node1", 1),
+        {"id": 1, "chat_id": 1, "message_id": 1, "file_name": "file1.bin", "file_size": 10, "user_id": 1},
+        2,
+    ]
+    assert outcomes == [("progress", 5, 10), {"file_path": "/downloads/file1.bin"}, "RemoteJobError"]
+
+
+def test_disconnected_node_fails_its_running_jobs(tmp_path):
+    async def node(connection: NodeConnection, coordinator: Coordinator) -> list:
+        await connection.send({"type": "hello", "token": "secret", "slots": 2})
+        await connection.receive()
+        coordinator._queue.put_nowait(create_job(1))
+        await connection.receive()
+        connection.close()
+        await coordinator._queue.join()
+        while coordinator.get_nodes():
+            await asyncio.sleep(0.01)
+        return []
+
+    _, outcomes = run_coordinator(tmp_path, node)
+    assert outcomes == ["ConnectionError"]
@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+from modules.PostProcessor import ExtractStage, HashStage, HookStage, PostProcessor
+
+
+def create_file(path, content: bytes = b"media") -> str:
+    path.write_bytes(content)
+    return str(path)
+
+
+def process(stages: list, file_path: str, context: dict) -> list[str]:
+    post_processor = PostProcessor(1, stages)
+    try:
+        return asyncio.run(post_processor.process(file_path, context))
+    finally:
+        post_processor.close()
+
+
+def test_hash_stage_reuses_the_streamed_hash(tmp_path):
+    file_path: str = create_file(tmp_path / "video.mp4")
+    context: dict = {}
+    assert process([HashStage()], file_path, context) == [f'SHA-256 {hashlib.sha256(b"media").hexdigest()}']
+    context = {"sha256": "streamed"}
+    assert process([HashStage()], file_path, context) == ["SHA-256 streamed"]
+
+
+def test_extract_zip_and_tar(tmp_path):
+    zip_path: str = str(tmp_path / "photos.zip")
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("a.jpg", b"a")
+        archive.writestr("album/b.jpg", b"b")
+    tar_path: str = str(tmp_path / "books.tar.gz")
+    with tarfile.open(tar_path, "w:gz") as archive:
+        info = tarfile.TarInfo("book.pdf")
+        info.size = 4
+        archive.addfile(info, io.BytesIO(b"book"))
+    context: dict = {}
+    assert process([ExtractStage()], zip_path, context) == ["2 entries extracted in photos"]
+    assert context["extracted_path"] == os.path.realpath(tmp_path / "photos")
+    assert (tmp_path / "photos" / "album" / "b.jpg").read_bytes() == b"b"
+    assert process([ExtractStage()], tar_path, {}) == ["1 entries extracted in books"]
+    assert (tmp_path / "books" / "book.pdf").read_bytes() == b"book"
+    assert process([ExtractStage()], create_file(tmp_path / "video.mp4"), {}) == []
+
+
+def test_extract_rejects_entries_outside_the_folder(tmp_path):
+    zip_path: str = str(tmp_path / "evil.zip")
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("../escaped.txt", b"x")
+    outcomes: list[str] = process([ExtractStage(), HashStage()], zip_path, {})
+    # A failing stage stops the following ones
+    assert len(outcomes) == 1 and outcomes[0].startswith("extract failed")
+    assert not (tmp_path / "escaped.txt").exists()
+
+
+def test_hook_receives_the_file_details(tmp_path):
+    file_path: str = create_file(tmp_path / "video.mp4")
+    output: str = str(tmp_path / "hook.txt")
+    hook = HookStage(f'echo "$TG_FILE_PATH $TG_JOB_ID" > "{output}"')
+    assert process([hook], file_path, {"job_id": 7, "sha256": None}) == ["hook completed"]
+    with open(output) as output_fp:
+        assert output_fp.read().strip() == f'{os.path.abspath(file_path)} 7'
+    outcomes: list[str] = process([HookStage("echo broken >&2; exit 3")], file_path, {})
+    assert outcomes == ["hook failed: The hook exited with code 3: broken"]
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="The hooks run in a process group on POSIX only")
+def test_close_kills_the_running_hooks(tmp_path):
+    file_path: str = create_file(tmp_path / "video.mp4")
+
+    async def run() -> tuple[list[str], float]:
+        post_processor = PostProcessor(1, [HookStage("sleep 30; sleep 30")])
+        task: asyncio.Task = asyncio.create_task(post_processor.process(file_path, {}))
+        await asyncio.sleep(0.3)
+        started_at: float = time.monotonic()
+        await asyncio.get_event_loop().run_in_executor(None, post_processor.close)
+        return await task, time.monotonic() - started_at
+
+    outcomes, close_time = asyncio.run(run())
+    assert close_time < 5
+    assert outcomes == ["hook failed: The hook was killed, stopping"]
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from pyrogram.errors import FloodWait
+
+from modules.ProgressReporter import ProgressReporter
+from modules.models.JobBatch import JobBatch
+
+
+class _Chat:
+    id: int = 1
+
+
+class _Reply:
+    """
+    A status reply failing its first edit with a FloodWait
+    """
+
+    def __init__(self, reply_id: int, flood_wait: int = 0):
+        self.id = reply_id
+        self.chat = _Chat()
+        self.text = ""
+        self.edits = []
+        self._flood_wait = flood_wait
+
+    async def edit(self, text: str) -> "_Reply":
+        if self._flood_wait:
+            value, self._flood_wait = self._flood_wait, 0
+            raise FloodWait(value=value)
+        self.edits.append(text)
+        self.text = text
+        return self
+
+
+def test_progress_edits_are_coalesced():
+    async def run() -> list[str]:
+        reporter = ProgressReporter(100)
+        reply = _Reply(1)
+        for current in range(0, 101, 10):
+            reporter.update(reply, current, 100)
+        reporter.start()
+        await asyncio.sleep(0.1)
+        reporter.stop()
+        return reply.edits
+
+    edits: list[str] = asyncio.run(run())
+    assert len(edits) == 1
+    assert edits[0].startswith("Downloading: 100%")
+
+
+def test_flood_wait_does_not_block_finish():
+    async def run() -> tuple[float, list[str]]:
+        reporter = ProgressReporter(100)
+        flooded = _Reply(1, flood_wait=1)
+        reporter.start()
+        reporter.update(flooded, 10, 100)
+        await asyncio.sleep(0.05)
+        started_at: float = time.monotonic()
+        await reporter.finish(_Reply(2))
+        finish_time: float = time.monotonic() - started_at
+        reporter.show(flooded, "Paused")
+        await asyncio.sleep(1.2)
+        reporter.stop()
+        return finish_time, flooded.edits
+
+    finish_time, edits = asyncio.run(run())
+    assert finish_time < 0.5
+    # The pending status is sent once the FloodWait is over
+    assert edits == ["Paused"]
+
+
+def test_batch_outcomes_share_the_budget():
+    async def run() -> list[str]:
+        reporter = ProgressReporter(10)
+        reply = _Reply(1)
+        batch = JobBatch("Harvest", 500, 0)
+        reporter.start()
+        for _ in range(batch.total):
+            batch.done += 1
+            reporter.show(reply, batch.get_summary())
+            await asyncio.sleep(0)
+        assert batch.is_finished()
+        await asyncio.sleep(0.3)
+        reporter.stop()
+        return reply.edits
+
+    edits: list[str] = asyncio.run(run())
+    assert len(edits) <= 3
+    assert edits[-1] == "**Harvest:** 500/500 downloaded"
+
+
+def test_growing_batch_is_not_finished():
+    batch = JobBatch("Harvest", 0, 0)
+    batch.growing = True
+    assert not batch.is_finished()
+    batch.growing = False
+    assert batch.is_finished()
+    batch.total = 2
+    batch.failed = 1
+    assert not batch.is_finished()
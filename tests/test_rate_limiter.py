@@ -0,0 +1,53 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+from modules import RateLimiter as rate_limiter_module
+from modules.RateLimiter import RateLimiter, TokenBucket
+from modules.helpers import parse_rate_schedule
+
+
+def test_parse_rate_schedule():
+    assert parse_rate_schedule("") == []
+    assert parse_rate_schedule(" 09:00-18:30=2048, ,22:00-06:00=0") == [(540, 1110, 2048), (1320, 360, 0)]
+
+
+@pytest.mark.parametrize("schedule", ["09:00-18:00", "24:00-01:00=10", "09:60-10:00=10", "09:00=10", "a-b=1"])
+def test_parse_rate_schedule_rejects_malformed(schedule):
+    with pytest.raises(ValueError):
+        parse_rate_schedule(schedule)
+
+
+def test_token_bucket_allows_a_burst_then_limits():
+    async def run() -> tuple[float, float]:
+        bucket = TokenBucket(10000)
+        start: float = time.monotonic()
+        await bucket.consume(10000)
+        burst: float = time.monotonic() - start
+        await bucket.consume(2000)
+        return burst, time.monotonic() - start
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert 0.18 < total < 0.5
+
+
+def test_token_bucket_zero_rate_is_unlimited():
+    async def run() -> None:
+        await TokenBucket(0).consume(10 ** 12)
+
+    asyncio.run(asyncio.wait_for(run(), 1))
+
+
+@pytest.mark.parametrize("hour, limit", [(10, 2048), (23, 64), (3, 64), (7, 512)])
+def test_current_limit_follows_the_schedule(monkeypatch, hour, limit):
+    class FixedDatetime:
+        @staticmethod
+        def now() -> datetime:
+            return datetime(2024, 1, 1, hour, 0)
+
+    monkeypatch.setattr(rate_limiter_module, "datetime", FixedDatetime)
+    limiter = RateLimiter(512, 0, "09:00-18:00=2048,22:00-06:00=64")
+    assert limiter.get_current_limit() == limit
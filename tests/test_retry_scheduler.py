@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from pyrogram.errors import FloodWait, InternalServerError, MessageIdInvalid, MessageNotModified, ChannelPrivate
+
+from modules.DownloadEngine import DownloadInterrupted
+from modules.RetryScheduler import RetryScheduler, MAX_DELAY
+from modules.models.Job import Job
+
+
+def create_job(job_id: int = 1, attempts: int = 0) -> Job:
+    job = Job()
+    job.id, job.file_name, job.attempts = job_id, "file.bin", attempts
+    return job
+
+
+@pytest.mark.parametrize("error, retried", [
+    (FloodWait(value=10), True),
+    (InternalServerError(), True),
+    (ConnectionError(), True),
+    (DownloadInterrupted("stopped"), True),
+    # The errors of the status edits must not be taken for download errors
+    (MessageNotModified(), False),
+    (MessageIdInvalid(), False),
+    (ChannelPrivate(), False),
+    (ValueError(), False),
+])
+def test_only_transient_errors_are_retried(error, retried):
+    assert RetryScheduler(3).should_retry(create_job(), error) is retried
+
+
+def test_attempts_are_bounded():
+    scheduler = RetryScheduler(3)
+    assert scheduler.should_retry(create_job(attempts=1), InternalServerError())
+    assert not scheduler.should_retry(create_job(attempts=2), InternalServerError())
+
+
+def test_delay():
+    scheduler = RetryScheduler(3)
+    assert 11 <= scheduler.get_delay(create_job(), FloodWait(value=10)) <= 15
+    assert 2.5 <= scheduler.get_delay(create_job(), InternalServerError()) <= 7.5
+    assert scheduler.get_delay(create_job(attempts=20), InternalServerError()) <= 1.5 * MAX_DELAY
+
+
+def test_scheduled_attempt_can_be_cancelled(monkeypatch):
+    monkeypatch.setattr(RetryScheduler, "get_delay", lambda self, job, error: 0.01)
+
+    async def run() -> list[int]:
+        scheduler = RetryScheduler(3)
+        enqueued: list[int] = []
+        for job_id in [1, 2]:
+            scheduler.schedule(create_job(job_id), InternalServerError(), lambda job: enqueued.append(job.id))
+        assert scheduler.get_pending_count() == 2
+        assert scheduler.cancel(2).attempts == 1
+        assert scheduler.cancel(2) is None
+        await asyncio.sleep(0.05)
+        assert not scheduler.is_pending(1)
+        return enqueued
+
+    assert asyncio.run(run()) == [1]
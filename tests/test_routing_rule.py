@@ -0,0 +1,104 @@
+import os
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pyrogram.enums import MessageMediaType
+
+from modules.ConfigManager import ConfigManager
+from modules.models.ConfigFile import ConfigFile
+from modules.models.RoutingRule import RoutingRule
+
+
+def create_message(media_type: MessageMediaType = MessageMediaType.VIDEO, mime_type: str = "video/mp4",
+                   file_size: int = 1024, chat_id: int = -100, username: str | None = "Source",
+                   forwarded_from: SimpleNamespace | None = None) -> SimpleNamespace:
+    message = SimpleNamespace(id=3, date=datetime(2024, 5, 1), media=media_type,
+                              chat=SimpleNamespace(id=chat_id, username=username), forward_from_chat=forwarded_from)
+    setattr(message, media_type.value, SimpleNamespace(mime_type=mime_type, file_size=file_size))
+    return message
+
+
+def test_rule_without_conditions_matches_everything():
+    rule = RoutingRule({"path": "/downloads"})
+    assert rule.template == "{file_name}"
+    assert rule.match(create_message(MessageMediaType.PHOTO, None, 0), "photo.jpg", 1)
+
+
+@pytest.mark.parametrize("data, matched", [
+    ({"media": ["video"]}, True),
+    ({"media": ["audio", "document"]}, False),
+    ({"mime": ["VIDEO/*"]}, True),
+    ({"mime": ["image/*"]}, False),
+    ({"chat": ["@source"]}, True),
+    ({"chat": [-100]}, True),
+    ({"chat": ["other"]}, False),
+    ({"user": ["7"]}, True),
+    ({"user": [8]}, False),
+    ({"min_size": "1KB", "max_size": "1KB"}, True),
+    ({"min_size": "2KB"}, False),
+    ({"max_size": 1000}, False),
+    ({"name": r"\.mp4$"}, True),
+    ({"name": "^clip"}, False),
+])
+def test_each_condition(data, matched):
+    rule = RoutingRule({"path": "/downloads"} | data)
+    assert rule.match(create_message(), "sub/video.mp4", 7) is matched
+
+
+def test_forwarded_media_is_matched_on_its_origin():
+    rule = RoutingRule({"path": "/downloads", "chat": ["origin"]})
+    origin = SimpleNamespace(id=-200, username="Origin")
+    assert rule.match(create_message(forwarded_from=origin), "video.mp4", 7)
+    assert not rule.match(create_message(), "video.mp4", 7)
+
+
+def test_render():
+    rule = RoutingRule({"path": "/downloads", "template": "{chat}/{stem}-{message_id}{ext}"})
+    assert rule.render({"chat": "source", "stem": "video", "message_id": 3, "ext": ".mp4"}) == "source/video-3.mp4"
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"path": ""},
+    {"path": "/downloads", "unknown": 1},
+    {"path": "/downloads", "template": "{missing}"},
+    {"path": "/downloads", "media": ["movie"]},
+    {"path": "/downloads", "min_size": "big"},
+])
+def test_malformed_rules(data):
+    with pytest.raises(ValueError):
+        RoutingRule(data)
+
+
+def create_config_manager(rules: list[dict]) -> ConfigManager:
+    config = ConfigFile()
+    config.TG_ROUTING_RULES = rules
+    config_manager = ConfigManager(Path("config.json"))
+    config_manager.load_config(config)
+    return config_manager
+
+
+def test_route(tmp_path):
+    config_manager = create_config_manager([
+        {"path": str(tmp_path / "audio"), "media": ["audio"]},
+        {"path": str(tmp_path / "videos"), "template": "{chat}/{date:%Y-%m}/{stem}-{message_id}{ext}"},
+    ])
+    assert config_manager.route(create_message(), "video.mp4", 7) == \
+        str(tmp_path / "videos" / "Source" / "2024-05" / "video-3.mp4")
+
+
+def test_route_without_matching_rules_keeps_the_name(tmp_path):
+    config_manager = create_config_manager([{"path": str(tmp_path), "media": ["audio"]}])
+    assert config_manager.route(create_message(), "video.mp4", 7) == "video.mp4"
+
+
+def test_route_stays_inside_the_rule_path(tmp_path):
+    config_manager = create_config_manager([{"path": str(tmp_path / "videos"), "template": "../{file_name}"}])
+    assert config_manager.route(create_message(), "video.mp4", 7) == str(tmp_path / "videos" / "video.mp4")
+
+
+def test_route_to_the_filesystem_root():
+    config_manager = create_config_manager([{"path": os.sep, "template": "media/{file_name}"}])
+    assert config_manager.route(create_message(), "video.mp4", 7) == os.path.join(os.sep, "media", "video.mp4")
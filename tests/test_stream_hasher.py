@@ -0,0 +1,39 @@
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.StreamHasher import StreamHasher
+
+DATA: bytes = bytes(range(256)) * 40
+CHUNK_SIZE: int = 1000
+CHUNKS: list[bytes] = [DATA[offset:offset + CHUNK_SIZE] for offset in range(0, len(DATA), CHUNK_SIZE)]
+
+
+def hash_chunks(order: list[int], max_buffered: int = 32) -> str | None:
+    async def run() -> str | None:
+        with ThreadPoolExecutor(1) as executor:
+            hasher = StreamHasher(executor, len(DATA), CHUNK_SIZE, max_buffered)
+            for index in order:
+                await hasher.feed(index, CHUNKS[index])
+            return hasher.get_digest()
+
+    return asyncio.run(run())
+
+
+def test_in_order_chunks():
+    assert hash_chunks(list(range(len(CHUNKS)))) == hashlib.sha256(DATA).hexdigest()
+
+
+def test_out_of_order_chunks():
+    order: list[int] = list(reversed(range(len(CHUNKS))))
+    assert hash_chunks(order) == hashlib.sha256(DATA).hexdigest()
+
+
+def test_missing_chunk_gives_no_digest():
+    assert hash_chunks(list(range(len(CHUNKS) - 1))) is None
+    assert hash_chunks(list(range(1, len(CHUNKS)))) is None
+
+
+def test_too_many_buffered_chunks_give_up_the_streaming():
+    order: list[int] = list(reversed(range(len(CHUNKS))))
+    assert hash_chunks(order, max_buffered=3) is None
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from modules import StreamSink as sink_module
+from modules.StreamSink import StreamSink, FifoSink, CommandSink, S3Sink, SinkError
+
+
+class _Store:
+    """
+    Records the requests of an S3 sink in place of the object store
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    async def request(self, method: str, key: str, query: dict, body: bytes = b"") -> tuple[dict, bytes]:
+        self.requests.append((method, key, query, body))
+        if "uploads" in query:
+            return {}, b'<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">' \
+                       b'<UploadId>upload1</UploadId></InitiateMultipartUploadResult>'
+        if "partNumber" in query:
+            return {"ETag": f'"etag{query["partNumber"]}"'}, b""
+        return {}, b""
+
+
+def create_s3_sink(monkeypatch, prefix: str = "media/") -> tuple[S3Sink, _Store]:
+    sink = StreamSink.create(f's3://bucket/{prefix}', "http://localhost:9000", "access", "secret", "us-east-1")
+    store = _Store()
+    monkeypatch.setattr(sink, "request", store.request)
+    return sink, store
+
+
+def test_create():
+    assert isinstance(StreamSink.create("fifo:/tmp/pipes", "", "", "", ""), FifoSink)
+    assert isinstance(StreamSink.create("exec: cat", "", "", "", ""), CommandSink)
+    sink = StreamSink.create("s3://bucket", "https://s3.example.com", "access", "secret", "us-east-1")
+    assert isinstance(sink, S3Sink) and sink.get_bucket() == "bucket"
+    for target in ("fifo:", "exec: ", "s3://", "s3:///prefix", "ftp://host"):
+        with pytest.raises(ValueError):
+            StreamSink.create(target, "http://localhost:9000", "access", "secret", "us-east-1")
+    with pytest.raises(ValueError):
+        StreamSink.create("s3://bucket", "localhost:9000", "access", "secret", "us-east-1")
+    with pytest.raises(ValueError):
+        StreamSink.create("s3://bucket", "http://localhost:9000", "", "", "us-east-1")
+
+
+def test_fifo_sink_streams_to_a_reader(tmp_path, monkeypatch):
+    monkeypatch.setattr(sink_module, "FIFO_POLL_INTERVAL", 0.01)
+    path: str = str(tmp_path / "videos" / "file.bin")
+    received: list[bytes] = []
+
+    def read() -> None:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        with open(path, "rb") as pipe:
+            received.append(pipe.read())
+
+    async def run() -> str:
+        writer = await FifoSink(str(tmp_path)).open("videos/../videos/file.bin", {})
+        # More than the pipe buffer, the writes wait for the reader
+        for _ in range(64):
+            await writer.write(b"x" * 4096)
+        return await writer.close()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    assert asyncio.run(run()) == path
+    reader.join()
+    assert received == [b"x" * 4096 * 64]
+    assert not os.path.exists(path)
+
+
+def test_fifo_sink_refuses_a_regular_file(tmp_path):
+    (tmp_path / "file.bin").write_bytes(b"data")
+    with pytest.raises(SinkError):
+        asyncio.run(FifoSink(str(tmp_path)).open("file.bin", {}))
+
+
+def test_command_sink_writes_to_the_standard_input(tmp_path):
+    target: str = str(tmp_path / "copy.bin")
+
+    async def run() -> str:
+        writer = await CommandSink('cat > "$TG_TARGET"').open("file.bin", {"target": target, "ignored": None})
+        await writer.write(b"chunk1")
+        await writer.write(b"chunk2")
+        return await writer.close()
+
+    assert asyncio.run(run()) == 'the command cat > "$TG_TARGET"'
+    assert open(target, "rb").read() == b"chunk1chunk2"
+
+
+def test_command_sink_reports_a_failed_command():
+    async def run(command: str) -> None:
+        writer = await CommandSink(command).open("file.bin", {})
+        await writer.write(b"chunk")
+        await writer.close()
+
+    with pytest.raises(SinkError, match="code 3: No space left"):
+        asyncio.run(run("cat > /dev/null; echo No space left >&2; exit 3"))
+    with pytest.raises(SinkError, match="before reading the whole file"):
+        asyncio.run(run("exec 0<&-; sleep 0.2; exit 1"))
+
+
+def test_s3_sink_puts_a_small_file(monkeypatch):
+    sink, store = create_s3_sink(monkeypatch)
+
+    async def run() -> str:
+        writer = await sink.open("../etc/file.bin", {})
+        await writer.write(b"data")
+        return await writer.close()
+
+    assert asyncio.run(run()) == "s3://bucket/media/file.bin"
+    assert store.requests == [("PUT", "media/file.bin", {}, b"data")]
+
+
+def test_s3_sink_uploads_the_parts_in_order(monkeypatch):
+    monkeypatch.setattr(sink_module, "S3_PART_SIZE", 4)
+    sink, store = create_s3_sink(monkeypatch, "")
+
+    async def run() -> str:
+        writer = await sink.open("videos/file.bin", {})
+        for chunk in (b"abc", b"def", b"ghij", b"k"):
+            await writer.write(chunk)
+        return await writer.close()
+
+    assert asyncio.run(run()) == "s3://bucket/videos/file.bin"
+    parts: str = "".join(f'<Part><PartNumber>{number}</PartNumber><ETag>"etag{number}"</ETag></Part>'
+                         for number in (1, 2, 3))
+    assert store.requests == [
+        ("POST", "videos/file.bin", {"uploads": ""}, b""),
+        ("PUT", "videos/file.bin", {"partNumber": "1", "uploadId": "upload1"}, b"abcdef"),
+        ("PUT", "videos/file.bin", {"partNumber": "2", "uploadId": "upload1"}, b"ghij"),
+        ("PUT", "videos/file.bin", {"partNumber": "3", "uploadId": "upload1"}, b"k"),
+        ("POST", "videos/file.bin", {"uploadId": "upload1"},
+         f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'.encode()),
+    ]
+
+
+def test_s3_sink_aborts_the_multipart_upload(monkeypatch):
+    monkeypatch.setattr(sink_module, "S3_PART_SIZE", 4)
+    sink, store = create_s3_sink(monkeypatch)
+
+    async def run() -> None:
+        writer = await sink.open("file.bin", {})
+        await writer.write(b"abcdef")
+        await writer.abort()
+
+    asyncio.run(run())
+    assert [request[0] for request in store.requests] == ["POST", "PUT", "DELETE"]
+    assert store.requests[-1] == ("DELETE", "media/file.bin", {"uploadId": "upload1"}, b"")
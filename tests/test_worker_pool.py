@@ -0,0 +1,79 @@
+import asyncio
+
+from modules.WorkerPool import WorkerPool
+
+
+class _Handler:
+    """
+    Records the jobs and how many of them run at once, each job lasts until it's released
+    """
+
+    def __init__(self):
+        self.done = []
+        self.running = 0
+        self.max_running = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, job: int) -> None:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.release.wait()
+            self.done.append(job)
+        finally:
+            self.running -= 1
+
+
+def test_the_pool_runs_at_most_its_size():
+    async def run() -> _Handler:
+        queue: asyncio.Queue = asyncio.Queue()
+        handler = _Handler()
+        pool = WorkerPool(queue, handler)
+        pool.resize(2)
+        for job in range(5):
+            queue.put_nowait(job)
+        await asyncio.sleep(0.01)
+        assert (pool.get_size(), pool.get_busy_count()) == (2, 2)
+        pool.resize(3)
+        await asyncio.sleep(0.01)
+        assert pool.get_busy_count() == 3
+        handler.release.set()
+        await asyncio.wait_for(queue.join(), 1)
+        pool.stop()
+        return handler
+
+    handler: _Handler = asyncio.run(run())
+    assert sorted(handler.done) == [0, 1, 2, 3, 4]
+    assert handler.max_running == 3
+
+
+def test_shrinking_lets_the_busy_workers_finish():
+    async def run() -> _Handler:
+        queue: asyncio.Queue = asyncio.Queue()
+        handler = _Handler()
+        pool = WorkerPool(queue, handler)
+        pool.resize(3)
+        queue.put_nowait(0)
+        queue.put_nowait(1)
+        await asyncio.sleep(0.01)
+        # The idle worker leaves right away, one of the busy ones after its job
+        pool.resize(1)
+        await asyncio.sleep(0.01)
+        assert pool.get_busy_count() == 2
+        handler.release.set()
+        await asyncio.sleep(0.01)
+        for job in range(2, 6):
+            queue.put_nowait(job)
+        await asyncio.wait_for(queue.join(), 1)
+        assert pool.get_busy_count() == 0
+        handler.max_running = 0
+        handler.release.clear()
+        queue.put_nowait(6)
+        queue.put_nowait(7)
+        await asyncio.sleep(0.01)
+        assert handler.max_running == 1
+        pool.stop()
+        return handler
+
+    handler: _Handler = asyncio.run(run())
+    assert sorted(handler.done) == [0, 1, 2, 3, 4, 5]
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from pyrogram.errors import FloodWait
+
+from modules.DownloadEngine import DownloadEngine, DownloadInterrupted
+from modules.JobScheduler import JobScheduler
+from modules.ProgressReporter import ProgressReporter
+from modules.RateLimiter import RateLimiter
+from modules.RetryScheduler import RetryScheduler, BASE_DELAY, MAX_DELAY
+from modules.SimulatedTelegram import SimulatedFileServer, SimulatedMessage, SimulatedReply, SimulatedDownloadEngine
+from modules.WorkerPool import WorkerPool
+from modules.helpers import format_size
+from modules.models.Job import Job
+
+MB: int = 1024 * 1024
+# Name -> list of (number of files, min size, max size) in MB
+FILE_MIXES: dict[str, list[tuple[int, float, float]]] = {
+    "small": [(40, 0.1, 5)],
+    "mixed": [(30, 0.1, 5), (6, 10, 50), (2, 100, 200)],
+    "large": [(4, 100, 300)],
+}
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s",
+                    handlers=[logging.StreamHandler(sys.stdout)])
+
+
+def get_args() -> argparse.Namespace:
+    """
+    This function parses the command line arguments
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks the download pipeline (queue, worker pool, download "
+                                                 "engine, retries and progress updates) against a simulated Telegram "
+                                                 "file server, no network or bot needed.")
+    parser.add_argument("--parallel", default="1,2,4,8",
+                        help="Comma separated TG_MAX_PARALLEL values (default: 1,2,4,8)")
+    parser.add_argument("--mix", default="small,mixed,large",
+                        help=f'Comma separated file mixes among {", ".join(FILE_MIXES)} (default: all)')
+    parser.add_argument("--engine", default="single,chunked",
+                        help="Comma separated engines: single (Pyrogram's stream) and chunked (default: both)")
+    parser.add_argument("--connections", type=int, default=4, help="TG_DL_CONNECTIONS of the chunked engine "
+                                                                   "(default: 4)")
+    parser.add_argument("--scale", type=float, default=1, help="Factor applied to the files count (default: 1)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of a chunk request in seconds "
+                                                                    "(default: 0.05)")
+    parser.add_argument("--bandwidth", type=float, default=8, help="Bandwidth of a connection in MB/s (default: 8)")
+    parser.add_argument("--server-bandwidth", type=float, default=100,
+                        help="Bandwidth shared by all the connections in MB/s, 0 means unlimited (default: 100)")
+    parser.add_argument("--flood-wait-rate", type=float, default=0, help="Probability of a chunk request hitting a "
+                                                                         "FloodWait (default: 0)")
+    parser.add_argument("--flood-wait", type=float, default=5, help="Duration of the FloodWaits in seconds, the ones "
+                                                                    "above 30 fail the download (default: 5)")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Probability of a chunk request failing "
+                                                                      "(default: 0)")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="Factor applied to FloodWaits and retry delays actually waited (default: 0.01)")
+    parser.add_argument("--edit-latency", type=float, default=0.1, help="Latency of a status reply edit in seconds "
+                                                                        "(default: 0.1)")
+    parser.add_argument("--progress-rate", type=float, default=1, help="TG_PROGRESS_RATE (default: 1)")
+    parser.add_argument("--retries", type=int, default=5, help="TG_DL_RETRIES (default: 5)")
+    parser.add_argument("--no-resume", action="store_true", help="Disable the chunks journal (TG_DL_RESUME)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the file sizes and the injected errors")
+    return parser.parse_args()
+
+
+class _ScaledRetryScheduler(RetryScheduler):
+    """
+    The retry scheduler with its delays shrunk by the benchmark time scale
+    """
+    _time_scale: float
+
+    def __init__(self, max_attempts: int, time_scale: float):
+        super().__init__(max_attempts)
+        self._time_scale = time_scale
+
+    def get_delay(self, job: Job, error: BaseException) -> float:
+        if isinstance(error, FloodWait):
+            return error.value * self._time_scale
+        return min(MAX_DELAY, BASE_DELAY * 2 ** job.attempts) * self._time_scale
+
+
+def get_file_sizes(mix: str, scale: float, seed: int) -> list[int]:
+    """
+    This function draws the file sizes of a mix
+    :param mix: The mix name
+    :param scale: The factor applied to the files count
+    :param seed: The seed of the sizes
+    :return: The file sizes in bytes, shuffled
+    """
+    generator = random.Random(seed)
+    sizes: list[int] = []
+    for count, min_size, max_size in FILE_MIXES[mix]:
+        sizes += [int(generator.uniform(min_size, max_size) * MB) for _ in range(max(1, round(count * scale)))]
+    generator.shuffle(sizes)
+    return sizes
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    """
+    This function computes a percentile with the nearest-rank method
+    :param values: The samples, sorted
+    :param percentile: The percentile, between 0 and 100
+    :return: The percentile value, 0 if there are no samples
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))]
+
+
+async def run_scenario(args: argparse.Namespace, engine_name: str, parallel: int, mix: str) -> dict:
+    """
+    This function downloads a file mix through the pipeline and measures it
+    :param args: The benchmark arguments
+    :param engine_name: The engine to use, single or chunked
+    :param parallel: The number of workers
+    :param mix: The file mix
+    :return: The scenario results
+    """
+    server = SimulatedFileServer(args.latency, args.bandwidth * MB, args.server_bandwidth * MB, args.flood_wait_rate,
+                                 args.flood_wait, args.failure_rate, args.time_scale, args.seed)
+    rate_limiter = RateLimiter(0, 0, "")
+    engine: DownloadEngine = SimulatedDownloadEngine(server, args.connections, not args.no_resume, rate_limiter)
+    progress_reporter = ProgressReporter(args.progress_rate)
+    retry_scheduler = _ScaledRetryScheduler(args.retries, args.time_scale)
+    queue = JobScheduler()
+    sizes: list[int] = get_file_sizes(mix, args.scale, args.seed)
+    latencies: list[float] = []
+    replies: list[SimulatedReply] = []
+    failed: list[int] = [0]
+    finished = asyncio.Event()
+
+    def put_job(job: Job) -> None:
+        job.enqueued_at = time.monotonic()
+        queue.put_nowait(job)
+
+    async def worker_progress(current: int, total: int, job: Job) -> None:
+        progress_reporter.update(job.reply, current, total)
+
+    def end_job(job: Job, success: bool) -> None:
+        if success:
+            latencies.append(time.monotonic() - job.created_at)
+        else:
+            failed[0] += 1
+        if len(latencies) + failed[0] == len(sizes):
+            finished.set()
+
+    # Mirrors the download path of tg_downloader's worker, without the job store and the dedup index
+    async def worker(job: Job) -> None:
+        file_path: str = os.path.join(download_path, job.file_name)
+        try:
+            job.reply = await job.reply.edit('Downloading:  0%')
+            try:
+                if engine_name == "single":
+                    await single_stream_download(job, file_path)
+                else:
+                    await engine.download(job.message, file_path, progress=worker_progress, progress_args=(job,))
+            finally:
+                await progress_reporter.finish(job.reply)
+            os.remove(file_path)
+            await job.reply.edit('Finished')
+            end_job(job, True)
+        except Exception as e:
+            if retry_scheduler.should_retry(job, e):
+                retry_scheduler.schedule(job, e, put_job)
+                await job.reply.edit('Retrying')
+                return
+            logging.warning(f'{job.file_name} - {e.__class__.__name__}: {e}')
+            await job.reply.edit('Failed')
+            end_job(job, False)
+
+    # The single stream path of the engine, used for all the files regardless of their size
+    async def single_stream_download(job: Job, file_path: str) -> None:
+        bucket = rate_limiter.create_job_bucket()
+        received: list[int] = [0]
+
+        async def throttled_progress(current: int, total: int) -> None:
+            await rate_limiter.consume(current - received[0], bucket)
+            received[0] = current
+            await worker_progress(current, total, job)
+
+        if not await job.message.download(file_path, progress=throttled_progress):
+            raise DownloadInterrupted("The single stream download has been interrupted")
+
+    pool = WorkerPool(queue, worker)
+    with tempfile.TemporaryDirectory(prefix="tg_benchmark_") as download_path:
+        progress_reporter.start()
+        started_at: float = time.monotonic()
+        for index, size in enumerate(sizes, start=1):
+            job = Job()
+            job.id = index
+            job.user_id = 1
+            job.file_size = size
+            job.file_name = f'file_{index}.bin'
+            job.created_at = time.monotonic()
+            job.message = SimulatedMessage(server, size)
+            job.reply = SimulatedReply(index, args.edit_latency)
+            replies.append(job.reply)
+            put_job(job)
+        pool.resize(parallel)
+        await finished.wait()
+        elapsed: float = time.monotonic() - started_at
+        pool.stop()
+        progress_reporter.stop()
+        await engine.close()
+    latencies.sort()
+    files: int = len(sizes)
+    return {
+        "engine": engine_name, "parallel": parallel, "mix": mix, "files": files, "bytes": sum(sizes),
+        "elapsed": elapsed, "throughput": sum(sizes) / elapsed, "failed": failed[0],
+        "p50": get_percentile(latencies, 50), "p95": get_percentile(latencies, 95),
+        "p99": get_percentile(latencies, 99),
+        "api_calls": (server.requests + sum(reply.edits for reply in replies)) / files,
+        "edits": sum(reply.edits for reply in replies) / files,
+        "flood_waits": server.flood_waits, "server_errors": server.failures,
+    }
+
+
+def print_results(results: list[dict]) -> None:
+    """
+    This function prints the results as a table
+    :param results: The results of all the scenarios
+    """
+    header: str = (f'{"engine":<8} {"mix":<7} {"par":>3} {"files":>5} {"size":>10} {"time":>8} {"speed":>12} '
+                   f'{"p50":>7} {"p95":>7} {"p99":>7} {"calls/f":>8} {"edits/f":>8} {"flood":>5} {"errs":>5} '
+                   f'{"fail":>4}')
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f'{r["engine"]:<8} {r["mix"]:<7} {r["parallel"]:>3} {r["files"]:>5} {format_size(r["bytes"]):>10} '
+              f'{r["elapsed"]:>7.2f}s {format_size(r["throughput"]) + "/s":>12} {r["p50"]:>6.2f}s {r["p95"]:>6.2f}s '
+              f'{r["p99"]:>6.2f}s {r["api_calls"]:>8.1f} {r["edits"]:>8.1f} {r["flood_waits"]:>5} '
+              f'{r["server_errors"]:>5} {r["failed"]:>4}')
+
+
+async def main() -> None:
+    """
+    Entrypoint of the benchmark
+    """
+    args = get_args()
+    mixes: list[str] = args.mix.split(",")
+    engines: list[str] = args.engine.split(",")
+    for name in mixes:
+        if name not in FILE_MIXES:
+            logging.error(f'Unknown file mix: {name}')
+            exit(-1)
+    for name in engines:
+        if name not in ["single", "chunked"]:
+            logging.error(f'Unknown engine: {name}')
+            exit(-1)
+    results: list[dict] = []
+    for mix in mixes:
+        for engine_name in engines:
+            for parallel in [int(value) for value in args.parallel.split(",")]:
+                results.append(await run_scenario(args, engine_name, parallel, mix))
+    print_results(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
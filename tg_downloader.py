@@ -1,40 +1,96 @@
 import asyncio
+import hashlib
+import json
 import logging
+import math
 import os
-import sys
 import time
-from asyncio import Task, Queue
+from asyncio import Task
 from pathlib import Path
 import pyroaddon
 from pyrogram import Client, filters
-from pyrogram.errors import MessageNotModified
+from pyrogram.errors import MessageNotModified, FloodWait, RPCError
+from pyrogram.handlers import MessageHandler
 from pyrogram.methods.utilities.idle import idle
 from pyrogram.raw.functions.bots import SetBotCommands
 from pyrogram.raw.types import BotCommand, BotCommandScopeDefault
-from pyrogram.types import Message, Photo, Voice, Video, Animation, InlineKeyboardMarkup, InlineKeyboardButton, \
+from pyrogram.types import Message, Chat, Photo, Voice, Video, Animation, InlineKeyboardMarkup, InlineKeyboardButton, \
     CallbackQuery, Audio, Document
 from pyrogram.enums import ParseMode, MessageMediaType
 
+from modules.ClientPool import ClientPool, PooledClient
+from modules.ConcurrencyController import ConcurrencyController
 from modules.ConfigManager import ConfigManager
-from modules.helpers import get_config_from_user_or_env
+from modules.ControlApi import ControlApi
+from modules.Coordinator import Coordinator, RemoteNode
+from modules.DedupIndex import DedupIndex
+from modules.DiskAdmission import DiskAdmission
+from modules.DownloadEngine import DownloadEngine, CHUNK_SIZE
+from modules.FileFinalizer import FileFinalizer
+from modules.JobRegistry import JobRegistry
+from modules.JobScheduler import JobScheduler
+from modules.Harvester import Harvester, PAGE_SIZE
+from modules.JobStore import JobStore
+from modules.LogManager import LogManager
+from modules.Metrics import Metrics, Histogram, TIME_BUCKETS, SPEED_BUCKETS
+from modules.PostProcessor import PostProcessor
+from modules.ProgressReporter import ProgressReporter
+from modules.RateLimiter import RateLimiter
+from modules.RetryScheduler import RetryScheduler
+from modules.StartupProfiler import StartupProfiler
+from modules.StreamHasher import StreamHasher
+from modules.StreamSink import StreamSink
+from modules.WorkerPool import WorkerPool
+from modules.helpers import get_config_from_user_or_env, format_duration, format_size, get_extension, \
+    get_default_file_name, parse_bool
 from modules.models.ConfigFile import ConfigFile
+from modules.models.HarvestFilters import HarvestFilters
+from modules.models.Job import Job, JobState
+from modules.models.JobBatch import JobBatch
 
+# Time to wait for all the messages of an album after receiving the first one
+ALBUM_WINDOW: float = 2
 GITHUB_LINK: str = "https://github.com/LightDestory/TG_MediaDownloader"
 DONATION_LINK: str = "https://ko-fi.com/lightdestory"
 
+# Created first, so the records of the config, job store and dedup index setup reach the log file
+log_manager: LogManager = LogManager("tg_downloader.log")
 config_manager: ConfigManager = ConfigManager(Path(os.environ.get("CONFIG_PATH", "./config.json")))
-queue: Queue = asyncio.Queue()
-tasks: list[Task] = []
-workers: list[Task] = []
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("tg_downloader.log", mode="w+"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+job_store: JobStore = JobStore(Path(os.environ.get("JOBS_DB_PATH", "./jobs.db")))
+dedup_index: DedupIndex = DedupIndex(Path(os.environ.get("JOBS_DB_PATH", "./jobs.db")))
+queue: JobScheduler = JobScheduler()
+# The running harvests, each one leaves the set when it ends
+tasks: set[Task] = set()
+# The post-processing of the downloaded jobs, run out of the worker slots
+completions: set[Task] = set()
+stopping: bool = False
+albums: dict[str, list[Message]] = {}
+pending_albums: dict[str, list[Message]] = {}
+metrics: Metrics = Metrics()
+jobs_enqueued = metrics.counter("tg_jobs_enqueued_total", "Jobs put in the download queue, retries included")
+jobs_finished = metrics.counter("tg_jobs_finished_total", "Jobs ended, by outcome")
+download_errors = metrics.counter("tg_download_errors_total", "Download errors, by exception type")
+download_retries = metrics.counter("tg_download_retries_total", "Downloads scheduled for another attempt")
+flood_wait_seconds = metrics.counter("tg_flood_wait_seconds_total", "Seconds of FloodWait imposed on the downloads")
+downloaded_bytes = metrics.counter("tg_downloaded_bytes_total", "Bytes of the completed downloads")
+queue_wait = metrics.histogram("tg_queue_wait_seconds", "Time spent by the jobs in queue", TIME_BUCKETS)
+time_to_first_byte = metrics.histogram("tg_time_to_first_byte_seconds", "Time from the start of a download to its "
+                                                                         "first progress", TIME_BUCKETS)
+download_duration = metrics.histogram("tg_download_duration_seconds", "Duration of the completed downloads",
+                                      TIME_BUCKETS)
+download_speed = metrics.histogram("tg_download_speed_bytes", "Average speed of the completed downloads, in bytes "
+                                                              "per second", SPEED_BUCKETS)
+metrics.gauge("tg_queue_depth", "Jobs waiting in queue", lambda: queue.qsize())
+metrics.gauge("tg_retries_pending", "Jobs waiting for their next attempt", lambda: retry_scheduler.get_pending_count())
+metrics.gauge("tg_workers", "Size of the worker pool", lambda: worker_pool.get_size())
+metrics.gauge("tg_workers_busy", "Workers downloading a job", lambda: worker_pool.get_busy_count())
+metrics.gauge("tg_clients_available", "Pool clients not waiting for a FloodWait",
+              lambda: client_pool.get_available_count())
+metrics.gauge("tg_worker_nodes", "Worker nodes connected to the coordinator",
+              lambda: len(coordinator.get_nodes()) if coordinator else 0)
+
+startup_profiler: StartupProfiler = StartupProfiler(parse_bool(os.environ.get("TG_PROFILE_STARTUP", "false")))
+startup_profiler.mark("imports")
 
 
 def init() -> Client | None:
@@ -53,9 +109,31 @@ def init() -> Client | None:
             exit(-1)
     else:
         config = config_manager.get_config()
-    generate_workers(config.TG_MAX_PARALLEL)
+    log_manager.configure(config.TG_LOG_LEVEL, config.TG_LOG_MAX_SIZE, config.TG_LOG_BACKUPS, config.TG_LOG_ROTATE_WHEN)
+    queue.set_smallest_first(config.TG_SMALLEST_FIRST)
+    # The adaptive sizing starts from the minimum and grows the pool only while the throughput grows with it
+    worker_pool.resize(config.TG_MIN_PARALLEL if config.TG_ADAPTIVE_PARALLEL else config.TG_MAX_PARALLEL)
+    startup_profiler.mark("config")
     return Client(config.TG_SESSION, config.TG_API_ID, config.TG_API_HASH,
-                  bot_token=config.TG_BOT_TOKEN, parse_mode=ParseMode.DEFAULT)
+                  bot_token=config.TG_BOT_TOKEN, parse_mode=ParseMode.DEFAULT,
+                  max_concurrent_transmissions=config.TG_MAX_PARALLEL)
+
+
+def create_pool_clients() -> list[Client]:
+    """
+    This function creates the clients of the additional accounts sharing the downloads, they don't receive updates
+    :return: A list of Pyrogram's client instances
+    """
+    config: ConfigFile = config_manager.get_config()
+    clients: list[Client] = [Client(f'{config.TG_SESSION}_pool_bot_{index}', config.TG_API_ID, config.TG_API_HASH,
+                                    bot_token=bot_token, no_updates=True,
+                                    max_concurrent_transmissions=config.TG_MAX_PARALLEL)
+                             for index, bot_token in enumerate(config.TG_POOL_BOT_TOKENS, start=1)]
+    clients += [Client(f'{config.TG_SESSION}_pool_user_{index}', config.TG_API_ID, config.TG_API_HASH,
+                       session_string=session, in_memory=True, no_updates=True,
+                       max_concurrent_transmissions=config.TG_MAX_PARALLEL)
+                for index, session in enumerate(config.TG_POOL_SESSIONS, start=1)]
+    return clients
 
 
 async def main() -> None:
@@ -64,23 +142,189 @@ async def main() -> None:
     """
     try:
         logging.info("Bot is starting...")
+        if stream_sink and (config_manager.get_config().TG_POST_EXTRACT or config_manager.get_config().TG_POST_HOOK):
+            logging.warning("The extraction and the hook need a local file, they are skipped while streaming to "
+                            f"the {stream_sink.name} sink")
+        if startup_profiler.is_enabled():
+            app.add_handler(first_update_handler, group=-1)
         await app.start()
-        logging.info("Settings Bot commands list...")
-        await app.invoke(SetBotCommands(scope=BotCommandScopeDefault(), lang_code='', commands=get_command_list()))
+        startup_profiler.mark("connect")
+        await update_bot_commands()
+        startup_profiler.mark("bot commands")
+        progress_reporter.start()
+        await client_pool.start()
+        if coordinator:
+            await coordinator.start()
+        if config_manager.get_config().TG_METRICS_PORT:
+            await metrics.start_server(config_manager.get_config().TG_METRICS_HOST,
+                                       config_manager.get_config().TG_METRICS_PORT)
+        if control_api:
+            await control_api.start_server(config_manager.get_config().TG_API_PORT)
+        if concurrency_controller:
+            concurrency_controller.start()
+        startup_profiler.mark("services")
+        await sweep_partial_files()
+        await restore_jobs()
+        startup_profiler.mark("restore")
         await idle()
         logging.info("Bot is stopping...")
+        await metrics.stop_server()
+        if control_api:
+            await control_api.stop_server()
+        await client_pool.stop()
         await app.stop()
         logging.info("Bot stopped!")
     except Exception as ex:
         logging.error(f"Unable to start Pyrogram client, error:\n {ex}")
     finally:
-        await abort(kill_workers=True)
+        stop_workers()
+        progress_reporter.stop()
+        job_store.close()
+        dedup_index.close()
+        if harvester:
+            harvester.close()
+        post_processor.close()
+
+
+async def update_bot_commands() -> None:
+    """
+    This function sets the bot commands list, unless it's unchanged since the last start
+    """
+    config: ConfigFile = config_manager.get_config()
+    commands: list[BotCommand] = get_command_list()
+    # The bot id is part of the hash, so a new token gets its commands
+    digest: str = hashlib.sha256(json.dumps([config.TG_BOT_TOKEN.split(":")[0]] + [
+        [command.command, command.description] for command in commands]).encode()).hexdigest()
+    hash_path: Path = Path(f'{config.TG_SESSION}.commands')
+    try:
+        if hash_path.read_text() == digest:
+            logging.info("Bot commands list unchanged, skipping its update")
+            return
+    except OSError:
+        pass
+    logging.info("Settings Bot commands list...")
+    try:
+        await app.invoke(SetBotCommands(scope=BotCommandScopeDefault(), lang_code='', commands=commands))
+        hash_path.write_text(digest)
+    except Exception as e:
+        # The previous list stays in place, the bot works anyway
+        logging.error(f"Unable to set the Bot commands list, error:\n {e}")
+
+
+async def profile_first_update(client: Client, _: Message) -> None:
+    """
+    This function records the first message handled after the start, then unregisters itself
+    """
+    startup_profiler.mark("first update")
+    logging.info(f'Startup profile: {startup_profiler.get_report()}')
+    client.remove_handler(first_update_handler, group=-1)
+
+
+first_update_handler: MessageHandler = MessageHandler(profile_first_update)
+
+
+def stop_workers() -> None:
+    """
+    This function stops the workers on shutdown, the pending jobs stay in the job store to be restored on next start
+    """
+    global stopping
+    stopping = True
+    if concurrency_controller:
+        concurrency_controller.stop()
+    worker_pool.stop()
+    for task in completions:
+        task.cancel()
+    if coordinator:
+        coordinator.stop()
+
+
+def get_download_paths() -> list[str]:
+    """
+    This function returns all the directories the downloads are saved in
+    :return: The download dir and the destinations of the routing rules
+    """
+    return [config_manager.get_config().TG_DOWNLOAD_PATH] + \
+        [rule["path"] for rule in config_manager.get_config().TG_ROUTING_RULES]
+
 
+async def sweep_partial_files() -> None:
+    """
+    This function removes the partial files left by a crash, keeping the resumable ones. It runs before the jobs are
+    restored, so no download is writing its partial file
+    """
+    removed, kept = await asyncio.get_event_loop().run_in_executor(None, FileFinalizer.sweep, get_download_paths(),
+                                                                   config_manager.get_config().TG_DL_RESUME)
+    if removed or kept:
+        logging.info(f'Partial files of the previous run: {removed} removed, {kept} kept to be resumed')
+
+
+async def restore_jobs() -> None:
+    """
+    This function puts back in the queue the jobs left pending by the previous run
+    """
+    job_store.purge_finished()
+    jobs: list[Job] = job_store.get_pending()
+    if jobs:
+        logging.info(f"Restoring {len(jobs)} pending jobs")
+    # The messages are fetched in batches, a request per job would delay the queue on big restores
+    messages: dict[tuple[int, int], Message] = await fetch_messages([(job.chat_id, job.message_id) for job in jobs])
+    stored_replies: dict[tuple[int, int], Message] = await fetch_messages(
+        [(job.reply_chat_id, job.reply_id) for job in jobs if job.reply_id])
+    # The jobs of an album or a harvest share the same reply
+    replies: dict[tuple[int, int], Message] = {}
+    for job in jobs:
+        try:
+            message: Message | None = messages.get((job.chat_id, job.message_id))
+            if not message:
+                raise ValueError("The message couldn't be fetched")
+            if message.empty or not message.media:
+                logging.warning(f'{job.file_name} - The media message is not available anymore, dropping the job')
+                set_state(job, JobState.FAILED)
+                continue
+            reply_key: tuple[int, int] = (job.reply_chat_id, job.reply_id)
+            reply: Message | None = replies.get(reply_key)
+            if not reply:
+                restored_text: str = f'In queue (job #{job.id}, restored)'
+                reply = stored_replies.get(reply_key)
+                if not reply or reply.empty:
+                    reply = await app.send_message(
+                        job.reply_chat_id, restored_text,
+                        reply_to_message_id=job.message_id if job.reply_chat_id == job.chat_id else None)
+                elif reply.text != restored_text:
+                    reply = await reply.edit(restored_text)
+                replies[reply_key] = reply
+            if reply.id != job.reply_id:
+                job_store.update_reply(job, reply.id)
+        except Exception as e:
+            logging.error(f'{job.file_name} - Unable to restore the job, error:\n {e}')
+            continue
+        job.message = message
+        job.reply = reply
+        set_state(job, JobState.QUEUED)
+        job_registry.add(job)
+        put_job(job)
 
-def generate_workers(quantity: int) -> None:
-    loop = asyncio.get_event_loop_policy().get_event_loop()
-    for i in range(quantity):
-        workers.append(loop.create_task(worker()))
+
+async def fetch_messages(keys: list[tuple[int, int]]) -> dict[tuple[int, int], Message]:
+    """
+    This function fetches many messages with the fewest requests, grouping them by chat
+    :param keys: The (chat_id, message_id) pairs to fetch
+    :return: The fetched messages by (chat_id, message_id), the ones of unreachable chats are missing
+    """
+    ids_by_chat: dict[int, list[int]] = {}
+    for chat_id, message_id in dict.fromkeys(keys):
+        ids_by_chat.setdefault(chat_id, []).append(message_id)
+    messages: dict[tuple[int, int], Message] = {}
+    for chat_id, message_ids in ids_by_chat.items():
+        for start in range(0, len(message_ids), PAGE_SIZE):
+            try:
+                page: list[Message] = await app.get_messages(chat_id, message_ids[start:start + PAGE_SIZE])
+            except Exception as e:
+                logging.error(f'Unable to fetch the messages of chat {chat_id}, error:\n {e}')
+                continue
+            for message_id, message in zip(message_ids[start:start + PAGE_SIZE], page):
+                messages[(chat_id, message_id)] = message
+    return messages
 
 
 def get_command_list() -> list[BotCommand]:
@@ -95,101 +339,739 @@ def get_command_list() -> list[BotCommand]:
         BotCommand(command="about", description="Gives you information about the project."),
         BotCommand(command="abort", description="Cancel all the pending downloads."),
         BotCommand(command="status", description="Gives you the current configuration."),
+        BotCommand(command="stats", description="Gives you the download statistics since the bot started."),
         BotCommand(command="usage", description="Gives you the usage instructions."),
         BotCommand(command="set_download_dir", description="Sets a new download dir"),
         BotCommand(command="set_max_parallel_dl", description="Sets the number of max parallel downloads"),
+        BotCommand(command="set_rate_limit", description="Sets the global bandwidth limit in KB/s, 0 means unlimited"),
+        BotCommand(command="harvest", description="Downloads the media of a chat: <chat> [from_id] [to_id] [filters]"),
+        BotCommand(command="priority", description="Moves a queued job in front of all the others"),
+        BotCommand(command="queue", description="Lists the pending jobs"),
+        BotCommand(command="cancel", description="Cancels a job: <job_id>"),
+        BotCommand(command="pause", description="Pauses the queue, or a single job: [job_id]"),
+        BotCommand(command="resume", description="Resumes the queue, or a single job: [job_id]"),
+        BotCommand(command="dedup_rebuild", description="Rebuilds the index of the downloaded media scanning the "
+                                                        "download dir"),
     ]
 
 
-def get_extension(media_type: MessageMediaType, media: Photo | Voice | Video | Animation | Audio | Document) -> str:
+async def abort() -> None:
     """
-    This function returns the most probable file extension based on the media type
-    :param media_type: The media_type property of a message
-    :param media: The media object of a message
-    :return: A string corresponding to the file extension
+    This function abort all the current tasks and the queued jobs
     """
-    if media_type == MessageMediaType.PHOTO:
-        return "jpg"
-    else:
-        default = "unknown"
-        if media_type in [MessageMediaType.VOICE, MessageMediaType.AUDIO]:
-            default = "mp3"
-        elif media_type in [MessageMediaType.ANIMATION, MessageMediaType.VIDEO]:
-            default = "mp4"
-        return default if not media.mime_type else media.mime_type.split("/")[1]
-
-
-async def abort(kill_workers: bool = False) -> None:
-    """
-    This function abort all the current tasks, and kills workers if needed
-    :param kill_workers: A control flag to kill all the workers
-    """
-    if tasks or not queue.empty():
-        logging.info("Aborting all the pending jobs")
-        for t in tasks:
-            t.cancel()
-        for _ in range(queue.qsize()):
-            queue_item = queue.get_nowait()
-            reply: Message = queue_item[1]
-            await reply.edit("Aborted")
-            queue.task_done()
-    if kill_workers:
-        logging.info("Killing all the workers")
-        for w in workers:
-            w.cancel()
+    logging.info("Aborting all the pending jobs")
+    for t in tasks:
+        t.cancel()
+    for job in job_registry.get_jobs():
+        await cancel_job(job.id)
+
+
+def set_state(job: Job, state: JobState) -> None:
+    """
+    This function changes the state of a job, the ended jobs leave the registry and are reported to the harvester
+    :param job: A stored Job instance
+    :param state: The new state
+    """
+    job_store.update_state(job, state)
+    job_registry.update(job)
+    # The status reply of a harvested media is sent in the chat of the /harvest command
+    if state in [JobState.DONE, JobState.FAILED, JobState.ABORTED] and job.reply_chat_id != job.chat_id:
+        # The cursor moves past a harvested media only once it's downloaded, the others are harvested again
+        if state == JobState.DONE:
+            get_harvester().complete(job.chat_id, job.message_id)
+        else:
+            get_harvester().fail(job.chat_id, job.message_id)
+
+
+async def cancel_job(job_id: int) -> bool:
+    """
+    This function cancels a job, wherever it is
+    :param job_id: The id of the job
+    :return: True if the job has been cancelled, False if it doesn't exist or it already ended
+    """
+    if not job_registry.get(job_id):
+        return False
+    job: Job | None = job_registry.cancel(job_id)
+    if job:
+        # No worker is handling it, a running download is ended by its worker instead
+        logging.warning(f'{job.file_name} - Aborted')
+        jobs_finished.inc(outcome="aborted")
+        set_state(job, JobState.ABORTED)
+        if job.reply:
+            progress_reporter.show(job.reply, get_final_text(job, "Aborted", False))
+    return True
+
+
+async def pause_job(job_id: int) -> bool:
+    """
+    This function holds a job until it is resumed, a running download is interrupted
+    :param job_id: The id of the job
+    :return: True if the job has been paused, False if it doesn't exist or it is already paused
+    """
+    job: Job | None = job_registry.get(job_id)
+    if not job or not job_registry.pause(job_id):
+        return False
+    if job_registry.get_status(job) == "paused":
+        show_paused(job)
+    return True
+
+
+def show_paused(job: Job) -> None:
+    """
+    This function updates the status reply of a paused job
+    :param job: The paused job
+    """
+    logging.info(f'{job.file_name} - Paused')
+    if job.reply and not job.batch:
+        progress_reporter.show(job.reply, f'Paused (job #{job.id}), /resume {job.id} to continue')
+
+
+async def resume_job(job_id: int) -> bool:
+    """
+    This function puts a paused job back in the queue
+    :param job_id: The id of the job
+    :return: True if the job has been resumed, False if it wasn't paused
+    """
+    job: Job | None = job_registry.get(job_id)
+    if not job or not job_registry.resume(job_id):
+        return False
+    logging.info(f'{job.file_name} - Resumed')
+    if job.reply and not job.batch:
+        progress_reporter.show(job.reply, f'In queue (job #{job.id})')
+    return True
+
+
+async def bump_job(job_id: int) -> bool:
+    """
+    This function moves a queued job in front of all the others
+    :param job_id: The id of the job
+    :return: True if the job has been moved, False if it is not in queue
+    """
+    job: Job | None = queue.bump(job_id)
+    if job:
+        logging.info(f'{job.file_name} - Moved to the top of the queue')
+    return job is not None
+
+
+def set_queue_paused(paused: bool) -> None:
+    """
+    This function stops or restarts serving the queued jobs, the running downloads go on
+    :param paused: A control flag to hold the queue
+    """
+    queue.set_paused(paused)
+    logging.info("Queue paused" if paused else "Queue resumed")
+
+
+def get_queue_report() -> dict:
+    """
+    This function describes the queue for the control API
+    :return: The queue state and its jobs
+    """
+    return {"paused": queue.is_paused(), "jobs": [
+        {"id": job.id, "status": job_registry.get_status(job), "file_name": job.file_name, "file_size": job.file_size,
+         "received": job.received, "attempts": job.attempts, "user_id": job.user_id, "chat_id": job.chat_id,
+         "message_id": job.message_id, "batch": job.batch.name if job.batch else None}
+        for job in job_registry.get_jobs()]}
+
+
+def get_queue_text(limit: int = 20) -> str:
+    """
+    This function lists the pending jobs
+    :param limit: The maximum number of jobs listed
+    :return: A human-readable list
+    """
+    jobs: list[Job] = job_registry.get_jobs()
+    counts: dict[str, int] = {}
+    for job in jobs:
+        counts[job_registry.get_status(job)] = counts.get(job_registry.get_status(job), 0) + 1
+    text: str = f'**Queue{" (paused)" if queue.is_paused() else ""}:** ' + \
+        (", ".join(f'{count} {status}' for status, count in counts.items()) or "empty")
+    for job in jobs[:limit]:
+        status: str = job_registry.get_status(job)
+        if status == "downloading" and job.file_size:
+            status += f' {int(job.received * 100 / job.file_size)}%'
+        text += f'\n`#{job.id}` {status} __{os.path.basename(job.file_name)}__ ({format_size(job.file_size)})'
+    if len(jobs) > limit:
+        text += f'\n...and {len(jobs) - limit} more'
+    return text
+
+
+def get_parallel_text() -> str:
+    """
+    This function describes the number of parallel downloads
+    :return: The static number, or the current one chosen by the adaptive mode with its bounds
+    """
+    if not concurrency_controller:
+        return str(config_manager.get_config().TG_MAX_PARALLEL)
+    minimum, maximum = concurrency_controller.get_bounds()
+    return f'{concurrency_controller.get_limit()} (adaptive, {minimum}-{maximum})'
+
+
+def get_rate_limit_text() -> str:
+    """
+    This function describes the bandwidth limits in force
+    :return: A human-readable description of the limits
+    """
+    limit: int = rate_limiter.get_current_limit()
+    text: str = f'{limit} KB/s' if limit else "unlimited"
+    job_limit: int = config_manager.get_config().TG_RATE_LIMIT_PER_JOB
+    if job_limit:
+        text += f' ({job_limit} KB/s per download)'
+    return text
+
+
+def get_stats_text() -> str:
+    """
+    This function summarizes the metrics collected since the bot started
+    :return: A human-readable report
+    """
+
+    def quantiles(histogram: Histogram) -> str:
+        values: list[float | None] = [histogram.get_quantile(q) for q in (0.5, 0.95)]
+        texts: list[str] = []
+        for value in values:
+            if value is None:
+                texts.append("-")
+            elif value == math.inf:
+                texts.append(f'>{format_duration(TIME_BUCKETS[-1])}')
+            else:
+                texts.append(f'≤{value:g}s' if value < 60 else f'≤{format_duration(value)}')
+        return " / ".join(texts)
+
+    average_speed: str = f'{format_size(download_speed.sum / download_speed.count)}/s' if download_speed.count \
+        else "-"
+    return ('**Download statistics:**\n\n'
+            f'**Completed:** {int(jobs_finished.get(outcome="done"))}, '
+            f'**Failed:** {int(jobs_finished.get(outcome="failed"))}, '
+            f'**Aborted:** {int(jobs_finished.get(outcome="aborted"))}\n'
+            f'**Retries:** {int(download_retries.get())}, '
+            f'**FloodWait:** {format_duration(flood_wait_seconds.get())}\n'
+            f'**Downloaded:** {format_size(downloaded_bytes.get())}, **Average speed:** {average_speed}\n'
+            f'**In queue:** {queue.qsize()}, **Waiting retry:** {retry_scheduler.get_pending_count()}\n'
+            f'**Busy workers:** {worker_pool.get_busy_count()}/{worker_pool.get_size()}, '
+            f'**Available clients:** {client_pool.get_available_count()}/{client_pool.get_size()}\n'
+            f'{get_nodes_text()}\n'
+            f'__p50 / p95__\n'
+            f'**Queue wait:** {quantiles(queue_wait)}\n'
+            f'**First byte:** {quantiles(time_to_first_byte)}\n'
+            f'**Download time:** {quantiles(download_duration)}\n')
+
+
+def get_nodes_text() -> str:
+    """
+    This function summarizes the worker nodes connected to the coordinator
+    :return: A line with the busy slots of each node, empty when the coordinator is disabled
+    """
+    if not coordinator:
+        return ""
+    nodes: list[RemoteNode] = coordinator.get_nodes()
+    if not nodes:
+        return "**Worker nodes:** none connected\n"
+    return "**Worker nodes:** " + ", ".join(f'{node.name} {node.get_busy_count()}/{node.slots}' for node in nodes) \
+        + "\n"
+
+
+def get_harvester() -> Harvester:
+    """
+    This function returns the harvester, creating it on first use
+    :return: The Harvester instance
+    """
+    global harvester
+    if not harvester:
+        harvester = Harvester(app, Path(os.environ.get("JOBS_DB_PATH", "./jobs.db")))
+    return harvester
+
+
+def get_resume_hint() -> str:
+    """
+    This function returns the hint appended to interrupted downloads' replies
+    :return: A string explaining how to resume the download, empty if resume is disabled
+    """
+    if config_manager.get_config().TG_DL_RESUME:
+        return "\n__Forward the media again to resume the download__"
+    return ""
+
+
+async def handle_duplicate(message: Message, file_name: str, notify: bool = True) -> bool:
+    """
+    This function checks if the media has already been downloaded and applies the configured dedup mode
+    :param message: The media message
+    :param file_name: The target file name
+    :param notify: A control flag to reply to the message when the media is not downloaded
+    :return: True if the media doesn't need to be downloaded, False otherwise
+    """
+    file_path: str = os.path.abspath(os.path.join(config_manager.get_config().TG_DOWNLOAD_PATH, file_name))
+    if file_finalizer.is_skipped(file_path):
+        logging.info(f'{file_name} - The file already exists, skipping')
+        if notify:
+            await message.reply_text(f'The file __{file_path}__ already exists', quote=True)
+        return True
+    dedup_mode: str = config_manager.get_config().TG_DEDUP_MODE
+    if dedup_mode == "redownload":
+        return False
+    media: Photo | Voice | Video | Animation | Audio | Document = getattr(message, message.media.value)
+    entry: dict | None = dedup_index.lookup(media.file_unique_id)
+    if not entry:
+        return False
+    if dedup_mode == "skip" or entry["path"] == file_path:
+        logging.info(f'{file_name} - Already downloaded as {entry["path"]}, skipping')
+        if notify:
+            await message.reply_text(f'Already downloaded as __{entry["path"]}__', quote=True)
+        return True
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.link(entry["path"], file_path)
+    except OSError as e:
+        logging.warning(f'{file_name} - Unable to hardlink {entry["path"]}, downloading it again. Error:\n {e}')
+        return False
+    logging.info(f'{file_name} - Already downloaded, hardlinked to {entry["path"]}')
+    if notify:
+        await message.reply_text(f'Already downloaded, linked to __{entry["path"]}__', quote=True)
+    return True
+
+
+def create_job(message: Message, file_name: str, user_id: int, reply_chat_id: int) -> Job:
+    """
+    This function stores a new job, it must be started once its status reply has been sent
+    :param message: The media message
+    :param file_name: The target file name, relative to the download dir, or absolute when routed elsewhere
+    :param user_id: The id of the user that requested the download
+    :param reply_chat_id: The chat where the status reply is sent
+    :return: The stored Job instance
+    """
+    logging.info(f'Enqueueing media: {message.media} - {file_name}')
+    media: Photo | Voice | Video | Animation | Audio | Document = getattr(message, message.media.value)
+    job: Job = job_store.add(message.chat.id, message.id, reply_chat_id, 0, file_name, user_id,
+                             getattr(media, "file_size", 0) or 0)
+    job.message = message
+    job_registry.add(job)
+    return job
+
+
+def start_job(job: Job, reply: Message) -> None:
+    """
+    This function binds a job to its status reply and puts it in the queue
+    :param job: A stored Job instance
+    :param reply: The status reply
+    """
+    job_store.update_reply(job, reply.id)
+    job.reply = reply
+    put_job(job)
+
+
+def put_job(job: Job) -> None:
+    """
+    This function puts a job in the queue, recording when it started waiting
+    :param job: A Job instance with its message and reply
+    """
+    job.enqueued_at = time.monotonic()
+    jobs_enqueued.inc()
+    queue.put_nowait(job)
 
 
 # Enqueue a job
 async def enqueue_job(message: Message, file_name: str) -> None:
-    logging.info(f'Enqueueing media: {message.media} - {file_name}')
-    reply = await message.reply_text("In queue", quote=True)
-    queue.put_nowait([message, reply, file_name])
-
-
-# Update download status
-async def worker_progress(current, total, reply: list[Message]) -> None:
-    status = int(current * 100 / total)
-    message = reply[0]
-    if status != 0 and status % 5 == 0 and str(status) not in message.text:
-        reply[0] = await message.edit(f'Downloading: {status}%')
-
-
-# Parallel worker to download media files
-async def worker() -> None:
-    while True:
-        # Get a "work item" out of the queue.
-        queue_item = await queue.get()
-        message: Message = queue_item[0]
-        reply: Message = queue_item[1]
-        file_name: str = queue_item[2]
-        file_path = os.path.join(config_manager.get_config().TG_DOWNLOAD_PATH, file_name)
+    file_name = config_manager.route(message, file_name, message.from_user.id)
+    if await handle_duplicate(message, file_name):
+        return
+    job: Job = create_job(message, file_name, message.from_user.id, message.chat.id)
+    start_job(job, await message.reply_text(f'In queue (job #{job.id})', quote=True))
+
+
+async def collect_album(message: Message) -> None:
+    """
+    This function buffers the messages of an album, the first one waits for the others and ingests them together
+    :param message: A media message belonging to an album
+    """
+    messages: list[Message] | None = albums.get(message.media_group_id)
+    if messages is not None:
+        messages.append(message)
+        return
+    albums[message.media_group_id] = [message]
+    await asyncio.sleep(ALBUM_WINDOW)
+    messages = sorted(albums.pop(message.media_group_id), key=lambda m: m.id)
+    logging.info(f'Received an album of {len(messages)} media - {message.media_group_id}')
+    pending_albums[message.media_group_id] = messages
+    await messages[0].reply_text(f'Received an album of {len(messages)} media. Do you want to use a custom name '
+                                 f'prefix? The files will be saved in a folder with the same name.', quote=True,
+                                 reply_markup=InlineKeyboardMarkup(
+                                     [[
+                                         InlineKeyboardButton(
+                                             "Yes", callback_data=f'album_rename/yes/{message.media_group_id}'),
+                                         InlineKeyboardButton(
+                                             "No", callback_data=f'album_rename/no/{message.media_group_id}')
+                                     ]]
+                                 ))
+
+
+async def enqueue_album(messages: list[Message], prefix: str | None) -> None:
+    """
+    This function enqueues all the media of an album in its own folder, sharing a single status reply
+    :param messages: The album's messages
+    :param prefix: A custom name prefix used for the folder and the files, None to keep the original names
+    """
+    folder: str = prefix or f'album_{messages[0].media_group_id}'
+    jobs: list[Job] = []
+    for index, message in enumerate(messages, start=1):
+        media: Photo | Voice | Video | Animation | Audio | Document = getattr(message, message.media.value)
+        name: str = f'{prefix}_{index:02d}.{get_extension(message.media, media)}' if prefix \
+            else get_default_file_name(message)
+        file_name: str = config_manager.route(message, os.path.join(folder, name), message.from_user.id)
+        if not await handle_duplicate(message, file_name, notify=False):
+            jobs.append(create_job(message, file_name, message.from_user.id, message.chat.id))
+    text: str = f'Album __{folder}__: {len(jobs)} media in queue'
+    if jobs:
+        text += f' (jobs #{jobs[0].id}-#{jobs[-1].id})'
+    if len(jobs) < len(messages):
+        text += f', {len(messages) - len(jobs)} already downloaded'
+    reply: Message = await messages[0].reply_text(text, quote=True)
+    batch = JobBatch(f'Album {folder}', len(jobs), sum(job.file_size for job in jobs))
+    for job in jobs:
+        job.batch = batch
+        start_job(job, reply)
+
+
+async def harvest_chat(message: Message, chat: str | int, from_id: int | None, to_id: int | None,
+                       harvest_filters: HarvestFilters) -> None:
+    """
+    This function harvests the media of a chat, enqueueing them as a single batch in their own folder
+    :param message: The /harvest command message, the status reply is sent to its chat
+    :param chat: The chat id or username to harvest
+    :param from_id: The first message id, None to continue from the previous harvest
+    :param to_id: The last message id, None to harvest up to the newest message
+    :param harvest_filters: The filters the media must pass
+    """
+    reply: Message = await message.reply_text(f'Harvesting __{chat}__...', quote=True)
+    batch = JobBatch(f'Harvest {chat}', 0, 0)
+    batch.growing = True
+    skipped: list[int] = [0]
+
+    async def on_page(source: Chat, messages: list[Message]) -> None:
+        folder: str = f'harvest_{source.username or source.id}'
+        for media_message in messages:
+            file_name: str = os.path.join(folder, get_default_file_name(media_message))
+            file_name = config_manager.route(media_message, file_name, message.from_user.id)
+            # The job store keeps the enqueued jobs across restarts, so the harvest is done with them
+            if await handle_duplicate(media_message, file_name, notify=False):
+                skipped[0] += 1
+                get_harvester().complete(source.id, media_message.id)
+                continue
+            job: Job = create_job(media_message, file_name, message.from_user.id, message.chat.id)
+            job.batch = batch
+            batch.total += 1
+            batch.total_size += job.file_size
+            # Reported to the harvester when the job ends
+            start_job(job, reply)
+
+    try:
+        matched: int = await get_harvester().harvest(chat, from_id, to_id, harvest_filters, on_page)
+        text: str = f'**Harvest {chat}:** {matched} media found, {batch.total} in queue'
+        if skipped[0]:
+            text += f', {skipped[0]} already downloaded'
+    except asyncio.CancelledError:
+        text = f'**Harvest {chat}:** aborted, {batch.total} media in queue'
+    except Exception as e:
+        logging.error(f'Harvest of {chat} failed, error:\n {e}')
+        text = f'**ERROR:** Harvest of {chat} failed, {batch.total} media in queue\n__{e.__class__.__name__}: {e}__'
+    batch.growing = False
+    await reply.edit(text)
+
+
+# Update download status, the reporter takes care of editing the reply
+async def worker_progress(current, total, job: Job) -> None:
+    job.received = current
+    if job.first_byte_at is None:
+        job.first_byte_at = time.monotonic()
+        time_to_first_byte.observe(job.first_byte_at - job.started_at)
+    if job.batch:
+        # The jobs of a batch share the reply, it shows the overall progress
+        job.batch.received[job.id] = current
+        progress_reporter.update(job.reply, job.batch.get_received(), job.batch.total_size, job.batch.get_summary())
+    else:
+        progress_reporter.update(job.reply, current, total)
+
+
+def get_log_fields(job: Job, **fields) -> dict:
+    """
+    This function returns the fields of a job added to its log records, written in the JSON log file
+    :param job: The job being logged
+    :param fields: Additional fields, like duration or error
+    :return: A dict to pass as extra to the logging functions
+    """
+    return {"job_id": job.id, "file_size": job.file_size, "attempt": job.attempts + 1, "user_id": job.user_id,
+            **fields}
+
+
+def get_final_text(job: Job, text: str, success: bool) -> str:
+    """
+    This function returns the text of the status reply when a job ends
+    :param job: The ended job
+    :param text: The outcome of the job
+    :param success: A control flag telling if the job completed successfully
+    :return: The outcome itself, or the summary of the batch the job belongs to
+    """
+    if not job.batch:
+        return text
+    if success:
+        job.batch.done += 1
+    else:
+        job.batch.failed += 1
+    return f'{job.batch.get_summary()}\n__{os.path.basename(job.file_name)}__: {text}'
+
+
+# Parallel worker to download media files, it processes a single job taken from the queue by the worker pool
+async def worker(job: Job, node: RemoteNode | None = None) -> None:
+    message: Message = job.message
+    reply: Message = job.reply
+    file_name: str = job.file_name
+    file_path = os.path.join(config_manager.get_config().TG_DOWNLOAD_PATH, file_name)
+    job.started_at = time.monotonic()
+    job.first_byte_at = None
+    queue_wait.observe(job.started_at - job.enqueued_at)
+    pooled: PooledClient | None = None
+    hasher: StreamHasher | None = None
+    result: dict = {}
+    downloaded_path: str | None = None
+    context: dict = {"job_id": job.id, "file_name": file_name, "file_size": job.file_size,
+                     "chat_id": job.chat_id, "message_id": job.message_id, "user_id": job.user_id}
+    # Only the errors of the download itself are classified and retried, the status edits are handled on their own
+    try:
+        if job.attempts and not node:
+            # The file reference of the cached message may have expired meanwhile
+            message = job.message = await app.get_messages(job.chat_id, job.message_id)
+        # A worker node checks its own disk, a stream sink doesn't use it
+        local_disk: bool = not node and not stream_sink
+        if local_disk and not disk_admission.can_admit(file_path, job.file_size):
+            logging.warning(f'{file_name} - Not enough free disk space, waiting for the running downloads')
+            if not job.batch:
+                reply = job.reply = await edit_status(job, 'Waiting for free disk space...')
+        # The reservation is released whatever happens once it's taken, or it would shrink the space of every job
         try:
-            logging.info(f'{file_name} - Download started')
-            reply = await reply.edit('Downloading:  0%')
-            task = asyncio.get_event_loop().create_task(
-                message.download(file_path, progress=worker_progress, progress_args=([reply],)))
-            tasks.append(task)
-            await asyncio.wait_for(task, timeout=config_manager.get_config().TG_DL_TIMEOUT)
-            logging.info(f'{file_name} - Successfully downloaded')
-            await reply.edit(f'Finished at {time.strftime("%H:%M", time.localtime())}')
-        except MessageNotModified:
-            pass
-        except asyncio.CancelledError:
-            logging.warning(f'{file_name} - Aborted')
-            await reply.edit("Aborted")
-        except asyncio.TimeoutError:
-            logging.error(f'{file_name} - TIMEOUT ERROR')
-            await reply.edit('**ERROR:** __Timeout reached downloading this file__')
-        except Exception as e:
-            logging.error(f'{file_name} - {str(e)}')
-            await reply.edit(
-                f'**ERROR:** Exception {(e.__class__.__name__, str(e))} raised downloading this file: {file_name}')
+            if local_disk:
+                await disk_admission.acquire(job.id, file_path, job.file_size)
+            logging.info(f'{file_name} - Download started' + (f' on worker node {node.name}' if node else ''),
+                         extra=get_log_fields(job, node=node.name if node else None))
+            set_state(job, JobState.DOWNLOADING)
+            if not job.batch:
+                reply = job.reply = await edit_status(job, 'Downloading:  0%')
+            hasher = StreamHasher(post_processor.get_hash_executor(), job.file_size, CHUNK_SIZE) \
+                if post_processor.is_hashing() and not node else None
+            if node:
+                task = asyncio.get_event_loop().create_task(
+                    node.run(job, progress=worker_progress, progress_args=(job,)))
+                job_registry.attach(job, task)
+                result = await asyncio.wait_for(task, timeout=config_manager.get_config().TG_DL_TIMEOUT)
+                downloaded_path = result["file_path"]
+            else:
+                pooled, pooled_message = await client_pool.acquire(message)
+                if pooled.client is not app:
+                    logging.info(f'{file_name} - Downloading with pool client {pooled.get_name()}')
+                task = asyncio.get_event_loop().create_task(
+                    pooled.engine.download_to_sink(pooled_message, stream_sink, file_name, context,
+                                                   progress=worker_progress, progress_args=(job,), hasher=hasher)
+                    if stream_sink else
+                    pooled.engine.download(pooled_message, file_path, progress=worker_progress, progress_args=(job,),
+                                           hasher=hasher))
+                job_registry.attach(job, task)
+                try:
+                    downloaded_path = await asyncio.wait_for(
+                        task, timeout=config_manager.get_config().TG_DL_TIMEOUT)
+                finally:
+                    client_pool.release(pooled)
+        finally:
+            disk_admission.release(job.id)
+            await progress_reporter.finish(reply)
+    except asyncio.CancelledError:
+        if stopping:
+            # The job stays pending in the store, it will be restored on next start
+            raise
+        if job.interrupt == "pause":
+            set_state(job, JobState.QUEUED)
+            job_registry.hold(job)
+            show_paused(job)
+            return
+        logging.warning(f'{file_name} - Aborted', extra=get_log_fields(job))
+        jobs_finished.inc(outcome="aborted")
+        set_state(job, JobState.ABORTED)
+        await report_status(job, get_final_text(job, "Aborted" + get_resume_hint(), False))
+        return
+    except asyncio.TimeoutError:
+        logging.error(f'{file_name} - TIMEOUT ERROR', extra=get_log_fields(job, error="TimeoutError"))
+        download_errors.inc(error="TimeoutError")
+        jobs_finished.inc(outcome="failed")
+        set_state(job, JobState.FAILED)
+        await report_status(job, get_final_text(job, '**ERROR:** __Timeout reached downloading this file__'
+                                                + get_resume_hint(), False))
+        return
+    except Exception as e:
+        download_errors.inc(error=e.__class__.__name__)
+        if concurrency_controller and not node:
+            # The remote nodes don't depend on the local parallelism
+            if isinstance(e, FloodWait):
+                concurrency_controller.record_flood_wait()
+            elif retry_scheduler.should_retry(job, e):
+                concurrency_controller.record_error()
+        if isinstance(e, FloodWait):
+            flood_wait_seconds.inc(e.value)
+            if pooled and await client_pool.report_flood_wait(pooled, e.value, message):
+                # Another account takes over right away, the attempt isn't counted
+                logging.warning(f'{file_name} - {str(e)}, moving to another client',
+                                extra=get_log_fields(job, error=e.__class__.__name__))
+                set_state(job, JobState.QUEUED)
+                put_job(job)
+                if not job.batch:
+                    await edit_status(job, 'In queue, moving to another client...')
+                return
+        if retry_scheduler.should_retry(job, e):
+            set_state(job, JobState.QUEUED)
+            download_retries.inc()
+            delay: float = retry_scheduler.schedule(job, e, put_job)
+            logging.warning(f'{file_name} - {str(e)}, retrying in {delay:.1f} seconds',
+                            extra=get_log_fields(job, error=e.__class__.__name__, retry_delay=round(delay, 1)))
+            await report_status(job, f'**Retrying in {format_duration(delay)}** '
+                                     f'(attempt {job.attempts + 1}/{retry_scheduler.get_max_attempts()})\n'
+                                     f'__{e.__class__.__name__}: {str(e)}__')
+            return
+        logging.error(f'{file_name} - {str(e)}', extra=get_log_fields(job, error=e.__class__.__name__))
+        jobs_finished.inc(outcome="failed")
+        set_state(job, JobState.FAILED)
+        await report_status(job, get_final_text(
+            job, f'**ERROR:** Exception {(e.__class__.__name__, str(e))} raised downloading this file: {file_name}',
+            False))
+        return
+    set_state(job, JobState.DONE)
+    task = asyncio.get_event_loop().create_task(complete_job(job, node, result, downloaded_path, hasher, context))
+    completions.add(task)
+    task.add_done_callback(completions.discard)
 
-        # Notify the queue that the "work item" has been processed.
-        queue.task_done()
 
+async def complete_job(job: Job, node: RemoteNode | None, result: dict, downloaded_path: str | None,
+                       hasher: StreamHasher | None, context: dict) -> None:
+    """
+    This function records a downloaded job, post-processes its file and reports the outcome. It runs as a task of
+    its own, so a slow extraction or hook doesn't keep a worker from downloading.
+    :param job: The downloaded job
+    :param node: The worker node that downloaded the job, None if downloaded locally
+    :param result: The result sent by the worker node
+    :param downloaded_path: The path of the file, None if the download has been skipped
+    :param hasher: The hasher fed by the download, None if hashing is disabled
+    :param context: The job details passed to the post-processing
+    """
+    try:
+        file_name: str = job.file_name
+        if not downloaded_path:
+            jobs_finished.inc(outcome="skipped")
+            await report_status(job, get_final_text(job, "Skipped, the file already exists", True))
+            return
+        streamed: bool = result.get("streamed", False) if node else stream_sink is not None
+        file_path: str = downloaded_path
+        media: Photo | Voice | Video | Animation | Audio | Document = getattr(job.message, job.message.media.value)
+        # The file of a worker node is on its own host
+        file_size: int = result["file_size"] if node else job.file_size if streamed else os.path.getsize(file_path)
+        duration: float = time.monotonic() - job.started_at
+        logging.info(f'{file_name} - Successfully ' + (f'streamed to {downloaded_path}' if streamed else 'downloaded'),
+                     extra=get_log_fields(job, file_size=file_size, duration=round(duration, 3),
+                                          throughput=round(file_size / duration) if duration > 0 else None))
+        jobs_finished.inc(outcome="done")
+        downloaded_bytes.inc(file_size)
+        download_duration.observe(duration)
+        if duration > 0:
+            download_speed.observe(file_size / duration)
+        if node:
+            # The node already post-processed the file
+            sha256, outcomes = result["sha256"], result["outcomes"]
+        elif streamed:
+            # The other stages need a local file
+            sha256 = hasher.get_digest() if hasher else None
+            outcomes = [f'SHA-256 {sha256}'] if sha256 else []
+        else:
+            context.update(file_size=file_size, sha256=hasher.get_digest() if hasher else None)
+            outcomes = await post_processor.process(file_path, context)
+            sha256 = context["sha256"]
+        # The file of a worker node is on its own host, its path would point to an unrelated local file
+        if not streamed and not node:
+            dedup_index.add(media.file_unique_id, file_path, file_size, sha256)
+        text: str = f'Finished at {time.strftime("%H:%M", time.localtime())}'
+        if not job.batch:
+            if streamed:
+                text += f'\nStreamed to __{file_path}__'
+            elif os.path.basename(file_path) != os.path.basename(file_name):
+                text += f'\nSaved as __{os.path.basename(file_path)}__'
+            text += "".join(f'\n__{outcome}__' for outcome in outcomes)
+        await report_status(job, get_final_text(job, text, True))
+    except Exception as e:
+        # The file is already downloaded, downloading it again would only duplicate it
+        logging.error(f'{job.file_name} - Unable to complete the downloaded job, error:\n {e}',
+                      extra=get_log_fields(job, error=e.__class__.__name__))
 
+
+async def report_status(job: Job, text: str) -> None:
+    """
+    This function shows the outcome of a job. The jobs of a batch share the reply, their outcomes are coalesced on the
+    budget of the progress reporter and only the last job of the batch edits the reply right away.
+    :param job: The job the reply belongs to
+    :param text: The status text
+    """
+    if job.batch and not job.batch.is_finished():
+        progress_reporter.show(job.reply, text)
+        return
+    if job.batch:
+        # A queued outcome of another job would overwrite the final summary
+        await progress_reporter.finish(job.reply)
+    await edit_status(job, text)
+
+
+async def edit_status(job: Job, text: str) -> Message:
+    """
+    This function edits the status reply of a job, a failed edit is logged and doesn't affect the job
+    :param job: The job the reply belongs to
+    :param text: The new status text
+    :return: The edited reply, or the unchanged one if the edit failed
+    """
+    try:
+        return await job.reply.edit(text)
+    except MessageNotModified:
+        pass
+    except RPCError as e:
+        logging.warning(f'{job.file_name} - Unable to update the status reply, error:\n {e}')
+    return job.reply
+
+worker_pool: WorkerPool = WorkerPool(queue, worker)
 app = init()
+rate_limiter: RateLimiter = RateLimiter(config_manager.get_config().TG_RATE_LIMIT,
+                                        config_manager.get_config().TG_RATE_LIMIT_PER_JOB,
+                                        config_manager.get_config().TG_RATE_SCHEDULE)
+file_finalizer: FileFinalizer = FileFinalizer(config_manager.get_config().TG_COLLISION_POLICY)
+client_pool: ClientPool = ClientPool(
+    [app] + create_pool_clients(),
+    lambda client: DownloadEngine(client, config_manager.get_config().TG_DL_CONNECTIONS,
+                                  config_manager.get_config().TG_DL_RESUME, rate_limiter,
+                                  config_manager.get_config().TG_PREALLOCATE, file_finalizer))
+disk_admission: DiskAdmission = DiskAdmission(config_manager.get_config().TG_DISK_MARGIN * 1024 * 1024)
+progress_reporter: ProgressReporter = ProgressReporter(config_manager.get_config().TG_PROGRESS_RATE)
+retry_scheduler: RetryScheduler = RetryScheduler(config_manager.get_config().TG_DL_RETRIES)
+job_registry: JobRegistry = JobRegistry(queue, retry_scheduler, put_job)
+control_api: ControlApi | None = ControlApi(
+    config_manager.get_config().TG_API_TOKEN, get_queue_report,
+    {"cancel": cancel_job, "pause": pause_job, "resume": resume_job, "priority": bump_job},
+    {"pause": lambda: set_queue_paused(True), "resume": lambda: set_queue_paused(False)}) \
+    if config_manager.get_config().TG_API_PORT else None
+concurrency_controller: ConcurrencyController | None = ConcurrencyController(
+    worker_pool, rate_limiter.get_consumed, queue.qsize, config_manager.get_config().TG_MIN_PARALLEL,
+    config_manager.get_config().TG_MAX_PARALLEL) if config_manager.get_config().TG_ADAPTIVE_PARALLEL else None
+# Created on the first harvest, most runs never need it
+harvester: Harvester | None = None
+coordinator: Coordinator | None = Coordinator(config_manager.get_config().TG_COORDINATOR_ADDRESS,
+                                              config_manager.get_config().TG_COORDINATOR_TOKEN, queue, worker) \
+    if config_manager.get_config().TG_COORDINATOR_ADDRESS else None
+stream_sink: StreamSink | None = StreamSink.create(
+    config_manager.get_config().TG_STREAM_SINK, config_manager.get_config().TG_S3_ENDPOINT,
+    config_manager.get_config().TG_S3_ACCESS_KEY, config_manager.get_config().TG_S3_SECRET_KEY,
+    config_manager.get_config().TG_S3_REGION) if config_manager.get_config().TG_STREAM_SINK else None
+post_processor: PostProcessor = PostProcessor(
+    config_manager.get_config().TG_POST_WORKERS,
+    PostProcessor.create_stages(config_manager.get_config().TG_POST_HASH, config_manager.get_config().TG_POST_EXTRACT,
+                                config_manager.get_config().TG_POST_HOOK))
 
 
 # On_Message Decorators
@@ -259,7 +1141,7 @@ async def set_dl_path_command(_, message: Message) -> None:
     & filters.command("set_max_parallel_dl"))
 async def set_max_parallel_dl_command(_, message: Message) -> None:
     logging.info("Executing command /set_max_parallel_dl")
-    await message.reply_text("To change the max parallel downloads all current tasks must be aborted, do you want to continue?",
+    await message.reply_text("Do you want to change the max parallel downloads?",
                              reply_markup=InlineKeyboardMarkup(
                                  [[
                                      InlineKeyboardButton("Yes", callback_data="set_max_parallel_dl/yes"),
@@ -288,11 +1170,127 @@ async def status_command(_, message: Message) -> None:
     await message.reply_text(
         '**Current configuration:**\n\n'
         f'**Download Path:** __{config_manager.get_config().TG_DOWNLOAD_PATH}__\n'
-        f'**Concurrent Downloads:** {config_manager.get_config().TG_MAX_PARALLEL}\n'
+        f'**Concurrent Downloads:** {get_parallel_text()}\n'
+        f'**Bandwidth Limit:** {get_rate_limit_text()}\n'
         f'**Allowed Users:** {config_manager.get_config().TG_AUTHORIZED_USER_ID}\n\n'
     )
 
 
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID) & filters.command("stats"))
+async def stats_command(_, message: Message) -> None:
+    logging.info("Executing command /stats")
+    await message.reply_text(get_stats_text())
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID)
+    & filters.command("dedup_rebuild"))
+async def dedup_rebuild_command(_, message: Message) -> None:
+    logging.info("Executing command /dedup_rebuild")
+    reply: Message = await message.reply_text("Scanning the download dirs...")
+    dropped, indexed = await asyncio.get_event_loop().run_in_executor(None, dedup_index.rebuild,
+                                                                      get_download_paths())
+    await reply.edit(f'**Dedup index rebuilt:** {dropped} missing files dropped, {indexed} files indexed')
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID)
+    & filters.command("harvest"))
+async def harvest_command(_, message: Message) -> None:
+    logging.info("Executing command /harvest")
+    args: list[str] = message.command[1:]
+    ids: list[int] = [int(arg) for arg in args[1:] if arg.isdigit()]
+    try:
+        if not args or len(ids) > 2:
+            raise ValueError("A chat is required, followed by at most two message ids")
+        harvest_filters = HarvestFilters([arg for arg in args[1:] if not arg.isdigit()])
+    except ValueError as e:
+        await message.reply_text(f'**ERROR:** __{e}__\n\nUsage: /harvest <chat> [from_id] [to_id] '
+                                 f'[type=video,document] [min_size=10MB] [max_size=2GB] [after=YYYY-MM-DD] '
+                                 f'[before=YYYY-MM-DD]')
+        return
+    chat: str | int = int(args[0]) if args[0].lstrip("-").isdigit() else args[0].lstrip("@")
+    ids += [None] * (2 - len(ids))
+    task = asyncio.get_event_loop().create_task(harvest_chat(message, chat, ids[0], ids[1], harvest_filters))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID)
+    & filters.command("set_rate_limit"))
+async def set_rate_limit_command(_, message: Message) -> None:
+    logging.info("Executing command /set_rate_limit")
+    if len(message.command) != 2:
+        await message.reply_text("Usage: /set_rate_limit <KB/s>")
+        return
+    if await config_manager.change_rate_limit(message.command[1]):
+        rate_limiter.set_limit(config_manager.get_config().TG_RATE_LIMIT)
+        await message.reply_text(f'The bandwidth limit has been changed successfully: {get_rate_limit_text()}')
+    else:
+        await message.reply_text("An error occurred while changing the bandwidth limit, please check logs!")
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID)
+    & filters.command("priority"))
+async def priority_command(_, message: Message) -> None:
+    logging.info("Executing command /priority")
+    if len(message.command) != 2 or not message.command[1].lstrip("#").isdigit():
+        await message.reply_text("Usage: /priority <job_id>")
+        return
+    job_id: int = int(message.command[1].lstrip("#"))
+    if await bump_job(job_id):
+        await message.reply_text(f'Job #{job_id} will be the next one to be downloaded')
+    else:
+        await message.reply_text("The job is not in queue!")
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID) & filters.command("queue"))
+async def queue_command(_, message: Message) -> None:
+    logging.info("Executing command /queue")
+    await message.reply_text(get_queue_text())
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID)
+    & filters.command("cancel"))
+async def cancel_command(_, message: Message) -> None:
+    logging.info("Executing command /cancel")
+    if len(message.command) != 2 or not message.command[1].lstrip("#").isdigit():
+        await message.reply_text("Usage: /cancel <job_id>")
+        return
+    job_id: int = int(message.command[1].lstrip("#"))
+    if await cancel_job(job_id):
+        await message.reply_text(f'Job #{job_id} has been cancelled')
+    else:
+        await message.reply_text("The job doesn't exist or it already ended!")
+
+
+@app.on_message(
+    filters.private & filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID)
+    & filters.command(["pause", "resume"]))
+async def pause_resume_command(_, message: Message) -> None:
+    command: str = message.command[0]
+    logging.info(f"Executing command /{command}")
+    if len(message.command) == 1:
+        set_queue_paused(command == "pause")
+        await message.reply_text("The queue is paused, the running downloads go on" if command == "pause"
+                                 else "The queue has been resumed")
+        return
+    if len(message.command) != 2 or not message.command[1].lstrip("#").isdigit():
+        await message.reply_text(f'Usage: /{command} [job_id]')
+        return
+    job_id: int = int(message.command[1].lstrip("#"))
+    if await (pause_job(job_id) if command == "pause" else resume_job(job_id)):
+        await message.reply_text(f'Job #{job_id} has been {command}d')
+    else:
+        await message.reply_text("The job doesn't exist or it is already paused!" if command == "pause"
+                                 else "The job is not paused!")
+
+
 @app.on_message(filters.private & ~filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID))
 async def no_auth_message(_, message: Message) -> None:
     logging.warning(f'Received message from unauthorized user ({message.from_user.id})')
@@ -307,6 +1305,8 @@ async def media_message(_, message: Message) -> None:
     if message.media in unsupported_types:
         logging.warning(f'Received invalid media: {message.id} - {message.media}')
         await message.reply_text("This media is not supported!", quote=True)
+    elif message.media_group_id:
+        await collect_album(message)
     else:
         r_text = "This file does not have a file name. Do you want to use a custom file name instead of file_id?"
         r_markup = InlineKeyboardMarkup(
@@ -327,6 +1327,27 @@ async def media_message(_, message: Message) -> None:
 
 
 # On Callback decorators
+@app.on_callback_query(
+    filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID) & filters.regex(r"^album_rename/.+"))
+async def album_rename_callback(client: Client, callback_query: CallbackQuery) -> None:
+    _, answer, media_group_id = callback_query.data.split("/")
+    messages: list[Message] | None = pending_albums.pop(media_group_id, None)
+    await callback_query.edit_message_reply_markup()
+    if not messages:
+        await callback_query.edit_message_text("The album is not available anymore (too long since input?)")
+        return
+    prefix: str | None = None
+    if answer == "yes":
+        await callback_query.edit_message_text("Enter the prefix in 15 seconds or the original names will be used.")
+        try:
+            response = await client.listen(callback_query.message.chat.id, filters.text, timeout=15)
+            prefix = response.text.strip().replace("/", "_")
+        except asyncio.TimeoutError:
+            pass
+    await callback_query.message.delete()
+    await enqueue_album(messages, prefix)
+
+
 @app.on_callback_query(
     filters.user(users=config_manager.get_config().TG_AUTHORIZED_USER_ID) & filters.regex(r"^abort/.+"))
 async def abort_callback(_, callback_query: CallbackQuery) -> None:
@@ -334,7 +1355,7 @@ async def abort_callback(_, callback_query: CallbackQuery) -> None:
     await callback_query.edit_message_reply_markup()
     if answer == "yes":
         reply: str = "There are not jobs pending!"
-        if tasks:
+        if tasks or job_registry.get_count():
             await abort()
             reply = "All pending jobs have been terminated."
         await callback_query.edit_message_text(reply)
@@ -355,7 +1376,7 @@ async def set_dl_path_callback(client: Client, callback_query: CallbackQuery) ->
         try:
             response = await client.listen(message.chat.id, filters.text, timeout=60)
             reply_str: str
-            if config_manager.change_download_path(response.text):
+            if await config_manager.change_download_path(response.text):
                 reply_str = "The download dir has been changed successfully, new downloads will be redirected there"
             else:
                 reply_str = "An error occurred while changing the download dir, please check logs!"
@@ -376,12 +1397,18 @@ async def set_max_parallel_dl_callback(client: Client, callback_query: CallbackQ
         await callback_query.edit_message_text("Enter the new max parallel downloads in 30 seconds: ")
         try:
             response = await client.listen(message.chat.id, filters.text, timeout=30)
-            if config_manager.change_max_parallel_downloads(response.text):
-                await abort(kill_workers=True)
-                generate_workers(config_manager.get_config().TG_MAX_PARALLEL)
-                reply_str = "The max parallel downloads has been changed successfully"
+            if await config_manager.change_max_parallel_downloads(response.text):
+                max_parallel: int = config_manager.get_config().TG_MAX_PARALLEL
+                # Pyrogram's single stream downloads are bounded by the semaphore of each account
+                client_pool.set_max_transmissions(max_parallel)
+                if concurrency_controller:
+                    concurrency_controller.set_maximum(max_parallel)
+                else:
+                    worker_pool.resize(max_parallel)
+                reply_str = "The max parallel downloads has been changed successfully, running downloads are not " \
+                            "affected"
             else:
-                reply_str = "An error occurred while changing the download dir, please check logs!"
+                reply_str = "An error occurred while changing the max parallel downloads, please check logs!"
             await client.send_message(message.chat.id, text=reply_str)
         except asyncio.TimeoutError:
             await callback_query.edit_message_text("Operation cancelled")
@@ -416,4 +1443,5 @@ async def media_rename_callback(client: Client, callback_query: CallbackQuery) -
         await callback_query.edit_message_text("The media's message is not available anymore (too long since input?")
 
 
+startup_profiler.mark("handlers")
 app.run(main())
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+from pathlib import Path
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.enums import ParseMode
+from pyrogram.types import Message, Chat
+
+from modules.ConfigManager import ConfigManager
+from modules.DedupIndex import DedupIndex
+from modules.DownloadEngine import DownloadEngine
+from modules.FileFinalizer import FileFinalizer
+from modules.Harvester import Harvester, PAGE_SIZE
+from modules.LogManager import LogManager
+from modules.RateLimiter import RateLimiter
+from modules.RetryScheduler import RETRYABLE_ERRORS, BASE_DELAY, MAX_DELAY
+from modules.WorkerPool import WorkerPool
+from modules.helpers import get_config_from_user_or_env, get_default_file_name
+from modules.models.ConfigFile import ConfigFile
+from modules.models.HarvestFilters import HarvestFilters
+
+log_manager: LogManager = LogManager("tg_harvester.log")
+config_manager: ConfigManager = ConfigManager(Path(os.environ.get("CONFIG_PATH", "./config.json")))
+db_path: Path = Path(os.environ.get("JOBS_DB_PATH", "./jobs.db"))
+
+
+def get_args() -> argparse.Namespace:
+    """
+    This function parses the command line arguments
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Downloads the media of a chat without going through the bot. "
+                                                 "Re-running it on the same chat continues from the last harvested "
+                                                 "message.")
+    parser.add_argument("chat", help="The chat id or username to harvest")
+    parser.add_argument("filters", nargs="*",
+                        help="Filters as key=value: type=video,document min_size=10MB max_size=2GB "
+                             "after=YYYY-MM-DD before=YYYY-MM-DD")
+    parser.add_argument("--from-id", type=int, help="The first message id (default: continue from the last harvest)")
+    parser.add_argument("--to-id", type=int, help="The last message id (default: the newest message, required when "
+                                                  "using the bot session)")
+    parser.add_argument("--session", help="The session name (default: <TG_SESSION>_harvester)")
+    parser.add_argument("--user", action="store_true",
+                        help="Log in as a user instead of the bot, needed to read the history of chats the bot "
+                             "is not member of")
+    parser.add_argument("--parallel", type=int, help="The number of parallel downloads (default: TG_MAX_PARALLEL)")
+    return parser.parse_args()
+
+
+def get_config() -> ConfigFile:
+    """
+    This function loads the bot's config, asking for it when it doesn't exist yet
+    :return: A ConfigFile instance
+    """
+    if not config_manager.load_config_from_file():
+        config = get_config_from_user_or_env()
+        if not config_manager.validate_config(config):
+            exit(-1)
+        config_manager.load_config(config)
+        if not config_manager.save_config_to_file():
+            exit(-1)
+    config: ConfigFile = config_manager.get_config()
+    log_manager.configure(config.TG_LOG_LEVEL, config.TG_LOG_MAX_SIZE, config.TG_LOG_BACKUPS, config.TG_LOG_ROTATE_WHEN)
+    return config
+
+
+async def download(engine: DownloadEngine, message: Message, file_path: str, retries: int) -> str | None:
+    """
+    This function downloads a media, attempting it again on transient errors
+    :param engine: The download engine
+    :param message: The media message
+    :param file_path: The destination path
+    :param retries: The maximum number of attempts
+    :return: The path of the downloaded file, None if it was dropped by the collision policy
+    """
+    for attempt in range(retries):
+        try:
+            return await engine.download(message, file_path)
+        except RETRYABLE_ERRORS as e:
+            if attempt + 1 >= retries:
+                raise
+            delay: float = e.value if isinstance(e, FloodWait) \
+                else random.uniform(0.5, 1.5) * min(MAX_DELAY, BASE_DELAY * 2 ** attempt)
+            logging.warning(f'{file_path} - {str(e)}, retrying in {delay:.1f} seconds')
+            await asyncio.sleep(delay)
+
+
+async def main() -> None:
+    """
+    Entrypoint of the headless harvester
+    """
+    args = get_args()
+    try:
+        harvest_filters = HarvestFilters(args.filters)
+    except ValueError as e:
+        logging.error(f"Invalid filters, error:\n {e}")
+        exit(-1)
+    config: ConfigFile = get_config()
+    parallel: int = args.parallel or config.TG_MAX_PARALLEL
+    client = Client(args.session or f'{config.TG_SESSION}_harvester', config.TG_API_ID, config.TG_API_HASH,
+                    bot_token=None if args.user else config.TG_BOT_TOKEN, parse_mode=ParseMode.DEFAULT,
+                    max_concurrent_transmissions=parallel)
+    harvester = Harvester(client, db_path)
+    dedup_index = DedupIndex(db_path)
+    engine = DownloadEngine(client, config.TG_DL_CONNECTIONS, config.TG_DL_RESUME,
+                            RateLimiter(config.TG_RATE_LIMIT, config.TG_RATE_LIMIT_PER_JOB, config.TG_RATE_SCHEDULE),
+                            config.TG_PREALLOCATE, FileFinalizer(config.TG_COLLISION_POLICY))
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PAGE_SIZE)
+    failed: list[int] = []
+
+    async def worker(item: tuple[Message, str]) -> None:
+        message, file_path = item
+        media = getattr(message, message.media.value)
+        try:
+            logging.info(f'{file_path} - Download started')
+            downloaded_path: str | None = await download(engine, message, file_path, config.TG_DL_RETRIES)
+            if downloaded_path:
+                dedup_index.add(media.file_unique_id, downloaded_path, os.path.getsize(downloaded_path))
+                logging.info(f'{downloaded_path} - Successfully downloaded')
+            else:
+                logging.info(f'{file_path} - The file already exists, skipping')
+            harvester.complete(message.chat.id, message.id)
+        except Exception as e:
+            logging.error(f'{file_path} - Message {message.id} failed: {str(e)}')
+            failed.append(message.id)
+            # Harvested again by the next run
+            harvester.fail(message.chat.id, message.id)
+
+    async def on_page(chat: Chat, messages: list[Message]) -> None:
+        folder: str = os.path.join(config.TG_DOWNLOAD_PATH, f'harvest_{chat.username or chat.id}')
+        for message in messages:
+            media = getattr(message, message.media.value)
+            if config.TG_DEDUP_MODE != "redownload" and dedup_index.lookup(media.file_unique_id):
+                logging.info(f'Message {message.id} - Already downloaded, skipping')
+                harvester.complete(chat.id, message.id)
+                continue
+            # The queue is bounded, so the harvest waits for the workers instead of buffering the whole chat
+            await queue.put((message, os.path.join(folder, get_default_file_name(message))))
+
+    pool = WorkerPool(queue, worker)
+    async with client:
+        pool.resize(parallel)
+        try:
+            chat: str | int = int(args.chat) if args.chat.lstrip("-").isdigit() else args.chat.lstrip("@")
+            await harvester.harvest(chat, args.from_id, args.to_id, harvest_filters, on_page)
+            await queue.join()
+        except ValueError as e:
+            logging.error(e)
+        finally:
+            pool.stop()
+            await engine.close()
+            harvester.close()
+            dedup_index.close()
+    if failed:
+        logging.error(f'{len(failed)} downloads failed, message ids: {failed}')
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
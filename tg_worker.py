@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.enums import ParseMode
+from pyrogram.types import Message
+
+from modules.ConfigManager import ConfigManager
+from modules.DiskAdmission import DiskAdmission
+from modules.DownloadEngine import DownloadEngine, CHUNK_SIZE
+from modules.FileFinalizer import FileFinalizer
+from modules.LogManager import LogManager
+from modules.NodeProtocol import NodeConnection, open_connection
+from modules.PostProcessor import PostProcessor
+from modules.RateLimiter import RateLimiter
+from modules.RetryScheduler import RETRYABLE_ERRORS
+from modules.StreamHasher import StreamHasher
+from modules.StreamSink import StreamSink
+from modules.helpers import get_config_from_user_or_env
+from modules.models.ConfigFile import ConfigFile
+
+# Minimum time between two progress updates of a job sent to the coordinator
+PROGRESS_INTERVAL: float = 0.5
+RECONNECT_DELAY: float = 5
+MAX_RECONNECT_DELAY: float = 60
+
+log_manager: LogManager = LogManager("tg_worker.log")
+config_manager: ConfigManager = ConfigManager(Path(os.environ.get("CONFIG_PATH", "./config.json")))
+
+
+def get_args() -> argparse.Namespace:
+    """
+    This function parses the command line arguments
+    :return: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Downloads the jobs of a coordinator bot on this host, saving them "
+                                                 "in the local TG_DOWNLOAD_PATH.")
+    parser.add_argument("--connect", help="The coordinator address, unix:/path or host:port "
+                                          "(default: TG_COORDINATOR_ADDRESS)")
+    parser.add_argument("--token", help="The coordinator token (default: TG_COORDINATOR_TOKEN)")
+    parser.add_argument("--name", default=socket.gethostname(), help="The node name (default: the hostname)")
+    parser.add_argument("--slots", type=int, help="The number of parallel downloads (default: TG_MAX_PARALLEL)")
+    return parser.parse_args()
+
+
+def get_config() -> ConfigFile:
+    """
+    This function loads the bot's config, asking for it when it doesn't exist yet
+    :return: A ConfigFile instance
+    """
+    if not config_manager.load_config_from_file():
+        config = get_config_from_user_or_env()
+        if not config_manager.validate_config(config):
+            exit(-1)
+        config_manager.load_config(config)
+        if not config_manager.save_config_to_file():
+            exit(-1)
+    config: ConfigFile = config_manager.get_config()
+    log_manager.configure(config.TG_LOG_LEVEL, config.TG_LOG_MAX_SIZE, config.TG_LOG_BACKUPS, config.TG_LOG_ROTATE_WHEN)
+    return config
+
+
+class WorkerNode:
+    """
+    Runs the jobs sent by the coordinator with its own bot session, download engine and post-processing.
+    The node logs in with the same bot token of the coordinator, so the message ids of its chats are the same.
+    """
+    _client: Client
+    _config: ConfigFile
+    _engine: DownloadEngine
+    _disk_admission: DiskAdmission
+    _post_processor: PostProcessor
+    _sink: StreamSink | None
+    _running: dict[int, asyncio.Task]
+
+    def __init__(self, client: Client, config: ConfigFile):
+        self._client = client
+        self._config = config
+        self._engine = DownloadEngine(client, config.TG_DL_CONNECTIONS, config.TG_DL_RESUME,
+                                      RateLimiter(config.TG_RATE_LIMIT, config.TG_RATE_LIMIT_PER_JOB,
+                                                  config.TG_RATE_SCHEDULE),
+                                      config.TG_PREALLOCATE, FileFinalizer(config.TG_COLLISION_POLICY))
+        self._disk_admission = DiskAdmission(config.TG_DISK_MARGIN * 1024 * 1024)
+        self._post_processor = PostProcessor(config.TG_POST_WORKERS,
+                                             PostProcessor.create_stages(config.TG_POST_HASH, config.TG_POST_EXTRACT,
+                                                                         config.TG_POST_HOOK))
+        self._sink = StreamSink.create(config.TG_STREAM_SINK, config.TG_S3_ENDPOINT, config.TG_S3_ACCESS_KEY,
+                                       config.TG_S3_SECRET_KEY, config.TG_S3_REGION) if config.TG_STREAM_SINK else None
+        self._running = {}
+
+    async def serve(self, connection: NodeConnection) -> None:
+        """
+        This function runs the jobs received from the coordinator until it disconnects
+        :param connection: The authenticated connection
+        """
+        try:
+            while frame := await connection.receive():
+                if frame.get("type") == "job":
+                    job: dict = frame["job"]
+                    self._running[job["id"]] = asyncio.get_event_loop().create_task(self._run(connection, job))
+                elif frame.get("type") == "cancel" and frame.get("job_id") in self._running:
+                    logging.warning(f'Job #{frame["job_id"]} cancelled by the coordinator')
+                    self._running[frame["job_id"]].cancel()
+        finally:
+            # The coordinator retries the running jobs on another node
+            for task in self._running.values():
+                task.cancel()
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+            self._running.clear()
+
+    async def _run(self, connection: NodeConnection, job: dict) -> None:
+        """
+        This function downloads a job and reports its outcome
+        :param connection: The connection to the coordinator
+        :param job: The job details
+        """
+        file_name: str = job["file_name"]
+        file_path: str = os.path.join(self._config.TG_DOWNLOAD_PATH, file_name)
+        last_update: list[float] = [0]
+
+        async def progress(current: int, total: int) -> None:
+            now: float = time.monotonic()
+            if now - last_update[0] >= PROGRESS_INTERVAL or current == total:
+                last_update[0] = now
+                await connection.send({"type": "progress", "job_id": job["id"], "current": current, "total": total})
+
+        # Written in the JSON log file with each record of the job
+        fields: dict = {"job_id": job["id"], "file_size": job["file_size"], "user_id": job["user_id"]}
+        started_at: float = time.monotonic()
+        try:
+            message: Message = await self._client.get_messages(job["chat_id"], job["message_id"])
+            if not message or not message.media:
+                raise ValueError("The message doesn't contain a media anymore")
+            context: dict = {"job_id": job["id"], "file_name": file_name, "file_size": job["file_size"],
+                             "chat_id": job["chat_id"], "message_id": job["message_id"], "user_id": job["user_id"]}
+            if not self._sink:
+                await self._disk_admission.acquire(job["id"], file_path, job["file_size"])
+            logging.info(f'{file_name} - Download started', extra=fields)
+            hasher: StreamHasher | None = StreamHasher(self._post_processor.get_hash_executor(), job["file_size"],
+                                                       CHUNK_SIZE) if self._post_processor.is_hashing() else None
+            try:
+                if self._sink:
+                    downloaded_path: str | None = await self._engine.download_to_sink(
+                        message, self._sink, file_name, context, progress=progress, hasher=hasher)
+                else:
+                    downloaded_path = await self._engine.download(message, file_path, progress=progress,
+                                                                  hasher=hasher)
+            finally:
+                self._disk_admission.release(job["id"])
+            result: dict = {"file_path": downloaded_path, "file_size": 0, "sha256": None, "outcomes": [],
+                            "streamed": self._sink is not None}
+            duration: float = time.monotonic() - started_at
+            if downloaded_path:
+                result["file_size"] = job["file_size"] if self._sink else os.path.getsize(downloaded_path)
+                fields.update(file_size=result["file_size"], duration=round(duration, 3),
+                              throughput=round(result["file_size"] / duration) if duration > 0 else None)
+            if downloaded_path and self._sink:
+                logging.info(f'{file_name} - Successfully streamed to {downloaded_path}', extra=fields)
+                result["sha256"] = hasher.get_digest() if hasher else None
+                result["outcomes"] = [f'SHA-256 {result["sha256"]}'] if result["sha256"] else []
+            elif downloaded_path:
+                logging.info(f'{file_name} - Successfully downloaded', extra=fields)
+                context.update(file_size=result["file_size"], sha256=hasher.get_digest() if hasher else None)
+                result["outcomes"] = await self._post_processor.process(downloaded_path, context)
+                result["sha256"] = context["sha256"]
+            await connection.send({"type": "done", "job_id": job["id"], "result": result})
+        except asyncio.CancelledError:
+            logging.warning(f'{file_name} - Aborted', extra=fields)
+        except Exception as e:
+            logging.error(f'{file_name} - {str(e)}', extra={**fields, "error": e.__class__.__name__})
+            try:
+                await connection.send({"type": "failed", "job_id": job["id"], "error": e.__class__.__name__,
+                                       "message": str(e), "retryable": isinstance(e, RETRYABLE_ERRORS),
+                                       "flood_wait": e.value if isinstance(e, FloodWait) else None})
+            except ConnectionError:
+                pass
+        finally:
+            self._running.pop(job["id"], None)
+
+    async def close(self) -> None:
+        """
+        This function releases the resources of the node
+        """
+        await self._engine.close()
+        self._post_processor.close()
+
+
+async def main() -> None:
+    """
+    Entrypoint of the worker node
+    """
+    args = get_args()
+    config: ConfigFile = get_config()
+    address: str = args.connect or config.TG_COORDINATOR_ADDRESS
+    if not address:
+        logging.error("The coordinator address is missing, set TG_COORDINATOR_ADDRESS or use --connect")
+        exit(-1)
+    slots: int = args.slots or config.TG_MAX_PARALLEL
+    client = Client(f'{config.TG_SESSION}_node_{args.name}', config.TG_API_ID, config.TG_API_HASH,
+                    bot_token=config.TG_BOT_TOKEN, parse_mode=ParseMode.DEFAULT, no_updates=True,
+                    max_concurrent_transmissions=slots)
+    node = WorkerNode(client, config)
+    delay: float = RECONNECT_DELAY
+    async with client:
+        try:
+            while True:
+                try:
+                    connection: NodeConnection = await open_connection(address)
+                except OSError as e:
+                    logging.warning(f'Unable to reach the coordinator at {address}, retrying in {delay:.0f} seconds. '
+                                    f'Error:\n {e}')
+                    await asyncio.sleep(delay)
+                    delay = min(MAX_RECONNECT_DELAY, delay * 2)
+                    continue
+                try:
+                    await connection.send({"type": "hello", "token": args.token or config.TG_COORDINATOR_TOKEN,
+                                           "name": args.name, "slots": slots})
+                    answer: dict | None = await connection.receive()
+                    if not answer or answer.get("type") != "welcome":
+                        logging.error(f'Rejected by the coordinator: {(answer or {}).get("message", "no answer")}')
+                        exit(-1)
+                    logging.info(f'Connected to the coordinator at {address} as {args.name} with {slots} slots')
+                    delay = RECONNECT_DELAY
+                    await node.serve(connection)
+                    logging.warning(f'Disconnected from the coordinator, reconnecting in {delay:.0f} seconds')
+                except (ConnectionError, ValueError) as e:
+                    logging.warning(f'Connection to the coordinator lost, reconnecting in {delay:.0f} seconds. '
+                                    f'Error:\n {e}')
+                finally:
+                    connection.close()
+                await asyncio.sleep(delay)
+        finally:
+            await node.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())